@@ -1,11 +1,10 @@
 import streamlit as st
 import pandas as pd
-import psycopg2
-import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import pytz
 from backend.services.token_service import validar_token
+from backend.services.db_init import conectar_bd
 import altair as alt
 
 load_dotenv()
@@ -40,13 +39,7 @@ elif minutos_restantes <= 5:
 else:
     st.info(f"🔐 Link válido até às {expira_formatado} (horário de Brasília).")
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-conn = psycopg2.connect(DATABASE_URL)
-query = f"SELECT descricao, valor, categoria, meio_pagamento, data, tipo FROM {schema}.gastos ORDER BY data DESC"
-df = pd.read_sql(query, conn)
-df["data"] = pd.to_datetime(df["data"])
-df.set_index("data", inplace=True)
-
+conn = conectar_bd()
 cur = conn.cursor()
 cur.execute(f"SELECT valor FROM {schema}.salario ORDER BY data DESC LIMIT 1")
 salario = cur.fetchone()
@@ -56,12 +49,38 @@ cur.execute(f"SELECT valor FROM {schema}.limite_cartao ORDER BY data DESC LIMIT
 limite = cur.fetchone()
 limite = limite[0] if limite else 0
 
-cur.execute(f"SELECT SUM(valor) FROM {schema}.gastos WHERE meio_pagamento = 'crédito' AND data >= date_trunc('month', CURRENT_DATE)")
-fatura = cur.fetchone()
-fatura = fatura[0] if fatura and fatura[0] else 0
+cur.execute(f"""
+    SELECT COALESCE(SUM(total_gastos), 0) FROM {schema}.resumo_mensal
+    WHERE meio_pagamento = 'crédito' AND mes = date_trunc('month', CURRENT_DATE)::date
+""")
+fatura = float(cur.fetchone()[0])
 
 cur.close()
 
+# Agregações por mês, categoria e meio de pagamento vêm prontas do resumo mensal
+df_resumo = pd.read_sql(
+    f"SELECT mes, categoria, meio_pagamento, total_gastos AS valor FROM {schema}.resumo_mensal WHERE qtd_gastos > 0",
+    conn
+)
+df_resumo["mes"] = pd.to_datetime(df_resumo["mes"])
+df_resumo["valor"] = df_resumo["valor"].astype(float)
+
+# Só os lançamentos do mês escolhido saem da tabela de gastos; os totais vêm do resumo
+mes_atual = pd.Timestamp(agora.year, agora.month, 1)
+meses = sorted(set(df_resumo["mes"]) | {mes_atual}, reverse=True)
+mes_escolhido = st.selectbox("📅 Mês", meses, format_func=lambda mes: mes.strftime("%m/%Y"))
+df = pd.read_sql(
+    f"""
+    SELECT descricao, valor, categoria, meio_pagamento, data, tipo FROM {schema}.gastos
+    WHERE data >= %s AND data < %s ORDER BY data DESC
+    """,
+    conn,
+    params=(mes_escolhido.date(), (mes_escolhido + pd.DateOffset(months=1)).date()),
+)
+df["data"] = pd.to_datetime(df["data"])
+df["valor"] = df["valor"].astype(float)
+df.set_index("data", inplace=True)
+
 st.markdown("### 📌 Visão Geral Financeira")
 k1, k2, k3 = st.columns(3)
 k1.metric("💵 Salário Atual", f"R$ {salario:,.2f}".replace(",", ".").replace(".", ",", 1))
@@ -71,17 +90,17 @@ k3.metric("📈 Limite do Cartão", f"R$ {limite:,.2f}".replace(",", ".").replac
 abas = st.tabs(["📋 Visão Geral", "📂 Categorias", "💳 Pagamentos", "📅 Resumos", "🏆 Top Categorias", "🔮 Previsões", "🔔 Alertas", "📆 Calendário", "📊 Mês a Mês"])
 
 with abas[0]:
-    st.subheader("💰 Últimos Gastos Registrados")
+    st.subheader(f"💰 Gastos de {mes_escolhido.strftime('%m/%Y')}")
     st.dataframe(df.reset_index())
 
 with abas[1]:
     st.subheader("📈 Gastos por Categoria")
-    chart_data_cat = df.groupby("categoria")["valor"].sum().reset_index()
+    chart_data_cat = df_resumo.groupby("categoria")["valor"].sum().reset_index()
     st.bar_chart(chart_data_cat, x="categoria", y="valor")
 
 with abas[2]:
     st.subheader("💳 Gastos por Meio de Pagamento")
-    df_pagamento = df.groupby("meio_pagamento")["valor"].sum().reset_index()
+    df_pagamento = df_resumo.groupby("meio_pagamento")["valor"].sum().reset_index()
     tipo_grafico = st.radio("Tipo de Gráfico", ["Barras", "Pizza"], horizontal=True)
     if tipo_grafico == "Barras":
         st.bar_chart(df_pagamento.set_index("meio_pagamento"))
@@ -98,19 +117,18 @@ with abas[3]:
     col1, col2 = st.columns(2)
 
     with col1:
-        st.markdown("### Gastos por Dia da Semana")
+        st.markdown(f"### Gastos por Dia da Semana ({mes_escolhido.strftime('%m/%Y')})")
         df["dia_semana"] = df.index.day_name(locale="pt_BR")
         st.bar_chart(df.groupby("dia_semana")["valor"].sum())
 
     with col2:
         st.markdown("### Tendência Mensal (Cash Flow)")
-        df_mensal = df.resample("M")["valor"].sum()
+        df_mensal = df_resumo.groupby("mes")["valor"].sum()
         st.line_chart(df_mensal)
 
 with abas[4]:
-    st.subheader("🏆 Top Categorias do Mês")
-    hoje = datetime.now().replace(day=1)
-    df_mes = df[df.index >= hoje]
+    st.subheader(f"🏆 Top Categorias de {mes_escolhido.strftime('%m/%Y')}")
+    df_mes = df_resumo[df_resumo["mes"] == mes_escolhido]
     top_categorias = df_mes.groupby("categoria")["valor"].sum().nlargest(3).reset_index()
     st.write(top_categorias)
 
@@ -133,12 +151,13 @@ with abas[7]:
 
 with abas[8]:
     st.subheader("📊 Comparação Mês a Mês")
-    df_mes_a_mes = df.resample('M')['valor'].sum().reset_index()
-    st.bar_chart(df_mes_a_mes.set_index("data"))
+    df_mes_a_mes = df_resumo.groupby("mes")["valor"].sum()
+    st.bar_chart(df_mes_a_mes)
 
 # 📥 Download CSV
 df.reset_index().to_csv("gastos.csv", index=False)
 with open("gastos.csv", "rb") as f:
-    st.download_button(label="📥 Baixar CSV", data=f, file_name="gastos.csv", mime="text/csv")
+    st.download_button(label="📥 Baixar CSV do mês", data=f,
+                       file_name=f"gastos_{mes_escolhido.strftime('%Y_%m')}.csv", mime="text/csv")
 
 conn.close()
\ No newline at end of file
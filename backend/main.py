@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from fastapi import FastAPI, Request, Form
 import os
@@ -10,35 +11,35 @@ from fastapi.responses import PlainTextResponse, JSONResponse
 import time
 from datetime import datetime
 import re
-import fasttext
 
-from backend.utils import (
-    mensagem_ja_processada, registrar_mensagem_recebida, obter_schema_por_telefone, salvar_localizacao_usuario, obter_ultima_localizacao
-)
 from backend.services.scheduler import scheduler, agendar_lembrete_cron
 from backend.services.whatsapp_service import enviar_mensagem_whatsapp, obter_url_midia, baixar_midia, enviar_imagem_whatsapp
-from backend.services.db_init import inicializar_bd
+from backend.services.db_init import inicializar_bd, pool_conexoes
 from backend.services.api_service import (
     obter_cotacao_principais, obter_cotacao, buscar_cep, listar_moedas_disponiveis, listar_conversoes_disponiveis, listar_conversoes_disponiveis_moeda, MOEDAS, CONVERSOES, MOEDA_EMOJIS
 )
-from backend.services.gastos_service import (
-    salvar_gasto, salvar_fatura, calcular_total_gasto, pagar_fatura, registrar_salario, listar_lembretes, apagar_lembrete
-)
-from backend.services.autorizacao_service import verificar_autorizacao, liberar_usuario
-from backend.services.usuarios_service import listar_usuarios_autorizados, revogar_autorizacao
-from backend.services.token_service import gerar_token_acesso
 from backend.services.noticias_service import obter_boletim_the_news
 from backend.services.leitura_service import (
     try_all_techniques, processar_qrcode_com_ocr, processar_codigodebarras_com_pdfplumber, gerar_descricao_para_classificacao, formatar_qrcode_para_whatsapp, formatar_codigodebarras_para_whatsapp, gerar_imagem_tabela
 )
-from backend.services.email_service import (
-    buscar_credenciais_email,
-    salvar_credenciais_email,
-    formatar_emails_para_whatsapp,
-    get_emails_info, 
-    listar_emails_cadastrados
-)
+from backend.services.email_service import formatar_emails_para_whatsapp, get_emails_info
+from backend.services import bd_async as bd
+from backend.services.autorizacao_service import status_cache_usuarios
+from backend.utils import ids_recentes
 from backend.services.maps_service import calcular_rota
+from backend.services.fila_service import FilaProcessamento, FilaCheiaError, WEBHOOK_MODO
+from backend.services.despacho_service import DespachantePorTelefone
+from backend.services.roteador_service import RoteadorComandos, ContextoMensagem, Regra
+from backend.services.categorizacao_service import (
+    preparar_classificador, iniciar_monitoramento_modelo, definir_categoria_versionada, reclassificar_schema,
+    cache_categorias, ativar_modelo, reverter_modelo, status_modelo, normalizar_descricao
+)
+from backend.services.categorias_aprendidas_service import status_categorias_aprendidas
+from backend.services.memoria_service import uso_memoria
+from backend.services.importacao_service import importar_extrato, EXTENSOES_EXTRATO
+from backend.services.decodificacao_service import encerrar_pool as encerrar_pool_decodificacao
+from backend.services.zxing_service import decodificador_zxing
+from backend.services.estatisticas_decodificacao_service import estatisticas_decodificacao
 
 # Configuração básica de logging
 LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")
@@ -66,8 +67,7 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 API_COTACAO = os.getenv("API_COTACAO")
 inicializar_bd(DATABASE_URL)
 
-caminho_modelo = os.path.join("backend", "models", "modelo_gastos_prod.bin")
-MODELO_FASTTEXT = fasttext.load_model(caminho_modelo)
+preparar_classificador()
 
 @app.get("/ping")
 def ping():
@@ -117,37 +117,167 @@ async def receber_mensagem(request: Request):
         return JSONResponse(content={"status": "erro", "mensagem": "Payload inválido."}, status_code=400)
 
     try:
-        mensagens = dados["entry"][0]["changes"][0]["value"].get("messages", [])
+        mensagens = extrair_mensagens(dados)
         if not mensagens:
             return JSONResponse(content={"status": "ignorado", "mensagem": "Nenhuma mensagem nova."}, status_code=200)
 
-        mensagem_obj = mensagens[0]
-        telefone = mensagem_obj["from"]
-        mensagem_id = mensagem_obj["id"]
-        
-        # Proteção e roteamento por tipo de mídia
-        tipo_msg = mensagem_obj.get("type")
-        
-        # O timestamp está sempre no objeto principal, independente do tipo de mensagem
-        timestamp_whatsapp = int(mensagem_obj["timestamp"])
-
-        if mensagem_ja_processada(mensagem_id):
-            logger.warning("⚠️ Mensagem já processada anteriormente: %s", mensagem_id)
+        usar_fila = WEBHOOK_MODO == "fila" and fila_mensagens.ativa
+        if usar_fila and fila_mensagens.cheia() and fila_mensagens.backpressure == "rejeitar":
+            # Recusa antes de registrar as mensagens, assim a Meta reenvia e elas não são descartadas como duplicadas
+            logger.warning("🚧 Fila cheia (%d), recusando %d mensagem(ns)", fila_mensagens.profundidade(), len(mensagens))
+            return JSONResponse(content={"status": "ocupado", "mensagem": "Fila cheia, tente novamente."}, status_code=503)
+
+        novas = await bd.registrar_mensagens_novas(mensagens)
+        duplicadas = len(mensagens) - len(novas)
+        if duplicadas:
+            logger.warning("⚠️ %d mensagem(ns) já processada(s) anteriormente ignorada(s)", duplicadas)
+        if not novas:
             return JSONResponse(content={
                 "status": "ignorado",
                 "mensagem": "Mensagem duplicada ignorada."
             }, status_code=200)
 
-        # Registra a mensagem recebida no banco
-        registrar_mensagem_recebida(mensagem_id, telefone, tipo_msg)
+        inline = novas
+        if usar_fila:
+            inline = []
+            recusadas = []
+            for mensagem_obj in novas:
+                try:
+                    await fila_mensagens.enfileirar({"mensagem_obj": mensagem_obj, "inicio": inicio})
+                except FilaCheiaError as e:
+                    if fila_mensagens.backpressure == "inline":
+                        logger.warning("🚧 Fila cheia, processando mensagem %s na própria requisição", mensagem_obj["id"])
+                        inline.append(mensagem_obj)
+                    else:
+                        logger.warning("🚧 %s, mensagem %s não aceita", e, mensagem_obj["id"])
+                        recusadas.append(mensagem_obj)
+
+            if recusadas:
+                # Remove o registro para que o reenvio da Meta não seja tratado como duplicado
+                await bd.esquecer_mensagem_recebida(*recusadas)
+                return JSONResponse(content={
+                    "status": "ocupado",
+                    "mensagem": "Fila cheia, tente novamente.",
+                    "enfileiradas": len(novas) - len(recusadas) - len(inline),
+                    "recusadas": len(recusadas)
+                }, status_code=503)
+            if not inline:
+                return JSONResponse(content={
+                    "status": "enfileirado",
+                    "mensagens": len(novas),
+                    "profundidade_fila": fila_mensagens.profundidade()
+                }, status_code=200)
+    except Exception as e:
+        logger.exception("❌ Erro ao processar webhook:")
+        return JSONResponse(content={"status": "erro", "mensagem": str(e)}, status_code=500)
+
+    # Submete todas antes de aguardar: a ordem de submissão é a ordem de execução por telefone
+    futuros = [despachar_mensagem(mensagem_obj, inicio) for mensagem_obj in inline]
+    resultados = await asyncio.gather(*futuros, return_exceptions=True)
+    if len(mensagens) == 1:
+        resultado = resultados[0]
+        if isinstance(resultado, Exception):
+            logger.error("❌ Erro ao processar mensagem: %s", resultado)
+            return JSONResponse(content={"status": "erro", "mensagem": str(resultado)}, status_code=500)
+        return resultado
+
+    return {
+        "status": "OK",
+        "mensagens": len(mensagens),
+        "duplicadas": duplicadas,
+        "resultados": [conteudo_resposta(resultado) for resultado in resultados]
+    }
+
+def extrair_mensagens(dados: dict) -> list:
+    """Todas as mensagens do payload, percorrendo cada entry e cada change (a Meta pode agrupar várias)."""
+    mensagens = []
+    for entry in dados.get("entry", []):
+        for change in entry.get("changes", []):
+            mensagens.extend(change.get("value", {}).get("messages", []))
+    return mensagens
+
+def conteudo_resposta(resultado):
+    if isinstance(resultado, Exception):
+        return {"status": "erro", "mensagem": str(resultado)}
+    if isinstance(resultado, JSONResponse):
+        return json.loads(resultado.body)
+    return resultado
+
+def despachar_mensagem(mensagem_obj: dict, inicio: float) -> asyncio.Future:
+    """
+    Coloca a mensagem na faixa do telefone: mensagens do mesmo usuário mantêm a ordem
+    de chegada e usuários diferentes rodam em paralelo.
+    """
+    return despachante.submeter(
+        mensagem_obj["from"], lambda: processar_mensagem_recebida(mensagem_obj, inicio)
+    )
+
+async def processar_job_fila(job: dict):
+    # O worker só repassa para a faixa do telefone: quem limita a concorrência é o
+    # despachante, e o worker só espera quando ele já tem DESPACHO_MAX_PENDENTES mensagens
+    mensagem_obj, inicio = job["mensagem_obj"], job["inicio"]
+    await despachante.entregar(mensagem_obj["from"], lambda: processar_mensagem_recebida(mensagem_obj, inicio))
+
+despachante = DespachantePorTelefone()
+fila_mensagens = FilaProcessamento(processar_job_fila)
+
+@app.on_event("startup")
+async def iniciar_fila():
+    if WEBHOOK_MODO == "fila":
+        await fila_mensagens.iniciar()
+    # Segue trocas de versão do modelo feitas por outro worker ou pela linha de comando
+    iniciar_monitoramento_modelo()
+
+@app.on_event("shutdown")
+async def encerrar_fila():
+    if fila_mensagens.ativa:
+        await fila_mensagens.parar()
+    await despachante.parar()
+    bd.encerrar()
+    encerrar_pool_decodificacao()
+    decodificador_zxing.encerrar()
+
+@app.get("/metricas")
+def metricas():
+    return {
+        "fila": fila_mensagens.status(),
+        "despacho": despachante.status(),
+        "comandos": ROTEADOR.status(),
+        "pool": pool_conexoes.status(),
+        "cache_usuarios": status_cache_usuarios(),
+        "dedupe": ids_recentes.status(),
+        "cache_categorias": cache_categorias.status(),
+        "categorias_aprendidas": status_categorias_aprendidas(),
+        "zxing": decodificador_zxing.status(),
+        "modelo": status_modelo(),
+        "memoria": {"pid": os.getpid(), **uso_memoria()},
+    }
+
+@app.get("/decodificacao/estatisticas")
+def decodificacao_estatisticas():
+    """Quais decodificadores, ângulos, limiares e morfologias leram as notas enviadas."""
+    return estatisticas_decodificacao()
+
+async def processar_mensagem_recebida(mensagem_obj: dict, inicio: float):
+    """
+    Executa o comando de uma mensagem já validada e deduplicada.
+    Chamada direto pelo webhook no modo inline ou pelos workers da fila.
+    """
+    try:
+        telefone = mensagem_obj["from"]
+        tipo_msg = mensagem_obj.get("type")
+
+        # O timestamp está sempre no objeto principal, independente do tipo de mensagem
+        timestamp_whatsapp = int(mensagem_obj["timestamp"])
 
         if tipo_msg == "text":
             mensagem = mensagem_obj["text"]["body"].strip()
-            mensagem_lower = mensagem.lower()
 
             logger.info("📩 Mensagem recebida: '%s' de %s", mensagem, telefone)
 
-            if not verificar_autorizacao(telefone):
+            # Autorização e schema vêm juntos do cache de usuários (uma consulta no máximo)
+            autorizado, schema = await bd.obter_usuario(telefone)
+            if not autorizado:
                 logger.warning("🔒 Número não autorizado: %s", telefone)
 
                 # Envia notificação ao ADMIN
@@ -161,488 +291,23 @@ async def receber_mensagem(request: Request):
 
                 return JSONResponse(content={"status": "bloqueado", "mensagem": "Número não autorizado"}, status_code=200)
 
-            # 🔍 Obtém o schema associado ao telefone
-            schema = obter_schema_por_telefone(telefone)
             if not schema:
                 logger.error(f"⚠️ Usuário {telefone} sem schema autorizado.")
                 return JSONResponse(content={"status": "erro", "mensagem": "Usuário não possui schema vinculado."}, status_code=403)
 
-            partes = mensagem.split()
-            if mensagem_lower in ["ajuda", "menu", "comandos"]:
-                await exibir_menu_ajuda(telefone)
-                return {"status": "OK", "resposta": "Menu de ajuda enviado"}
-
-            elif mensagem_lower == "total gasto":
-                total = calcular_total_gasto(schema)
-                resposta = f"📊 Total gasto no mês: R$ {format(total, ',.2f').replace(',', '.')}"
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                log_tempos(inicio, timestamp_whatsapp, logger, mensagem, telefone)
-                return {"status": "OK", "resposta": resposta}
-
-            elif mensagem_lower == "fatura paga!":
-                pagar_fatura(schema)
-                resposta = "✅ Todas as compras parceladas deste mês foram adicionadas ao total de gastos!"
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                log_tempos(inicio, timestamp_whatsapp, logger, mensagem, telefone)
-                return {"status": "OK", "resposta": resposta}
-
-            elif mensagem_lower.startswith("salario "):
-                resposta = registrar_salario(mensagem, schema)
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                log_tempos(inicio, timestamp_whatsapp, logger, mensagem, telefone)
-                return {"status": "OK", "resposta": resposta}
-            
-            elif mensagem_lower == "gráficos":
-                token_info = gerar_token_acesso(telefone)
-                token = token_info["token"]
-                expira_em = token_info["expira_em"]
-
-                print("👀 DEBUG Telefone:", telefone)
-                print("👀 DEBUG Token:", token)
-
-                resposta = (
-                    "📊 Aqui está o seu link com os gráficos financeiros!\n\n"
-                    f"🔗 https://dashboard-financas.up.railway.app/?phone={telefone}&token={token}\n"
-                    f"⚠️ O link é válido até às {expira_em.strftime('%H:%M')} por segurança."
-                )
+            ctx = ContextoMensagem(telefone, mensagem, schema, inicio, timestamp_whatsapp)
+            regra = ROTEADOR.resolver(ctx)
+            if regra is not None and regra.sensivel:
+                # O cache pode estar até CACHE_USUARIOS_TTL atrás de um "revogar" feito em outro worker
+                autorizado, ctx.schema = await bd.obter_usuario(telefone, usar_cache=False)
+                if not autorizado:
+                    logger.warning("🔒 Autorização de %s revogada, comando %s recusado", telefone, regra.nome)
+                    await enviar_mensagem_whatsapp(telefone, "🚫 Seu acesso ao assistente financeiro foi revogado.")
+                    return JSONResponse(content={"status": "bloqueado", "mensagem": "Número não autorizado"}, status_code=200)
+            return await ROTEADOR.despachar(ctx, regra)
 
-                print("🔗 Link final gerado:", resposta)
-                
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-
-            elif mensagem_lower.startswith("cep "):
-                partes = mensagem.split()
-                if len(partes) == 2 and partes[1].isdigit():
-                    cep = partes[1]
-                    resposta = buscar_cep(cep)
-                else:
-                    resposta = "❌ Formato inválido. Use: `cep 05424020` (apenas números)."
-
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-
-            elif mensagem_lower == "cotação":
-                resposta = obter_cotacao_principais(API_COTACAO, MOEDA_EMOJIS)
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                log_tempos(inicio, timestamp_whatsapp, logger, mensagem, telefone)
-                return {"status": "OK", "resposta": resposta}
-            
-            elif mensagem_lower.startswith("cotação") and len(partes) == 2:
-                moeda_origem = partes[1].upper()
-                resposta = obter_cotacao(API_COTACAO, MOEDAS, CONVERSOES, moeda_origem)
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                log_tempos(inicio, timestamp_whatsapp, logger, mensagem, telefone)
-                return {"status": "OK", "resposta": resposta}
-            
-            elif mensagem_lower.startswith("cotação") and ("-" in mensagem_lower or len(partes) > 2):
-                moeda_origem = partes[1].upper()
-                moeda_destino = partes[3].upper()
-                resposta = obter_cotacao(API_COTACAO, MOEDAS, CONVERSOES, moeda_origem, moeda_destino)
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                log_tempos(inicio, timestamp_whatsapp, logger, mensagem, telefone)
-                return {"status": "OK", "resposta": resposta}
-            
-            elif mensagem_lower == "listar moedas":
-                resposta = listar_moedas_disponiveis(MOEDAS)
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-
-            elif mensagem_lower == "listar conversoes":
-                resposta = listar_conversoes_disponiveis(CONVERSOES)
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-            elif mensagem_lower.startswith("conversoes "):
-                partes = mensagem.split()
-                if len(partes) == 2:
-                    moeda = partes[1].upper()
-                    if moeda in CONVERSOES:
-                        resposta = listar_conversoes_disponiveis_moeda(CONVERSOES, moeda)
-                    else:
-                        resposta = f"⚠️ Moeda '{moeda}' não encontrada ou não tem conversões disponíveis."
-                else:
-                    resposta = "❌ Formato inválido. Use: conversoes [moeda]"
-
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-
-
-            elif mensagem_lower.startswith("lembrete:") and "cron:" in mensagem_lower:
-                resposta = processar_lembrete_formatado(mensagem, telefone)
-                if resposta:
-                    await enviar_mensagem_whatsapp(telefone, resposta)
-                    return {"status": "ok"}
-
-            elif mensagem_lower == "tabela cron":
-                tabela = (
-                    "⏰ Exemplos de expressões CRON:\n"
-                    "\n* * * * * → Executa a cada minuto\n"
-                    "0 9 * * * → Todos os dias às 09:00\n"
-                    "30 14 * * * → Todos os dias às 14:30\n"
-                    "0 8 * * 1-5 → Segunda a sexta às 08:00\n"
-                    "15 10 15 * * → Dia 15 de cada mês às 10:15\n"
-                    "0 0 1 1 * → 1º de janeiro à meia-noite\n"
-                    "0 18 * * 6 → Todos os sábados às 18:00\n"
-                    "\nFormato: minuto hora dia_do_mes mês dia_da_semana"
-                )
-                await enviar_mensagem_whatsapp(telefone, tabela)
-                return {"status": "ok"}
-            elif mensagem_lower == "lista lembretes":
-                lembretes = listar_lembretes(telefone, schema)
-                if not lembretes:
-                    resposta = "📭 Você ainda não possui lembretes cadastrados."
-                else:
-                    resposta = "📋 *Seus lembretes:*\n\n" + "\n".join(
-                        [f"🆔 {l['id']} - \"{l['mensagem']}\"\n⏰ CRON: `{l['cron']}`\n" for l in lembretes]
-                    )
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "ok"}
-            elif mensagem_lower.startswith("apagar lembrete"):
-                partes = mensagem_lower.split()
-                if len(partes) >= 3 and partes[2].isdigit():
-                    id_lembrete = int(partes[2])
-                    sucesso = apagar_lembrete(telefone, id_lembrete, schema)
-                    resposta = "🗑️ Lembrete apagado com sucesso!" if sucesso else "⚠️ Lembrete não encontrado ou não pertence a você."
-                else:
-                    resposta = "❌ Formato inválido. Use: apagar lembrete [ID]"
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "ok"}
-            elif mensagem_lower.startswith("liberar "):
-                partes = mensagem.split()
-                if len(partes) >= 3:
-                    numero_para_liberar = partes[1]
-                    nome_usuario = " ".join(partes[2:])
-                    if telefone == os.getenv("ADMIN_PHONE"):
-                        try:
-                            liberar_usuario(nome_usuario, numero_para_liberar)
-                            resposta = f"✅ Número {numero_para_liberar} ({nome_usuario}) autorizado com sucesso!"
-
-                            # ✅ Envia mensagem para o novo usuário liberado
-                            texto_bem_vindo = (
-                                f"🎉 Olá usuário!\n"
-                                f"Seu número foi autorizado e agora você pode usar o assistente financeiro via WhatsApp. "
-                                f"Digite 'ajuda' para ver os comandos disponíveis."
-                            )
-                            await enviar_mensagem_whatsapp(numero_para_liberar, texto_bem_vindo)
-
-                        except Exception as e:
-                            logger.error("❌ Erro ao liberar usuário: %s", str(e))
-                            resposta = f"❌ Erro ao autorizar o número: {e}"
-                    else:
-                        resposta = "⚠️ Apenas o administrador pode liberar novos usuários."
-                else:
-                    resposta = "❌ Formato inválido. Use: liberar [número] [nome]"
-
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-            elif mensagem_lower.startswith("não liberar "):
-                partes = mensagem.split()
-                if len(partes) >= 2:
-                    numero_negado = partes[2] if len(partes) >= 3 else partes[1]
-                    if telefone == os.getenv("ADMIN_PHONE"):
-                        # Mensagem para o admin (confirmação)
-                        resposta = f"🚫 Número {numero_negado} não foi autorizado."
-
-                        # Mensagem para o usuário negado
-                        texto_usuario = (
-                            "🚫 Seu número **não foi autorizado** a usar o assistente financeiro no momento. "
-                            "Em caso de dúvidas, entre em contato com o administrador."
-                        )
-                        await enviar_mensagem_whatsapp(numero_negado, texto_usuario)
-                    else:
-                        resposta = "⚠️ Apenas o administrador pode negar autorizações."
-                else:
-                    resposta = "❌ Formato inválido. Use: não liberar [número]"
-
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-            elif mensagem_lower == "lista usuarios":
-                if telefone != os.getenv("ADMIN_PHONE"):
-                    await enviar_mensagem_whatsapp(telefone, "⚠️ Apenas o administrador pode acessar essa lista.")
-                    return {"status": "acesso negado"}
-
-                usuarios = listar_usuarios_autorizados()
-                if not usuarios:
-                    resposta = "📭 Nenhum número autorizado encontrado."
-                else:
-                    resposta = "✅ *Usuários autorizados:*\n\n" + "\n".join(
-                        [f"👤 {nome or '(sem nome)'} - {tel}" for nome, tel, _ in usuarios]
-                    )
-
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": "lista enviada"}
-            
-            elif mensagem_lower.startswith("revogar "):
-                numero_para_revogar = mensagem.split(" ")[1]
-                if telefone == os.getenv("ADMIN_PHONE"):
-                    sucesso = revogar_autorizacao(numero_para_revogar)
-                    if sucesso:
-                        resposta = f"🚫 Número {numero_para_revogar} teve a autorização revogada com sucesso!"
-                    else:
-                        resposta = "⚠️ Número não encontrado ou já está desautorizado."
-                else:
-                    resposta = "⚠️ Apenas o administrador pode revogar autorizações."
-
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-            
-            elif mensagem_lower in ["notícias", "boletim", "the news"]:
-                await enviar_mensagem_whatsapp(telefone, "📰 Um instante... buscando o boletim mais recente.")
-                mensagens = obter_boletim_the_news()
-                if not mensagens:
-                    await enviar_mensagem_whatsapp(telefone, "❌ Não foi possível carregar o boletim de hoje.")
-                    return {"status": "Erro", "resposta": "Falha ao capturar o boletim."}
-                for bloco in mensagens:
-                    await enviar_mensagem_whatsapp(telefone, bloco)
-                return {"status": "OK", "resposta": "Boletim enviado com sucesso"}
-
-            elif "resumo dos emails" in mensagem_lower or "resumo de emails" in mensagem_lower or re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}(\s+\d{2}-\d{2}-\d{4})?$', mensagem.strip()):
-    # Processa os parametros: email específico e data (ambos opcionais)
-                email_especifico = None
-                data_consulta = None
-                
-                # Verifica se há um email direto como comando
-                email_direto = re.match(r'^([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\s+(\d{2}-\d{2}-\d{4}))?$', mensagem.strip())
-                if email_direto:
-                    email_especifico = email_direto.group(1)
-                    data_consulta = email_direto.group(3) if email_direto.group(3) else None
-                else:
-                    # Busca email e data na instrução "resumo de emails"
-                    padrao_completo = re.search(r'resumo d[eo]s? emails\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\s+(\d{2}-\d{2}-\d{4}))?', mensagem_lower)
-                    if padrao_completo:
-                        email_especifico = padrao_completo.group(1)
-                        data_consulta = padrao_completo.group(3) if padrao_completo.group(3) else None
-                    else:
-                        # Verifica se tem apenas a data, sem email específico
-                        padrao_apenas_data = re.search(r'resumo d[eo]s? emails\s+(\d{2}-\d{2}-\d{4})', mensagem_lower)
-                        if padrao_apenas_data:
-                            data_consulta = padrao_apenas_data.group(1)
-                
-                # Debug - Anotar nos logs o que foi detectado
-                logger.info(f"Comando processado - Email: {email_especifico}, Data: {data_consulta}")
-                
-                # Valida o formato da data, se fornecida
-                if data_consulta:
-                    try:
-                        datetime.strptime(data_consulta, "%d-%m-%Y")
-                    except ValueError:
-                        resposta = "❌ Formato de data inválido. Use o formato DD-MM-AAAA, por exemplo: 14-04-2025"
-                        await enviar_mensagem_whatsapp(telefone, resposta)
-                        return {"status": "erro", "resposta": resposta}
-                
-                # Busca os emails cadastrados
-                emails_cadastrados = listar_emails_cadastrados(telefone)
-                
-                # Se não tiver emails cadastrados
-                if not emails_cadastrados:
-                    resposta = (
-                        "📩 Para acessar seus e-mails, preciso das credenciais do Gmail.\n\n"
-                        "Por favor, envie no seguinte formato:\n\n"
-                        "email: seu_email@gmail.com\n"
-                        "senha: sua_senha_de_app\n"
-                        "descricao: Email Pessoal (opcional)"
-                    )
-                    await enviar_mensagem_whatsapp(telefone, resposta)
-                    return {"status": "OK", "resposta": resposta}
-                
-                # Se tem email específico solicitado
-                if email_especifico:
-                    # Verifica se esse email existe nos cadastrados
-                    email_encontrado = False
-                    for email_user, _ in emails_cadastrados:
-                        if email_user.lower() == email_especifico.lower():
-                            email_encontrado = True
-                            email_especifico = email_user  # Usar a versão exata cadastrada (preservando maiúsculas/minúsculas)
-                            break
-                    
-                    if not email_encontrado:
-                        resposta = (
-                            f"❌ O email {email_especifico} não está cadastrado.\n\n"
-                            "Emails cadastrados:\n"
-                        )
-                        for email_user, descricao in emails_cadastrados:
-                            resposta += f"• {email_user} - {descricao}\n"
-                        
-                        await enviar_mensagem_whatsapp(telefone, resposta)
-                        return {"status": "OK", "resposta": resposta}
-                    
-                    # Busca email específico
-                    email_user, email_pass = buscar_credenciais_email(telefone, email_especifico)
-                    if not email_user or not email_pass:
-                        resposta = f"❌ Não foi possível encontrar credenciais válidas para {email_especifico}."
-                        await enviar_mensagem_whatsapp(telefone, resposta)
-                        return {"status": "erro", "resposta": resposta}
-                        
-                    # Prepara a mensagem de confirmação
-                    if data_consulta:
-                        try:
-                            data_obj = datetime.strptime(data_consulta, "%d-%m-%Y")
-                            data_formatada = data_obj.strftime("%d/%m/%Y")
-                            mensagem_busca = f"🔍 Buscando emails de {data_formatada} em {email_user}..."
-                        except:
-                            mensagem_busca = f"🔍 Buscando emails em {email_user}..."
-                    else:
-                        mensagem_busca = f"🔍 Buscando emails de hoje em {email_user}..."
-                    
-                    await enviar_mensagem_whatsapp(telefone, mensagem_busca)
-                    
-                    # Busca emails - Passa explicitamente a data_consulta
-                    emails = get_emails_info(email_user, email_pass, data_consulta)
-                    
-                    # Debug
-                    logger.info(f"Emails encontrados: {len(emails)} para data {data_consulta}")
-                    
-                    resposta = formatar_emails_para_whatsapp(emails, email_user, data_consulta)
-                
-                # Se tem múltiplos emails cadastrados e nenhum especificado
-                elif len(emails_cadastrados) > 1:
-                    # Se tiver data mas não email específico, pede para escolher o email
-                    if data_consulta:
-                        data_formatada = datetime.strptime(data_consulta, "%d-%m-%Y").strftime("%d/%m/%Y")
-                        resposta = f"📩 Você tem vários emails cadastrados. Para qual deseja ver emails de {data_formatada}?\n\n"
-                        for email_user, descricao in emails_cadastrados:
-                            resposta += f"• {email_user} - {descricao}\n"
-                        resposta += f"\nEnvie 'resumo de emails SEUEMAIL@gmail.com {data_consulta}' ou apenas 'SEUEMAIL@gmail.com {data_consulta}'"
-                    else:
-                        resposta = "📩 Você tem vários emails cadastrados. Qual deseja consultar?\n\n"
-                        for email_user, descricao in emails_cadastrados:
-                            resposta += f"• {email_user} - {descricao}\n"
-                        resposta += "\nEnvie 'resumo de emails SEUEMAIL@gmail.com' ou apenas 'SEUEMAIL@gmail.com'"
-                        resposta += "\nVocê também pode especificar uma data: 'resumo de emails SEUEMAIL@gmail.com DD-MM-AAAA'"
-                
-                # Se tem apenas um email cadastrado
-                else:
-                    email_user, email_pass = buscar_credenciais_email(telefone)
-                    
-                    # Prepara mensagem de confirmação
-                    if data_consulta:
-                        try:
-                            data_obj = datetime.strptime(data_consulta, "%d-%m-%Y")
-                            data_formatada = data_obj.strftime("%d/%m/%Y")
-                            mensagem_busca = f"🔍 Buscando emails de {data_formatada} em {email_user}..."
-                        except:
-                            mensagem_busca = f"🔍 Buscando emails em {email_user}..."
-                    else:
-                        mensagem_busca = f"🔍 Buscando emails de hoje em {email_user}..."
-                    
-                    await enviar_mensagem_whatsapp(telefone, mensagem_busca)
-                    
-                    # Busca emails - Passa explicitamente a data_consulta
-                    emails = get_emails_info(email_user, email_pass, data_consulta)
-                    
-                    # Debug
-                    logger.info(f"Emails encontrados: {len(emails)} para data {data_consulta}")
-                    
-                    resposta = formatar_emails_para_whatsapp(emails, email_user, data_consulta)
-                
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-
-            elif mensagem.lower().startswith("email:"):
-                linhas = mensagem.strip().splitlines()
-                if len(linhas) >= 2 and "senha:" in linhas[1].lower():
-                    email_user = linhas[0].split(":", 1)[1].strip()
-                    email_pass = linhas[1].split(":", 1)[1].strip()
-                    
-                    # Verifica se tem descrição personalizada
-                    descricao = None
-                    if len(linhas) >= 3 and "descricao:" in linhas[2].lower():
-                        descricao = linhas[2].split(":", 1)[1].strip()
-                    
-                    # Valida o formato do email
-                    if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email_user):
-                        await enviar_mensagem_whatsapp(
-                            telefone,
-                            "❌ Formato de email inválido. Certifique-se de que seu email está correto."
-                        )
-                        return {"status": "erro", "mensagem": "Formato de email inválido"}
-                    
-                    # Salva (ou atualiza) o email
-                    salvar_credenciais_email(telefone, email_user, email_pass, descricao)
-                    await enviar_mensagem_whatsapp(
-                        telefone,
-                        f"✅ Credenciais de e-mail salvas com sucesso! ({email_user})\n\n"
-                        f"Para consultar, envie:\n"
-                        f"• 'resumo dos emails' (lista todos os emails)\n"
-                        f"• 'resumo dos emails {email_user}' (este email específico)\n"
-                        f"• ou simplesmente '{email_user}'"
-                    )
-                else:
-                    await enviar_mensagem_whatsapp(
-                        telefone,
-                        "❌ Formato inválido. Envie assim:\n"
-                        "email: seu_email@gmail.com\n"
-                        "senha: sua_senha_de_app\n"
-                        "descricao: Email pessoal (opcional)"
-                    )
-            elif (
-                any(char.isdigit() for char in mensagem)
-                and " " in mensagem
-                and "cep" not in mensagem_lower
-                and not (len(mensagem.split()) >= 2 and mensagem.split()[1].startswith("55"))
-            ):
-                descricao, valor, categoria, meio_pagamento, parcelas = processar_mensagem(mensagem)
-
-                logger.info(
-                    "✅ Gasto reconhecido: %s | Valor: %.2f | Categoria: %s | Meio de Pagamento: %s | Parcelas: %d",
-                    descricao, valor, categoria, meio_pagamento, parcelas
-                )
-
-                if meio_pagamento in ["pix", "débito"]:
-                    salvar_gasto(descricao, valor, categoria, meio_pagamento, schema, parcelas)
-                    resposta = f"✅ Gasto de R$ {format(valor, ',.2f').replace(',', '.')} em '{categoria}' registrado com sucesso!"
-                else:
-                    salvar_fatura(descricao, valor, categoria, meio_pagamento, parcelas, schema)
-                    resposta = f"✅ Compra parcelada registrada! {parcelas}x de R$ {valor/parcelas:.2f}"
-
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                log_tempos(inicio, timestamp_whatsapp, logger, mensagem, telefone)
-                return {"status": "OK", "resposta": resposta}
-            elif mensagem_lower.startswith("rota ") or mensagem_lower.startswith("caminho "):
-                endereco_destino = mensagem[5:] if mensagem_lower.startswith("rota ") else mensagem[8:]
-                
-                # Verifica se o usuário enviou a localização antes (você precisaria armazenar isso)
-                ultima_localizacao = obter_ultima_localizacao(telefone)
-                
-                if ultima_localizacao:
-                    resultado = calcular_rota(
-                        endereco_destino, 
-                        lat_origem=ultima_localizacao["latitude"], 
-                        lng_origem=ultima_localizacao["longitude"]
-                    )
-                    
-                    if "erro" in resultado:
-                        resposta = f"❌ {resultado['erro']}"
-                    else:
-                        resposta = (
-                            f"🧭 *Rota calculada*\n\n"
-                            f"📍 *Destino:* {resultado['destino']['endereco']}\n"
-                            f"🚗 *Distância:* {resultado['distancia_km']} km\n"
-                            f"⏱️ *Tempo estimado:* {resultado['duracao_min']} minutos\n\n"
-                            f"🔗 [Ver no mapa]({resultado['map_url']})"
-                        )
-                else:
-                    # Se não tiver a localização do usuário, apenas informa sobre o destino
-                    resultado = calcular_rota(endereco_destino)
-                    
-                    if "erro" in resultado:
-                        resposta = f"❌ {resultado['erro']}"
-                    else:
-                        resposta = (
-                            f"📍 *Destino encontrado*\n\n"
-                            f"*Endereço:* {resultado['destino']['endereco']}\n\n"
-                            "Para calcular a rota completa, compartilhe sua localização atual."
-                        )
-                
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "OK", "resposta": resposta}
-            else:
-                resposta = (
-                    "⚠️ Comando não reconhecido.\n"
-                    "Digite *ajuda* para ver a lista de comandos disponíveis."
-                )
-                await enviar_mensagem_whatsapp(telefone, resposta)
-                return {"status": "comando inválido", "resposta": resposta}
+        elif tipo_msg == "document" and mensagem_obj["document"].get("filename", "").lower().endswith(EXTENSOES_EXTRATO):
+            return await processar_extrato(mensagem_obj)
 
         elif tipo_msg == "image" or tipo_msg == "document":
             media_id = mensagem_obj[mensagem_obj["type"]]["id"]
@@ -659,7 +324,7 @@ async def receber_mensagem(request: Request):
             await baixar_midia(url_midia, caminho_arquivo)
 
             if mensagem_obj["type"] == "image":
-                resultado = try_all_techniques(caminho_arquivo, media_id)
+                resultado = await asyncio.to_thread(try_all_techniques, caminho_arquivo, media_id)
                 if not resultado:
                     await enviar_mensagem_whatsapp(telefone, "⚠️ Não consegui extrair nenhuma informação da imagem.")
                     return {"status": "erro", "mensagem": "Decodificação falhou"}
@@ -692,14 +357,14 @@ async def receber_mensagem(request: Request):
                 await enviar_mensagem_whatsapp(telefone, "🔍 Analisando documento... aguarde um momento.")
 
                 if "Portal da Nota Fiscal Eletrônica" in nome_arquivo.lower():
-                    dados = processar_codigodebarras_com_pdfplumber(caminho_arquivo)
+                    dados = await asyncio.to_thread(processar_codigodebarras_com_pdfplumber, caminho_arquivo)
                     tipo_doc = "nfe"
                 else:
-                    dados = processar_qrcode_com_ocr(caminho_arquivo)
+                    dados = await asyncio.to_thread(processar_qrcode_com_ocr, caminho_arquivo)
                     tipo_doc = "cupom"
                 
                 # Gerar imagem com o tipo explícito
-                caminho_imagem = gerar_imagem_tabela(dados, tipo_doc)
+                caminho_imagem = await asyncio.to_thread(gerar_imagem_tabela, dados, tipo_doc)
                 
                 if caminho_imagem:
                     # Enviar a imagem com legenda
@@ -731,7 +396,7 @@ async def receber_mensagem(request: Request):
             longitude = mensagem_obj["location"]["longitude"]
             
             # Salvar no banco de dados
-            salvar_localizacao_usuario(telefone, latitude, longitude)
+            await bd.salvar_localizacao_usuario(telefone, latitude, longitude)
             
             # Responder ao usuário
             resposta = (
@@ -747,13 +412,61 @@ async def receber_mensagem(request: Request):
             logger.warning(f"❌ Tipo de mensagem não suportado: {tipo_msg}")
             await enviar_mensagem_whatsapp(
                 telefone,
-                "⚠️ Tipo de mensagem não reconhecido. Envie texto, imagem com QR Code ou PDF com DANFE."
+                "⚠️ Tipo de mensagem não reconhecido. Envie texto, imagem com QR Code, PDF com DANFE ou extrato CSV/OFX."
             )
             return {"status": "ignorado", "mensagem": "Tipo de mídia não suportado"}
     except Exception as e:
-        logger.exception("❌ Erro ao processar webhook:")
+        logger.exception("❌ Erro ao processar mensagem:")
         return JSONResponse(content={"status": "erro", "mensagem": str(e)}, status_code=500)
 
+async def processar_extrato(mensagem_obj: dict):
+    """Importa um extrato CSV/OFX enviado como documento; a legenda "cartão" ou "conta" força o destino."""
+    telefone = mensagem_obj["from"]
+    documento = mensagem_obj["document"]
+    nome_arquivo = documento["filename"]
+
+    # Importação grava muitos lançamentos: confere no banco, sem o cache de usuários
+    autorizado, schema = await bd.obter_usuario(telefone, usar_cache=False)
+    if not autorizado or not schema:
+        await enviar_mensagem_whatsapp(telefone, "🚫 Seu número ainda não está autorizado a importar extratos.")
+        return {"status": "bloqueado", "mensagem": "Número não autorizado"}
+
+    legenda = documento.get("caption", "").lower()
+    destino = "fatura" if "cart" in legenda else "gastos" if "conta" in legenda else None
+
+    url_midia = await obter_url_midia(documento["id"])
+    if not url_midia:
+        await enviar_mensagem_whatsapp(telefone, "❌ Não consegui acessar o documento. Tente novamente.")
+        return {"status": "erro", "mensagem": "Não foi possível obter a URL do documento"}
+
+    caminho_arquivo = f"temp_{documento['id']}{os.path.splitext(nome_arquivo)[1].lower()}"
+    await enviar_mensagem_whatsapp(telefone, f"📥 Importando {nome_arquivo}... aguarde um momento.")
+    try:
+        await baixar_midia(url_midia, caminho_arquivo)
+        resultado = await asyncio.to_thread(importar_extrato, caminho_arquivo, schema, nome_arquivo, destino)
+    except Exception as e:
+        logger.exception("❌ Erro ao importar o extrato %s:", nome_arquivo)
+        resposta = f"❌ Não consegui importar {nome_arquivo}: {e}"
+    else:
+        if resultado["duplicado"]:
+            resposta = f"ℹ️ {nome_arquivo} já foi importado antes; nada foi gravado de novo."
+        else:
+            tabela = "fatura do cartão" if resultado["destino"] == "fatura" else "gastos"
+            resposta = (
+                f"✅ Extrato {nome_arquivo} importado em {tabela}!\n"
+                f"• lançamentos lidos: {resultado['lidas']}\n"
+                f"• despesas importadas: {resultado['importadas']}\n"
+                f"• créditos/estornos ignorados: {resultado['ignoradas']}\n"
+                f"• linhas inválidas: {resultado['invalidas']}\n"
+                f"⏱️ {resultado['segundos']:.1f}s ({resultado['linhas_por_segundo']} linhas/s)"
+            )
+    finally:
+        if os.path.exists(caminho_arquivo):
+            os.remove(caminho_arquivo)
+
+    await enviar_mensagem_whatsapp(telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
 def descrever_cron_humanamente(expr):
     minutos, hora, dia, mes, semana = expr.strip().split()
     partes = []
@@ -794,8 +507,7 @@ def descrever_cron_humanamente(expr):
 
 def processar_lembrete_formatado(mensagem: str, telefone: str):
 
-    padrao = r'lembrete:\s*"(.+?)"\s*cron:\s*([0-9*/,\- ]{5,})'
-    match = re.search(padrao, mensagem.lower())
+    match = RE_LEMBRETE.search(mensagem.lower())
     if match:
         lembrete_texto = match.group(1).strip()
         cron_expr = match.group(2).strip()
@@ -814,9 +526,10 @@ def log_tempos(inicio: float, timestamp_whatsapp: int, logger, mensagem: str, te
     logger.info("🕒 Timestamp do servidor: %s", horario_servidor)
     logger.info("⚡ Tempo total de resposta: %.2f segundos", fim - inicio)
 
-def processar_mensagem(mensagem: str):
+def processar_mensagem(mensagem: str, schema: str = None):
     """
-    Processa a mensagem e extrai descrição, valor, categoria, meio de pagamento e parcelas.
+    Processa a mensagem e extrai descrição, valor, categoria, meio de pagamento, parcelas
+    e a versão do modelo que definiu a categoria ("aprendida" quando o usuário a ensinou).
     """
     try:
         logger.info("📩 Mensagem original recebida: '%s'", mensagem)
@@ -847,106 +560,788 @@ def processar_mensagem(mensagem: str):
 
         if valor == 0.0:
             logger.warning("⚠️ Nenhum valor encontrado na mensagem!")
-            return "Erro", 0.0, "Desconhecido", "Desconhecido", 1
+            return "Erro", 0.0, "Desconhecido", "Desconhecido", 1, None
 
-        categoria, probabilidade = definir_categoria(descricao)
-        logger.info(f"📊 Categoria prevista: {categoria} ({probabilidade:.2%})")
-        return descricao.strip(), valor, categoria, meio_pagamento, parcelas
+        categoria, probabilidade, modelo_versao = definir_categoria_versionada(descricao, schema)
+        logger.info(f"📊 Categoria prevista: {categoria} ({probabilidade:.2%}, modelo {modelo_versao})")
+        return descricao.strip(), valor, categoria, meio_pagamento, parcelas, modelo_versao
 
     except Exception as e:
         logger.exception("❌ Erro ao processar mensagem:")
-        return "Erro", 0.0, "Desconhecido", "Desconhecido", 1
+        return "Erro", 0.0, "Desconhecido", "Desconhecido", 1, None
+
+# ---------------------------------------------------------------------------
+# Handlers de comandos de texto. Cada um recebe um ContextoMensagem e devolve
+# a resposta do webhook; o roteador escolhe o handler a partir de COMANDOS.
+# ---------------------------------------------------------------------------
+
+RE_EMAIL = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+RE_EMAIL_COMANDO = re.compile(r'^([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\s+(\d{2}-\d{2}-\d{4}))?$')
+RE_RESUMO_EMAILS = re.compile(r'resumo d(?:os|e) emails')
+RE_RESUMO_EMAILS_COM_EMAIL = re.compile(r'resumo d[eo]s? emails\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\s+(\d{2}-\d{2}-\d{4}))?')
+RE_RESUMO_EMAILS_COM_DATA = re.compile(r'resumo d[eo]s? emails\s+(\d{2}-\d{2}-\d{4})')
+RE_SCHEMA = re.compile(r'^[a-z_][a-z0-9_]*$')
+# Valor seguido do meio de pagamento (e parcelas), como processar_mensagem lê um gasto
+RE_VALOR_E_MEIO = re.compile(r'\d+(?:[.,]\d+)*\s+(?:\d+x\s+)?(?:pix|crédito|débito)\b')
+RE_LEMBRETE = re.compile(r'lembrete:\s*"(.+?)"\s*cron:\s*([0-9*/,\- ]{5,})')
+
+TABELA_CRON = (
+    "⏰ Exemplos de expressões CRON:\n"
+    "\n* * * * * → Executa a cada minuto\n"
+    "0 9 * * * → Todos os dias às 09:00\n"
+    "30 14 * * * → Todos os dias às 14:30\n"
+    "0 8 * * 1-5 → Segunda a sexta às 08:00\n"
+    "15 10 15 * * → Dia 15 de cada mês às 10:15\n"
+    "0 0 1 1 * → 1º de janeiro à meia-noite\n"
+    "0 18 * * 6 → Todos os sábados às 18:00\n"
+    "\nFormato: minuto hora dia_do_mes mês dia_da_semana"
+)
 
-def definir_categoria(descricao: str):
-    """
-    Usa o modelo FastText para prever a categoria a partir da descrição.
-    """
-    predicao = MODELO_FASTTEXT.predict(descricao)
-    categoria_predita = predicao[0][0].replace("__label__", "")
-    probabilidade = predicao[1][0]
+def eh_admin(telefone: str) -> bool:
+    return telefone == os.getenv("ADMIN_PHONE")
+
+async def cmd_ajuda(ctx: ContextoMensagem):
+    await exibir_menu_ajuda(ctx.telefone)
+    return {"status": "OK", "resposta": "Menu de ajuda enviado"}
+
+async def cmd_total_gasto(ctx: ContextoMensagem):
+    total = await bd.calcular_total_gasto(ctx.schema)
+    resposta = f"📊 Total gasto no mês: R$ {format(total, ',.2f').replace(',', '.')}"
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    log_tempos(ctx.inicio, ctx.timestamp_whatsapp, logger, ctx.mensagem, ctx.telefone)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_fatura_paga(ctx: ContextoMensagem):
+    pagamento = await bd.pagar_fatura(ctx.schema)
+    if pagamento["parcelas"]:
+        valor = format(pagamento["valor"], ',.2f').replace(',', '.')
+        resposta = (
+            f"✅ Fatura paga! {pagamento['parcelas']} parcela(s) deste mês, somando R$ {valor}, "
+            "foram adicionadas ao total de gastos!"
+        )
+    else:
+        resposta = "ℹ️ Nenhuma parcela com vencimento neste mês foi encontrada na fatura."
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    log_tempos(ctx.inicio, ctx.timestamp_whatsapp, logger, ctx.mensagem, ctx.telefone)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_salario(ctx: ContextoMensagem):
+    resposta = await bd.registrar_salario(ctx.mensagem, ctx.schema)
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    log_tempos(ctx.inicio, ctx.timestamp_whatsapp, logger, ctx.mensagem, ctx.telefone)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_graficos(ctx: ContextoMensagem):
+    telefone = ctx.telefone
+    token_info = await bd.gerar_token_acesso(telefone)
+    token = token_info["token"]
+    expira_em = token_info["expira_em"]
+
+    resposta = (
+        "📊 Aqui está o seu link com os gráficos financeiros!\n\n"
+        f"🔗 https://dashboard-financas.up.railway.app/?phone={telefone}&token={token}\n"
+        f"⚠️ O link é válido até às {expira_em.strftime('%H:%M')} por segurança."
+    )
+    # O token é uma credencial: não vai para logs nem para a resposta do webhook
+    logger.info("🔗 Link do dashboard gerado para %s (válido até %s)", telefone, expira_em.strftime('%H:%M'))
+
+    await enviar_mensagem_whatsapp(telefone, resposta)
+    return {"status": "OK", "mensagem": "Link do dashboard enviado"}
+
+async def cmd_cep(ctx: ContextoMensagem):
+    partes = ctx.partes
+    if len(partes) == 2 and partes[1].isdigit():
+        cep = partes[1]
+        resposta = await asyncio.to_thread(buscar_cep, cep)
+    else:
+        resposta = "❌ Formato inválido. Use: `cep 05424020` (apenas números)."
+
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_cotacao(ctx: ContextoMensagem):
+    resposta = await asyncio.to_thread(obter_cotacao_principais, API_COTACAO, MOEDA_EMOJIS)
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    log_tempos(ctx.inicio, ctx.timestamp_whatsapp, logger, ctx.mensagem, ctx.telefone)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_cotacao_moeda(ctx: ContextoMensagem):
+    moeda_origem = ctx.partes[1].upper()
+    resposta = await asyncio.to_thread(obter_cotacao, API_COTACAO, MOEDAS, CONVERSOES, moeda_origem)
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    log_tempos(ctx.inicio, ctx.timestamp_whatsapp, logger, ctx.mensagem, ctx.telefone)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_cotacao_conversao(ctx: ContextoMensagem):
+    moeda_origem = ctx.partes[1].upper()
+    moeda_destino = ctx.partes[3].upper()
+    resposta = await asyncio.to_thread(obter_cotacao, API_COTACAO, MOEDAS, CONVERSOES, moeda_origem, moeda_destino)
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    log_tempos(ctx.inicio, ctx.timestamp_whatsapp, logger, ctx.mensagem, ctx.telefone)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_listar_moedas(ctx: ContextoMensagem):
+    resposta = listar_moedas_disponiveis(MOEDAS)
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_listar_conversoes(ctx: ContextoMensagem):
+    resposta = listar_conversoes_disponiveis(CONVERSOES)
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_conversoes_moeda(ctx: ContextoMensagem):
+    partes = ctx.partes
+    if len(partes) == 2:
+        moeda = partes[1].upper()
+        if moeda in CONVERSOES:
+            resposta = listar_conversoes_disponiveis_moeda(CONVERSOES, moeda)
+        else:
+            resposta = f"⚠️ Moeda '{moeda}' não encontrada ou não tem conversões disponíveis."
+    else:
+        resposta = "❌ Formato inválido. Use: conversoes [moeda]"
+
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_lembrete(ctx: ContextoMensagem):
+    resposta = await bd.executar_bd(processar_lembrete_formatado, ctx.mensagem, ctx.telefone)
+    if resposta:
+        await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+        return {"status": "ok"}
+
+async def cmd_tabela_cron(ctx: ContextoMensagem):
+    await enviar_mensagem_whatsapp(ctx.telefone, TABELA_CRON)
+    return {"status": "ok"}
+
+async def cmd_lista_lembretes(ctx: ContextoMensagem):
+    lembretes = await bd.listar_lembretes(ctx.telefone, ctx.schema)
+    if not lembretes:
+        resposta = "📭 Você ainda não possui lembretes cadastrados."
+    else:
+        resposta = "📋 *Seus lembretes:*\n\n" + "\n".join(
+            [f"🆔 {l['id']} - \"{l['mensagem']}\"\n⏰ CRON: `{l['cron']}`\n" for l in lembretes]
+        )
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "ok"}
+
+async def cmd_apagar_lembrete(ctx: ContextoMensagem):
+    partes = ctx.mensagem_lower.split()
+    if len(partes) >= 3 and partes[2].isdigit():
+        id_lembrete = int(partes[2])
+        sucesso = await bd.apagar_lembrete(ctx.telefone, id_lembrete, ctx.schema)
+        resposta = "🗑️ Lembrete apagado com sucesso!" if sucesso else "⚠️ Lembrete não encontrado ou não pertence a você."
+    else:
+        resposta = "❌ Formato inválido. Use: apagar lembrete [ID]"
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "ok"}
+
+async def cmd_liberar(ctx: ContextoMensagem):
+    partes = ctx.partes
+    if len(partes) >= 3:
+        numero_para_liberar = partes[1]
+        nome_usuario = " ".join(partes[2:])
+        if eh_admin(ctx.telefone):
+            try:
+                await bd.liberar_usuario(nome_usuario, numero_para_liberar)
+                resposta = f"✅ Número {numero_para_liberar} ({nome_usuario}) autorizado com sucesso!"
+
+                # ✅ Envia mensagem para o novo usuário liberado
+                texto_bem_vindo = (
+                    f"🎉 Olá usuário!\n"
+                    f"Seu número foi autorizado e agora você pode usar o assistente financeiro via WhatsApp. "
+                    f"Digite 'ajuda' para ver os comandos disponíveis."
+                )
+                await enviar_mensagem_whatsapp(numero_para_liberar, texto_bem_vindo)
+
+            except Exception as e:
+                logger.error("❌ Erro ao liberar usuário: %s", str(e))
+                resposta = f"❌ Erro ao autorizar o número: {e}"
+        else:
+            resposta = "⚠️ Apenas o administrador pode liberar novos usuários."
+    else:
+        resposta = "❌ Formato inválido. Use: liberar [número] [nome]"
+
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_nao_liberar(ctx: ContextoMensagem):
+    partes = ctx.partes
+    if len(partes) >= 2:
+        numero_negado = partes[2] if len(partes) >= 3 else partes[1]
+        if eh_admin(ctx.telefone):
+            # Mensagem para o admin (confirmação)
+            resposta = f"🚫 Número {numero_negado} não foi autorizado."
+
+            # Mensagem para o usuário negado
+            texto_usuario = (
+                "🚫 Seu número **não foi autorizado** a usar o assistente financeiro no momento. "
+                "Em caso de dúvidas, entre em contato com o administrador."
+            )
+            await enviar_mensagem_whatsapp(numero_negado, texto_usuario)
+        else:
+            resposta = "⚠️ Apenas o administrador pode negar autorizações."
+    else:
+        resposta = "❌ Formato inválido. Use: não liberar [número]"
+
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_lista_usuarios(ctx: ContextoMensagem):
+    if not eh_admin(ctx.telefone):
+        await enviar_mensagem_whatsapp(ctx.telefone, "⚠️ Apenas o administrador pode acessar essa lista.")
+        return {"status": "acesso negado"}
+
+    usuarios = await bd.listar_usuarios_autorizados()
+    if not usuarios:
+        resposta = "📭 Nenhum número autorizado encontrado."
+    else:
+        resposta = "✅ *Usuários autorizados:*\n\n" + "\n".join(
+            [f"👤 {nome or '(sem nome)'} - {tel}" for nome, tel, _ in usuarios]
+        )
+
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": "lista enviada"}
+
+async def cmd_revogar(ctx: ContextoMensagem):
+    numero_para_revogar = ctx.mensagem.split(" ")[1]
+    if eh_admin(ctx.telefone):
+        sucesso = await bd.revogar_autorizacao(numero_para_revogar)
+        if sucesso:
+            resposta = f"🚫 Número {numero_para_revogar} teve a autorização revogada com sucesso!"
+        else:
+            resposta = "⚠️ Número não encontrado ou já está desautorizado."
+    else:
+        resposta = "⚠️ Apenas o administrador pode revogar autorizações."
+
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_reclassificar(ctx: ContextoMensagem):
+    if not eh_admin(ctx.telefone):
+        await enviar_mensagem_whatsapp(ctx.telefone, "⚠️ Apenas o administrador pode reclassificar gastos.")
+        return {"status": "acesso negado"}
+
+    schema = ctx.partes[1].lower() if len(ctx.partes) > 1 else ctx.schema
+    if not RE_SCHEMA.match(schema):
+        await enviar_mensagem_whatsapp(ctx.telefone, "⚠️ Informe um schema válido. Ex: reclassificar joao_silva")
+        return {"status": "schema inválido"}
+    await enviar_mensagem_whatsapp(ctx.telefone, f"🏷️ Reclassificando os gastos de {schema}...")
+    try:
+        resultado = await asyncio.to_thread(reclassificar_schema, schema)
+    except Exception as e:
+        logger.exception("❌ Erro ao reclassificar %s:", schema)
+        resposta = f"❌ Erro ao reclassificar {schema}: {e}"
+    else:
+        resposta = (
+            f"✅ Reclassificação de {schema} concluída em {resultado['segundos']:.1f}s\n"
+            f"• gastos: {resultado['gastos']['alteradas']} de {resultado['gastos']['lidas']} alterados\n"
+            f"• fatura: {resultado['fatura_cartao']['alteradas']} de {resultado['fatura_cartao']['lidas']} alterados"
+        )
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_modelo(ctx: ContextoMensagem):
+    if not eh_admin(ctx.telefone):
+        await enviar_mensagem_whatsapp(ctx.telefone, "⚠️ Apenas o administrador pode gerenciar o modelo.")
+        return {"status": "acesso negado"}
+
+    partes = ctx.mensagem_lower.split()
+    try:
+        if len(partes) >= 3 and partes[1] == "ativar":
+            await enviar_mensagem_whatsapp(ctx.telefone, f"⏳ Carregando o modelo {partes[2]}...")
+            ativo = await asyncio.to_thread(ativar_modelo, partes[2])
+            resposta = f"✅ Modelo {ativo['versao']} ativo (carregado em {ativo['segundos_carga']:.1f}s)."
+        elif len(partes) == 2 and partes[1] == "reverter":
+            ativo = await asyncio.to_thread(reverter_modelo)
+            resposta = f"↩️ Modelo revertido para {ativo['versao']}."
+        else:
+            status = await asyncio.to_thread(status_modelo)
+            resposta = (
+                f"🧠 Modelo ativo: {status.get('versao')}\n"
+                f"• anterior: {status.get('anterior') or '-'}\n"
+                f"• disponíveis: {', '.join(status.get('disponiveis', []))}\n\n"
+                "Use `modelo ativar [versão]` ou `modelo reverter`."
+            )
+    except Exception as e:
+        logger.exception("❌ Erro ao trocar o modelo:")
+        resposta = f"❌ Erro ao trocar o modelo: {e}"
+
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_aprender(ctx: ContextoMensagem):
+    # "aprender uber eats = alimentação" (frase exata) ou "aprender uber* = transporte" (prefixo)
+    texto = ctx.mensagem[len("aprender"):].strip()
+    if "=" not in texto:
+        regras = await bd.listar_categorias_aprendidas(ctx.schema)
+        linhas = [f"• `{padrao}{'*' if tipo == 'prefixo' else ''}` → {categoria}" for padrao, tipo, categoria in regras]
+        resposta = (
+            ("🧠 *Categorias que você ensinou:*\n" + "\n".join(linhas) + "\n\n" if linhas else "")
+            + "Use `aprender [descrição] = [categoria]`, ou `aprender [palavra]* = [categoria]` "
+            "para todas as descrições com essa palavra. Para desfazer: `esquecer [descrição]`."
+        )
+        await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+        return {"status": "OK", "resposta": resposta}
+
+    padrao, categoria = (parte.strip() for parte in texto.split("=", 1))
+    prefixo = padrao.endswith("*")
+    padrao = normalizar_descricao(padrao.rstrip("*"))
+    categoria = " ".join(categoria.lower().split())
+    if not padrao or not categoria:
+        resposta = "❌ Formato inválido. Use: aprender [descrição] = [categoria]"
+    else:
+        await bd.ensinar_categoria(ctx.schema, padrao, categoria, prefixo)
+        alvo = f"descrições com '{padrao}'" if prefixo else f"'{padrao}'"
+        resposta = f"🧠 Anotado! A partir de agora, {alvo} vão para '{categoria}'."
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    log_tempos(ctx.inicio, ctx.timestamp_whatsapp, logger, ctx.mensagem, ctx.telefone)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_esquecer(ctx: ContextoMensagem):
+    padrao = normalizar_descricao(ctx.mensagem[len("esquecer"):].strip().rstrip("*"))
+    if not padrao:
+        resposta = "❌ Formato inválido. Use: esquecer [descrição]"
+    elif await bd.esquecer_categoria(ctx.schema, padrao):
+        resposta = f"🗑️ '{padrao}' voltou a ser classificado automaticamente."
+    else:
+        resposta = f"⚠️ Nenhuma categoria ensinada para '{padrao}'."
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_noticias(ctx: ContextoMensagem):
+    telefone = ctx.telefone
+    await enviar_mensagem_whatsapp(telefone, "📰 Um instante... buscando o boletim mais recente.")
+    mensagens = await asyncio.to_thread(obter_boletim_the_news)
+    if not mensagens:
+        await enviar_mensagem_whatsapp(telefone, "❌ Não foi possível carregar o boletim de hoje.")
+        return {"status": "Erro", "resposta": "Falha ao capturar o boletim."}
+    for bloco in mensagens:
+        await enviar_mensagem_whatsapp(telefone, bloco)
+    return {"status": "OK", "resposta": "Boletim enviado com sucesso"}
+
+def mensagem_de_busca_emails(email_user: str, data_consulta: str = None) -> str:
+    if data_consulta:
+        try:
+            data_obj = datetime.strptime(data_consulta, "%d-%m-%Y")
+            data_formatada = data_obj.strftime("%d/%m/%Y")
+            return f"🔍 Buscando emails de {data_formatada} em {email_user}..."
+        except:
+            return f"🔍 Buscando emails em {email_user}..."
+    return f"🔍 Buscando emails de hoje em {email_user}..."
+
+async def cmd_resumo_emails(ctx: ContextoMensagem):
+    telefone = ctx.telefone
+    # Processa os parametros: email específico e data (ambos opcionais)
+    email_especifico = None
+    data_consulta = None
+
+    # Verifica se há um email direto como comando
+    email_direto = RE_EMAIL_COMANDO.match(ctx.mensagem)
+    if email_direto:
+        email_especifico = email_direto.group(1)
+        data_consulta = email_direto.group(3) if email_direto.group(3) else None
+    else:
+        # Busca email e data na instrução "resumo de emails"
+        padrao_completo = RE_RESUMO_EMAILS_COM_EMAIL.search(ctx.mensagem_lower)
+        if padrao_completo:
+            email_especifico = padrao_completo.group(1)
+            data_consulta = padrao_completo.group(3) if padrao_completo.group(3) else None
+        else:
+            # Verifica se tem apenas a data, sem email específico
+            padrao_apenas_data = RE_RESUMO_EMAILS_COM_DATA.search(ctx.mensagem_lower)
+            if padrao_apenas_data:
+                data_consulta = padrao_apenas_data.group(1)
+
+    # Debug - Anotar nos logs o que foi detectado
+    logger.info(f"Comando processado - Email: {email_especifico}, Data: {data_consulta}")
+
+    # Valida o formato da data, se fornecida
+    if data_consulta:
+        try:
+            datetime.strptime(data_consulta, "%d-%m-%Y")
+        except ValueError:
+            resposta = "❌ Formato de data inválido. Use o formato DD-MM-AAAA, por exemplo: 14-04-2025"
+            await enviar_mensagem_whatsapp(telefone, resposta)
+            return {"status": "erro", "resposta": resposta}
+
+    # Busca os emails cadastrados
+    emails_cadastrados = await bd.listar_emails_cadastrados(telefone)
+
+    # Se não tiver emails cadastrados
+    if not emails_cadastrados:
+        resposta = (
+            "📩 Para acessar seus e-mails, preciso das credenciais do Gmail.\n\n"
+            "Por favor, envie no seguinte formato:\n\n"
+            "email: seu_email@gmail.com\n"
+            "senha: sua_senha_de_app\n"
+            "descricao: Email Pessoal (opcional)"
+        )
+        await enviar_mensagem_whatsapp(telefone, resposta)
+        return {"status": "OK", "resposta": resposta}
+
+    # Se tem email específico solicitado
+    if email_especifico:
+        # Verifica se esse email existe nos cadastrados
+        email_encontrado = False
+        for email_user, _ in emails_cadastrados:
+            if email_user.lower() == email_especifico.lower():
+                email_encontrado = True
+                email_especifico = email_user  # Usar a versão exata cadastrada (preservando maiúsculas/minúsculas)
+                break
+
+        if not email_encontrado:
+            resposta = (
+                f"❌ O email {email_especifico} não está cadastrado.\n\n"
+                "Emails cadastrados:\n"
+            )
+            for email_user, descricao in emails_cadastrados:
+                resposta += f"• {email_user} - {descricao}\n"
+
+            await enviar_mensagem_whatsapp(telefone, resposta)
+            return {"status": "OK", "resposta": resposta}
+
+        # Busca email específico
+        email_user, email_pass = await bd.buscar_credenciais_email(telefone, email_especifico)
+        if not email_user or not email_pass:
+            resposta = f"❌ Não foi possível encontrar credenciais válidas para {email_especifico}."
+            await enviar_mensagem_whatsapp(telefone, resposta)
+            return {"status": "erro", "resposta": resposta}
+
+        await enviar_mensagem_whatsapp(telefone, mensagem_de_busca_emails(email_user, data_consulta))
+
+        # Busca emails - Passa explicitamente a data_consulta
+        emails = await asyncio.to_thread(get_emails_info, email_user, email_pass, data_consulta)
+
+        # Debug
+        logger.info(f"Emails encontrados: {len(emails)} para data {data_consulta}")
+
+        resposta = formatar_emails_para_whatsapp(emails, email_user, data_consulta)
 
-    return categoria_predita, probabilidade
+    # Se tem múltiplos emails cadastrados e nenhum especificado
+    elif len(emails_cadastrados) > 1:
+        # Se tiver data mas não email específico, pede para escolher o email
+        if data_consulta:
+            data_formatada = datetime.strptime(data_consulta, "%d-%m-%Y").strftime("%d/%m/%Y")
+            resposta = f"📩 Você tem vários emails cadastrados. Para qual deseja ver emails de {data_formatada}?\n\n"
+            for email_user, descricao in emails_cadastrados:
+                resposta += f"• {email_user} - {descricao}\n"
+            resposta += f"\nEnvie 'resumo de emails SEUEMAIL@gmail.com {data_consulta}' ou apenas 'SEUEMAIL@gmail.com {data_consulta}'"
+        else:
+            resposta = "📩 Você tem vários emails cadastrados. Qual deseja consultar?\n\n"
+            for email_user, descricao in emails_cadastrados:
+                resposta += f"• {email_user} - {descricao}\n"
+            resposta += "\nEnvie 'resumo de emails SEUEMAIL@gmail.com' ou apenas 'SEUEMAIL@gmail.com'"
+            resposta += "\nVocê também pode especificar uma data: 'resumo de emails SEUEMAIL@gmail.com DD-MM-AAAA'"
+
+    # Se tem apenas um email cadastrado
+    else:
+        email_user, email_pass = await bd.buscar_credenciais_email(telefone)
+
+        await enviar_mensagem_whatsapp(telefone, mensagem_de_busca_emails(email_user, data_consulta))
+
+        # Busca emails - Passa explicitamente a data_consulta
+        emails = await asyncio.to_thread(get_emails_info, email_user, email_pass, data_consulta)
+
+        # Debug
+        logger.info(f"Emails encontrados: {len(emails)} para data {data_consulta}")
+
+        resposta = formatar_emails_para_whatsapp(emails, email_user, data_consulta)
+
+    await enviar_mensagem_whatsapp(telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_email(ctx: ContextoMensagem):
+    telefone = ctx.telefone
+    linhas = ctx.mensagem.splitlines()
+    if len(linhas) >= 2 and "senha:" in linhas[1].lower():
+        email_user = linhas[0].split(":", 1)[1].strip()
+        email_pass = linhas[1].split(":", 1)[1].strip()
+
+        # Verifica se tem descrição personalizada
+        descricao = None
+        if len(linhas) >= 3 and "descricao:" in linhas[2].lower():
+            descricao = linhas[2].split(":", 1)[1].strip()
+
+        # Valida o formato do email
+        if not RE_EMAIL.match(email_user):
+            await enviar_mensagem_whatsapp(
+                telefone,
+                "❌ Formato de email inválido. Certifique-se de que seu email está correto."
+            )
+            return {"status": "erro", "mensagem": "Formato de email inválido"}
+
+        # Salva (ou atualiza) o email
+        await bd.salvar_credenciais_email(telefone, email_user, email_pass, descricao)
+        await enviar_mensagem_whatsapp(
+            telefone,
+            f"✅ Credenciais de e-mail salvas com sucesso! ({email_user})\n\n"
+            f"Para consultar, envie:\n"
+            f"• 'resumo dos emails' (lista todos os emails)\n"
+            f"• 'resumo dos emails {email_user}' (este email específico)\n"
+            f"• ou simplesmente '{email_user}'"
+        )
+    else:
+        await enviar_mensagem_whatsapp(
+            telefone,
+            "❌ Formato inválido. Envie assim:\n"
+            "email: seu_email@gmail.com\n"
+            "senha: sua_senha_de_app\n"
+            "descricao: Email pessoal (opcional)"
+        )
+
+def parece_gasto(ctx: ContextoMensagem) -> bool:
+    mensagem = ctx.mensagem
+    return (
+        any(char.isdigit() for char in mensagem)
+        and " " in mensagem
+        and "cep" not in ctx.mensagem_lower
+        and not (len(ctx.partes) >= 2 and ctx.partes[1].startswith("55"))
+    )
+
+async def cmd_registrar_gasto(ctx: ContextoMensagem):
+    # Pode consultar as categorias aprendidas no banco: roda no pool do banco
+    descricao, valor, categoria, meio_pagamento, parcelas, modelo_versao = await bd.executar_bd(
+        processar_mensagem, ctx.mensagem, ctx.schema
+    )
+
+    logger.info(
+        "✅ Gasto reconhecido: %s | Valor: %.2f | Categoria: %s | Meio de Pagamento: %s | Parcelas: %d",
+        descricao, valor, categoria, meio_pagamento, parcelas
+    )
+
+    if meio_pagamento in ["pix", "débito"]:
+        await bd.salvar_gasto(descricao, valor, categoria, meio_pagamento, ctx.schema, parcelas, modelo_versao)
+        resposta = f"✅ Gasto de R$ {format(valor, ',.2f').replace(',', '.')} em '{categoria}' registrado com sucesso!"
+    else:
+        await bd.salvar_fatura(descricao, valor, categoria, meio_pagamento, parcelas, ctx.schema, modelo_versao)
+        resposta = f"✅ Compra parcelada registrada! {parcelas}x de R$ {valor/parcelas:.2f}"
+
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    log_tempos(ctx.inicio, ctx.timestamp_whatsapp, logger, ctx.mensagem, ctx.telefone)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_rota(ctx: ContextoMensagem):
+    telefone = ctx.telefone
+    mensagem = ctx.mensagem
+    endereco_destino = mensagem[5:] if ctx.mensagem_lower.startswith("rota ") else mensagem[8:]
+
+    # Verifica se o usuário enviou a localização antes (você precisaria armazenar isso)
+    ultima_localizacao = await bd.obter_ultima_localizacao(telefone)
+
+    if ultima_localizacao:
+        resultado = await asyncio.to_thread(
+            calcular_rota,
+            endereco_destino, 
+            lat_origem=ultima_localizacao["latitude"], 
+            lng_origem=ultima_localizacao["longitude"]
+        )
+
+        if "erro" in resultado:
+            resposta = f"❌ {resultado['erro']}"
+        else:
+            resposta = (
+                f"🧭 *Rota calculada*\n\n"
+                f"📍 *Destino:* {resultado['destino']['endereco']}\n"
+                f"🚗 *Distância:* {resultado['distancia_km']} km\n"
+                f"⏱️ *Tempo estimado:* {resultado['duracao_min']} minutos\n\n"
+                f"🔗 [Ver no mapa]({resultado['map_url']})"
+            )
+    else:
+        # Se não tiver a localização do usuário, apenas informa sobre o destino
+        resultado = await asyncio.to_thread(calcular_rota, endereco_destino)
 
+        if "erro" in resultado:
+            resposta = f"❌ {resultado['erro']}"
+        else:
+            resposta = (
+                f"📍 *Destino encontrado*\n\n"
+                f"*Endereço:* {resultado['destino']['endereco']}\n\n"
+                "Para calcular a rota completa, compartilhe sua localização atual."
+            )
+
+    await enviar_mensagem_whatsapp(telefone, resposta)
+    return {"status": "OK", "resposta": resposta}
+
+async def cmd_desconhecido(ctx: ContextoMensagem):
+    resposta = (
+        "⚠️ Comando não reconhecido.\n"
+        "Digite *ajuda* para ver a lista de comandos disponíveis."
+    )
+    await enviar_mensagem_whatsapp(ctx.telefone, resposta)
+    return {"status": "comando inválido", "resposta": resposta}
+
+# Cada comando pode declarar como é reconhecido:
+#   exatos   → textos exatos (minúsculos), resolvidos por dicionário
+#   prefixos → início da mensagem (minúscula), resolvidos pela trie
+#   regex    → padrões pré-compilados buscados na mensagem minúscula
+#   condicao → filtro extra sobre o ContextoMensagem
+# Entradas sem "handler" servem apenas para o menu de ajuda.
 COMANDOS = [
     {
         "comando": "ajuda",
         "descricao": "Mostra este menu",
         "admin_only": False,
+        "handler": cmd_ajuda,
+        "exatos": ["ajuda", "menu", "comandos"],
     },
     {
         "comando": "total gasto",
         "descricao": "Exibe o total de gastos do mês",
         "admin_only": False,
+        "handler": cmd_total_gasto,
+        "exatos": ["total gasto"],
     },
     {
         "comando": "gráficos",
         "descricao": "Envia um link com os gráficos financeiros",
         "admin_only": False,
+        "handler": cmd_graficos,
+        "exatos": ["gráficos"],
+        "sensivel": True,
     },
     {
         "comando": "fatura paga!",
         "descricao": "Informa que sua fatura foi paga",
         "admin_only": False,
+        "handler": cmd_fatura_paga,
+        "exatos": ["fatura paga!"],
+    },
+    {
+        "comando": "aprender [descrição] = [categoria]",
+        "descricao": "Ensina a categoria de uma descrição (use `palavra*` para um prefixo)",
+        "admin_only": False,
+        "handler": cmd_aprender,
+        "exatos": ["aprender"],
+        # Sem "=", a mensagem segue como gasto (ex.: "aprender violão 150 pix"); só "aprender" mostra o uso
+        "condicao": lambda ctx: "=" in ctx.mensagem or ctx.mensagem_lower == "aprender",
+        "prefixos": ["aprender "],
+    },
+    {
+        "comando": "esquecer [descrição]",
+        "descricao": "Desfaz uma categoria ensinada",
+        "admin_only": False,
+        "handler": cmd_esquecer,
+        "prefixos": ["esquecer "],
+        # Com valor e meio de pagamento é gasto (ex.: "esquecer guarda-chuva 30 pix")
+        "condicao": lambda ctx: not RE_VALOR_E_MEIO.search(ctx.mensagem_lower),
+    },
+    {
+        "comando": "salario [valor]",
+        "descricao": "Registra o valor do seu salário",
+        "admin_only": False,
+        "handler": cmd_salario,
+        "prefixos": ["salario "],
     },
     {
         "comando": "cotação",
         "descricao": "Mostra as principais moedas do dia",
         "admin_only": False,
+        "handler": cmd_cotacao,
+        "exatos": ["cotação"],
     },
     {
         "comando": "lista cotação",
         "descricao": "Lista todas as moedas disponíveis",
         "admin_only": False,
+        "handler": cmd_listar_moedas,
+        "exatos": ["lista cotação", "listar moedas"],
     },
     {
         "comando": "cotação [moeda]",
         "descricao": "Mostra a cotação da moeda (ex: cotação USD)",
         "admin_only": False,
+        "handler": cmd_cotacao_moeda,
+        "prefixos": ["cotação"],
+        "condicao": lambda ctx: len(ctx.partes) == 2,
     },
     {
         "comando": "cotação [moeda1]-[moeda2]",
         "descricao": "Conversão entre duas moedas (ex: cotação USD-EUR)",
         "admin_only": False,
+        "handler": cmd_cotacao_conversao,
+        "prefixos": ["cotação"],
+        "condicao": lambda ctx: "-" in ctx.mensagem_lower or len(ctx.partes) > 2,
+    },
+    {
+        "comando": "listar conversoes",
+        "descricao": "Lista todas as conversões disponíveis",
+        "admin_only": False,
+        "handler": cmd_listar_conversoes,
+        "exatos": ["listar conversoes"],
+    },
+    {
+        "comando": "conversoes [moeda]",
+        "descricao": "Lista as conversões disponíveis para a moeda",
+        "admin_only": False,
+        "handler": cmd_conversoes_moeda,
+        "prefixos": ["conversoes "],
     },
     {
         "comando": "cep [número]",
         "descricao": "Retorna o endereço correspondente ao CEP",
         "admin_only": False,
+        "handler": cmd_cep,
+        "prefixos": ["cep "],
+    },
+    {
+        "comando": "rota [endereço]",
+        "descricao": "Calcula a rota até o endereço a partir da sua última localização",
+        "admin_only": False,
+        "handler": cmd_rota,
+        "prefixos": ["rota ", "caminho "],
     },
     {
         "comando": "lembrete: \"msg\" + cron: padrão",
         "descricao": "Agenda um lembrete com cron",
         "admin_only": False,
+        "handler": cmd_lembrete,
+        "prefixos": ["lembrete:"],
+        "condicao": lambda ctx: "cron:" in ctx.mensagem_lower,
     },
     {
         "comando": "tabela cron",
         "descricao": "Exibe exemplos de agendamento CRON",
         "admin_only": False,
+        "handler": cmd_tabela_cron,
+        "exatos": ["tabela cron"],
     },
     {
         "comando": "lista lembretes",
         "descricao": "Lista todos os lembretes ativos",
         "admin_only": False,
+        "handler": cmd_lista_lembretes,
+        "exatos": ["lista lembretes"],
     },
     {
         "comando": "apagar lembrete [id]",
         "descricao": "Apaga um lembrete específico",
         "admin_only": False,
+        "handler": cmd_apagar_lembrete,
+        "prefixos": ["apagar lembrete"],
     },
     {
         "comando": "notícias",
         "descricao": "Envia o boletim mais recente do The News",
         "admin_only": False,
+        "handler": cmd_noticias,
+        "exatos": ["notícias", "boletim", "the news"],
     },
-        {
+    {
         "comando": "email: seu_email + senha: sua_senha + descricao: nome",
         "descricao": "Salva suas credenciais de e-mail (descrição opcional)",
         "admin_only": False,
+        "handler": cmd_email,
+        "prefixos": ["email:"],
+        "sensivel": True,
     },
     {
         "comando": "resumo dos emails",
         "descricao": "Lista seus emails recentes (ou solicita escolher qual email)",
         "admin_only": False,
+        "handler": cmd_resumo_emails,
+        "regex": [RE_RESUMO_EMAILS, RE_EMAIL_COMANDO],
+        "sensivel": True,
     },
     {
         "comando": "resumo dos emails [email]",
@@ -963,24 +1358,58 @@ COMANDOS = [
         "comando": "liberar [telefone] [nome]",
         "descricao": "Autoriza novo número e cria schema",
         "admin_only": True,
+        "handler": cmd_liberar,
+        "prefixos": ["liberar "],
     },
     {
         "comando": "não liberar [telefone]",
         "descricao": "Recusa um número e envia notificação ao usuário",
         "admin_only": True,
+        "handler": cmd_nao_liberar,
+        "prefixos": ["não liberar "],
     },
     {
         "comando": "lista usuarios",
         "descricao": "Lista todos os usuários autorizados",
         "admin_only": True,
+        "handler": cmd_lista_usuarios,
+        "exatos": ["lista usuarios"],
     },
     {
         "comando": "revogar [telefone]",
         "descricao": "Revoga a autorização de um número",
         "admin_only": True,
+        "handler": cmd_revogar,
+        "prefixos": ["revogar "],
+    },
+    {
+        "comando": "reclassificar [schema]",
+        "descricao": "Reclassifica o histórico de gastos com o modelo atual",
+        "admin_only": True,
+        "handler": cmd_reclassificar,
+        # Para os demais usuários, mensagens com essa palavra seguem como gasto
+        "condicao": lambda ctx: eh_admin(ctx.telefone),
+        "exatos": ["reclassificar"],
+        "prefixos": ["reclassificar "],
+    },
+    {
+        "comando": "modelo [ativar versão | reverter]",
+        "descricao": "Mostra, troca ou reverte a versão do modelo de categorias",
+        "admin_only": True,
+        "handler": cmd_modelo,
+        # Para os demais usuários, mensagens com essa palavra seguem como gasto
+        "condicao": lambda ctx: eh_admin(ctx.telefone),
+        "exatos": ["modelo"],
+        "prefixos": ["modelo "],
     },
 ]
 
+ROTEADOR = RoteadorComandos(
+    COMANDOS,
+    fallback=Regra("registrar gasto", cmd_registrar_gasto, parece_gasto),
+    desconhecido=Regra("desconhecido", cmd_desconhecido),
+)
+
 async def exibir_menu_ajuda(telefone: str):
     admin_phone = os.getenv("ADMIN_PHONE")
     is_admin = telefone == admin_phone
@@ -1,23 +1,82 @@
-import psycopg2
+from backend.services.db_init import conectar_bd
+from backend.services.migracoes_service import migrar_tenant
 import os
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Validade do cache telefone → schema, só para números autorizados. Um revogar feito em
+# outro worker leva até esse prazo para valer aqui; comandos sensíveis consultam o banco.
+# Números desconhecidos ou bloqueados não são guardados: a liberação vale na hora.
+CACHE_USUARIOS_TTL = float(os.getenv("CACHE_USUARIOS_TTL", "30"))
+CACHE_USUARIOS_MAX = int(os.getenv("CACHE_USUARIOS_MAX", "10000"))
 
-def verificar_autorizacao(telefone: str) -> bool:
-    conn = psycopg2.connect(DATABASE_URL)
+_cache_usuarios = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_metricas = {"acertos": 0, "faltas": 0, "invalidacoes": 0}
+
+def obter_usuario(telefone: str, usar_cache: bool = True) -> tuple:
+    """
+    Retorna (autorizado, schema) do telefone numa única consulta, com cache em memória
+    das autorizações. Para números não autorizados ou desconhecidos o schema é None.
+    `usar_cache=False` sempre consulta o banco (comandos sensíveis).
+    """
+    agora = time.monotonic()
+    with _cache_lock:
+        item = _cache_usuarios.get(telefone) if usar_cache else None
+        if item is not None and item[0] > agora:
+            _cache_usuarios.move_to_end(telefone)
+            _cache_metricas["acertos"] += 1
+            return True, item[1]
+        _cache_metricas["faltas"] += 1
+
+    conn = conectar_bd()
     cursor = conn.cursor()
     cursor.execute(
-        "SELECT autorizado FROM usuarios WHERE telefone = %s", (telefone,)
+        "SELECT autorizado, schema_user FROM usuarios WHERE telefone = %s", (telefone,)
     )
     resultado = cursor.fetchone()
     cursor.close()
     conn.close()
-    return resultado is not None and resultado[0] is True
+
+    autorizado = resultado is not None and resultado[0] is True
+    schema = resultado[1] if autorizado else None
+
+    with _cache_lock:
+        if not autorizado:
+            _cache_usuarios.pop(telefone, None)
+            return False, None
+        _cache_usuarios[telefone] = (time.monotonic() + CACHE_USUARIOS_TTL, schema)
+        _cache_usuarios.move_to_end(telefone)
+        while len(_cache_usuarios) > CACHE_USUARIOS_MAX:
+            _cache_usuarios.popitem(last=False)
+    return autorizado, schema
+
+def invalidar_cache_usuario(telefone: str = None):
+    """Descarta o telefone do cache (ou o cache inteiro, sem argumento)."""
+    with _cache_lock:
+        if telefone is None:
+            _cache_usuarios.clear()
+        else:
+            _cache_usuarios.pop(telefone, None)
+        _cache_metricas["invalidacoes"] += 1
+
+def status_cache_usuarios() -> dict:
+    consultas = _cache_metricas["acertos"] + _cache_metricas["faltas"]
+    return {
+        **_cache_metricas,
+        "entradas": len(_cache_usuarios),
+        "taxa_acerto": round(_cache_metricas["acertos"] / consultas, 3) if consultas else 0.0,
+    }
+
+def verificar_autorizacao(telefone: str) -> bool:
+    return obter_usuario(telefone)[0]
 
 def liberar_usuario(nome, telefone):
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = conectar_bd()
     cursor = conn.cursor()
 
     schema = nome.lower().replace(" ", "_")
@@ -28,61 +87,10 @@ def liberar_usuario(nome, telefone):
         ON CONFLICT (telefone) DO UPDATE SET autorizado = true, nome = EXCLUDED.nome
     """, (nome, telefone, schema))
 
-    # 2. Criar schema com base no nome (transforma em minúsculo e remove espaços)
-    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
-
-    # 3. Criar tabelas dentro do schema
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {schema}.gastos (
-            id SERIAL PRIMARY KEY,
-            descricao TEXT,
-            valor REAL,
-            categoria TEXT,
-            meio_pagamento TEXT,
-            parcelas INT DEFAULT 1,
-            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {schema}.fatura_cartao (
-            id SERIAL PRIMARY KEY,
-            descricao TEXT,
-            valor REAL,
-            categoria TEXT,
-            meio_pagamento TEXT,
-            parcela TEXT,
-            data_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            data_fim DATE
-        )
-    """)
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {schema}.lembretes (
-            id SERIAL PRIMARY KEY,
-            telefone TEXT,
-            mensagem TEXT,
-            cron TEXT
-        )
-    """)
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {schema}.salario (
-            id SERIAL PRIMARY KEY,
-            valor REAL,
-            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    # Adição da tabela de emails com suporte a múltiplos emails
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {schema}.email (
-            id SERIAL PRIMARY KEY,
-            telefone TEXT NOT NULL,
-            email_user TEXT NOT NULL,
-            email_pass TEXT NOT NULL,
-            descricao TEXT,
-            data_inclusao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    # 2. Criar o schema (nome em minúsculo, sem espaços) e as tabelas via migrações
+    migrar_tenant(schema, cursor)
 
     conn.commit()
     cursor.close()
-    conn.close()
\ No newline at end of file
+    conn.close()
+    invalidar_cache_usuario(telefone)
\ No newline at end of file
@@ -0,0 +1,77 @@
+# Versões assíncronas das funções de banco usadas no webhook. Cada chamada roda
+# num pool de threads dedicado ao banco, então o event loop não trava esperando
+# o Postgres. As funções síncronas continuam nos módulos originais para o
+# dashboard, o scheduler e scripts.
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from backend.services.db_init import DB_POOL_MAX
+from backend import utils
+from backend.services import (
+    autorizacao_service, categorias_aprendidas_service, email_service, gastos_service, token_service,
+    usuarios_service
+)
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Mais threads do que conexões só faria threads esperarem pelo pool
+DB_THREADS = int(os.getenv("DB_THREADS", str(DB_POOL_MAX)))
+
+_executor = ThreadPoolExecutor(max_workers=max(1, DB_THREADS), thread_name_prefix="bd")
+
+
+async def executar_bd(funcao, *args, **kwargs):
+    """Executa uma função bloqueante de banco no pool de threads do banco."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(funcao, *args, **kwargs))
+
+
+def assincrona(funcao):
+    """Cria a versão `async` de uma função síncrona de banco, com o mesmo nome e assinatura."""
+    @functools.wraps(funcao)
+    async def wrapper(*args, **kwargs):
+        return await executar_bd(funcao, *args, **kwargs)
+    return wrapper
+
+
+def encerrar():
+    _executor.shutdown(wait=False)
+
+
+# Deduplicação e usuários
+registrar_mensagens_novas = assincrona(utils.registrar_mensagens_novas)
+esquecer_mensagem_recebida = assincrona(utils.esquecer_mensagem_recebida)
+obter_schema_por_telefone = assincrona(utils.obter_schema_por_telefone)
+salvar_localizacao_usuario = assincrona(utils.salvar_localizacao_usuario)
+obter_ultima_localizacao = assincrona(utils.obter_ultima_localizacao)
+obter_usuario = assincrona(autorizacao_service.obter_usuario)
+verificar_autorizacao = assincrona(autorizacao_service.verificar_autorizacao)
+liberar_usuario = assincrona(autorizacao_service.liberar_usuario)
+listar_usuarios_autorizados = assincrona(usuarios_service.listar_usuarios_autorizados)
+revogar_autorizacao = assincrona(usuarios_service.revogar_autorizacao)
+gerar_token_acesso = assincrona(token_service.gerar_token_acesso)
+
+# Gastos, faturas e lembretes
+salvar_gasto = assincrona(gastos_service.salvar_gasto)
+salvar_fatura = assincrona(gastos_service.salvar_fatura)
+salvar_compras = assincrona(gastos_service.salvar_compras)
+calcular_total_gasto = assincrona(gastos_service.calcular_total_gasto)
+pagar_fatura = assincrona(gastos_service.pagar_fatura)
+registrar_salario = assincrona(gastos_service.registrar_salario)
+listar_lembretes = assincrona(gastos_service.listar_lembretes)
+apagar_lembrete = assincrona(gastos_service.apagar_lembrete)
+
+# Categorias ensinadas pelo usuário
+ensinar_categoria = assincrona(categorias_aprendidas_service.ensinar_categoria)
+esquecer_categoria = assincrona(categorias_aprendidas_service.esquecer_categoria)
+listar_categorias_aprendidas = assincrona(categorias_aprendidas_service.listar_categorias_aprendidas)
+
+# E-mail
+salvar_credenciais_email = assincrona(email_service.salvar_credenciais_email)
+listar_emails_cadastrados = assincrona(email_service.listar_emails_cadastrados)
+buscar_credenciais_email = assincrona(email_service.buscar_credenciais_email)
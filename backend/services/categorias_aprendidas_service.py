@@ -0,0 +1,159 @@
+"""
+Categorias ensinadas pelo próprio usuário, consultadas antes do modelo. Cada schema
+tem em {schema}.categorias_aprendidas frases exatas e prefixos de palavra-chave
+("uber*" vale para "uber eats", "uber centro"...), sempre normalizados.
+O índice de cada schema é montado sob demanda e mantido em memória por um tempo.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from backend.services.db_init import conectar_bd
+from backend.services.roteador_service import TriePrefixos
+
+load_dotenv()
+
+# Por quanto tempo o índice de um schema é reaproveitado (outros workers veem o que foi ensinado após esse prazo)
+CATEGORIAS_APRENDIDAS_TTL = float(os.getenv("CATEGORIAS_APRENDIDAS_TTL", "300"))
+CATEGORIAS_APRENDIDAS_SCHEMAS_MAX = int(os.getenv("CATEGORIAS_APRENDIDAS_SCHEMAS_MAX", "500"))
+
+
+class IndiceCategorias:
+    """Frases exatas num dicionário e prefixos numa trie, ambos sobre o texto normalizado."""
+
+    def __init__(self, regras: list):
+        self.exatas = {}
+        self.prefixos = TriePrefixos()
+        self.total = 0
+        for padrao, tipo, categoria in regras:
+            if tipo == "prefixo":
+                self.prefixos.inserir(padrao, (padrao, categoria))
+            else:
+                self.exatas[padrao] = categoria
+            self.total += 1
+
+    def buscar(self, texto: str):
+        """
+        Categoria da frase exata ou, senão, do prefixo mais longo que comece numa
+        palavra da descrição e termine em fim de palavra. None se nada casar.
+        """
+        if not texto or not self.total:
+            return None
+        categoria = self.exatas.get(texto)
+        if categoria is not None:
+            return categoria
+
+        melhor = None
+        inicio = 0
+        while inicio < len(texto):
+            for padrao, categoria in self.prefixos.buscar(texto[inicio:]):
+                fim = inicio + len(padrao)
+                if fim == len(texto) or texto[fim] == " ":
+                    if melhor is None or len(padrao) > len(melhor[0]):
+                        melhor = (padrao, categoria)
+                    break
+            proximo = texto.find(" ", inicio)
+            if proximo < 0:
+                break
+            inicio = proximo + 1
+        return melhor[1] if melhor else None
+
+
+_indices = OrderedDict()
+_indices_lock = threading.Lock()
+_metricas = {"acertos": 0, "consultas": 0, "carregamentos": 0}
+
+
+def _carregar_regras(schema: str) -> list:
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT padrao, tipo, categoria FROM {schema}.categorias_aprendidas")
+    regras = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return regras
+
+
+def obter_indice(schema: str) -> IndiceCategorias:
+    agora = time.monotonic()
+    with _indices_lock:
+        item = _indices.get(schema)
+        if item is not None and item[0] > agora:
+            _indices.move_to_end(schema)
+            return item[1]
+
+    indice = IndiceCategorias(_carregar_regras(schema))
+    with _indices_lock:
+        _indices[schema] = (time.monotonic() + CATEGORIAS_APRENDIDAS_TTL, indice)
+        _indices.move_to_end(schema)
+        while len(_indices) > CATEGORIAS_APRENDIDAS_SCHEMAS_MAX:
+            _indices.popitem(last=False)
+        _metricas["carregamentos"] += 1
+    return indice
+
+
+def invalidar_indice(schema: str = None):
+    with _indices_lock:
+        if schema is None:
+            _indices.clear()
+        else:
+            _indices.pop(schema, None)
+
+
+def buscar_categorias_aprendidas(schema: str, textos_normalizados: list) -> list:
+    """Categoria aprendida (ou None) para cada descrição já normalizada."""
+    indice = obter_indice(schema)
+    resultado = [indice.buscar(texto) for texto in textos_normalizados]
+    with _indices_lock:
+        _metricas["consultas"] += len(resultado)
+        _metricas["acertos"] += sum(categoria is not None for categoria in resultado)
+    return resultado
+
+
+def ensinar_categoria(schema: str, padrao: str, categoria: str, prefixo: bool = False):
+    """Grava (ou substitui) a regra e descarta o índice em memória do schema."""
+    tipo = "prefixo" if prefixo else "exata"
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        INSERT INTO {schema}.categorias_aprendidas (padrao, tipo, categoria)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (padrao, tipo) DO UPDATE SET categoria = EXCLUDED.categoria, criado_em = NOW()
+    """, (padrao, tipo, categoria))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    invalidar_indice(schema)
+
+
+def esquecer_categoria(schema: str, padrao: str) -> bool:
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute(f"DELETE FROM {schema}.categorias_aprendidas WHERE padrao = %s", (padrao,))
+    sucesso = cursor.rowcount > 0
+    conn.commit()
+    cursor.close()
+    conn.close()
+    invalidar_indice(schema)
+    return sucesso
+
+
+def listar_categorias_aprendidas(schema: str) -> list:
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT padrao, tipo, categoria FROM {schema}.categorias_aprendidas ORDER BY padrao")
+    regras = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return regras
+
+
+def status_categorias_aprendidas() -> dict:
+    consultas = _metricas["consultas"]
+    return {
+        **_metricas,
+        "schemas_em_memoria": len(_indices),
+        "taxa_acerto": round(_metricas["acertos"] / consultas, 3) if consultas else 0.0,
+    }
@@ -0,0 +1,591 @@
+"""
+Classificação de descrições de gastos em categorias com modelos FastText (.bin ou
+.ftz quantizado) guardados em backend/models. Cada arquivo é uma versão, com o nome
+do arquivo sem extensão; a versão ativa fica em backend/models/ativo.txt, lido por
+todos os workers.
+
+Com MODELO_MODO=sidecar os workers não carregam o modelo: as classificações vão por
+socket Unix para um único processo (backend/services/classificador_sidecar.py), e a
+memória do modelo deixa de se multiplicar pelo número de workers.
+
+    python -m backend.services.categorizacao_service versoes
+    python -m backend.services.categorizacao_service ativar <versao>
+    python -m backend.services.categorizacao_service reverter
+    python -m backend.services.categorizacao_service quantizar <versao>
+    python -m backend.services.categorizacao_service reclassificar [--schema nome] [--lote 1000]
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import fasttext
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from backend.services.categorias_aprendidas_service import buscar_categorias_aprendidas
+from backend.services.db_init import conectar_bd
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+MODELOS_DIR = os.getenv("MODELOS_DIR", os.path.join("backend", "models"))
+# Modelo usado enquanto ativo.txt não existir
+CAMINHO_MODELO = os.getenv("MODELO_CATEGORIAS", os.path.join(MODELOS_DIR, "modelo_gastos_prod.bin"))
+MODELO_ATIVO_ARQUIVO = os.getenv("MODELO_ATIVO_ARQUIVO", os.path.join(MODELOS_DIR, "ativo.txt"))
+# Intervalo com que cada worker confere se a versão ativa mudou (0 desativa)
+MODELO_VERIFICAR_SEGUNDOS = float(os.getenv("MODELO_VERIFICAR_SEGUNDOS", "30"))
+EXTENSOES_MODELO = (".bin", ".ftz")
+# Frases usadas para aquecer e validar um modelo antes de colocá-lo em uso
+FRASES_AQUECIMENTO = ["uber", "ifood", "mercado", "farmácia", "aluguel", "gasolina posto", "netflix"]
+# "local": cada processo carrega o modelo; "sidecar": classifica pelo processo do socket
+MODELO_MODO = os.getenv("MODELO_MODO", "local").lower()
+CLASSIFICADOR_SOCKET = os.getenv("CLASSIFICADOR_SOCKET", "/tmp/whatsapp_gastos_classificador.sock")
+CLASSIFICADOR_TIMEOUT = float(os.getenv("CLASSIFICADOR_TIMEOUT", "5"))
+# Sidecar fora do ar: carregar o modelo no próprio worker em vez de falhar
+CLASSIFICADOR_FALLBACK_LOCAL = os.getenv("CLASSIFICADOR_FALLBACK_LOCAL", "true").lower() in ("1", "true", "sim")
+RECLASSIFICAR_LOTE = int(os.getenv("RECLASSIFICAR_LOTE", "1000"))
+TABELAS_CATEGORIZADAS = ("gastos", "fatura_cartao")
+# Descrições normalizadas já classificadas mantidas em memória
+CACHE_CATEGORIAS_MAX = int(os.getenv("CACHE_CATEGORIAS_MAX", "5000"))
+# Valor de modelo_versao quando a categoria veio do que o usuário ensinou
+VERSAO_APRENDIDA = "aprendida"
+
+
+class CacheCategorias:
+    """LRU de (versão do modelo, descrição normalizada, k, limiar) → previsões do modelo."""
+
+    def __init__(self, tamanho_max: int = CACHE_CATEGORIAS_MAX):
+        self.tamanho_max = tamanho_max
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self._acertos = 0
+        self._faltas = 0
+        self._invalidacoes = 0
+
+    def obter(self, chave):
+        with self._lock:
+            previsao = self._itens.get(chave)
+            if previsao is None:
+                self._faltas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self._acertos += 1
+            return previsao
+
+    def guardar(self, chave, previsao):
+        if self.tamanho_max <= 0:
+            return
+        with self._lock:
+            self._itens[chave] = previsao
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._invalidacoes += 1
+
+    def status(self) -> dict:
+        consultas = self._acertos + self._faltas
+        return {
+            "entradas": len(self._itens),
+            "tamanho_max": self.tamanho_max,
+            "acertos": self._acertos,
+            "faltas": self._faltas,
+            "invalidacoes": self._invalidacoes,
+            "taxa_acerto": round(self._acertos / consultas, 3) if consultas else 0.0,
+        }
+
+
+cache_categorias = CacheCategorias()
+
+
+def normalizar_descricao(descricao) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados: "  Café  da MANHÃ" → "cafe da manha"."""
+    sem_acentos = unicodedata.normalize("NFKD", str(descricao or "").lower())
+    sem_acentos = "".join(c for c in sem_acentos if not unicodedata.combining(c))
+    return " ".join(sem_acentos.split())
+
+
+def _limpar(descricao) -> str:
+    # O FastText não aceita quebras de linha na entrada de predict
+    return " ".join(str(descricao or "").split())
+
+
+def versao_do_arquivo(caminho: str) -> str:
+    return os.path.splitext(os.path.basename(caminho))[0]
+
+
+@dataclass
+class ModeloCarregado:
+    versao: str
+    caminho: str
+    modelo: object
+    carregado_em: float = field(default_factory=time.time)
+    segundos_carga: float = 0.0
+
+
+class RegistroModelos:
+    """
+    Mantém o modelo em uso e o anterior. Um novo modelo é carregado e aquecido fora
+    do lock; só a troca de referência é protegida, então classificações em andamento
+    terminam com o modelo antigo e as seguintes já usam o novo.
+    ativo.txt guarda a pilha de versões (a primeira linha é a ativa), o que permite
+    reverter e faz os outros workers seguirem a mesma versão.
+    """
+
+    def __init__(self, diretorio: str = MODELOS_DIR, arquivo_ativo: str = MODELO_ATIVO_ARQUIVO,
+                 caminho_padrao: str = CAMINHO_MODELO):
+        self.diretorio = diretorio
+        self.arquivo_ativo = arquivo_ativo
+        self.caminho_padrao = caminho_padrao
+        self._atual = None
+        self._anterior = None
+        self._lock = threading.Lock()
+        self._carga_lock = threading.Lock()
+        self._monitor = None
+        self._trocas = 0
+
+    def listar_versoes(self) -> dict:
+        versoes = {}
+        if os.path.isdir(self.diretorio):
+            for nome in sorted(os.listdir(self.diretorio)):
+                if nome.endswith(EXTENSOES_MODELO):
+                    versoes[versao_do_arquivo(nome)] = os.path.join(self.diretorio, nome)
+        if os.path.exists(self.caminho_padrao):
+            versoes.setdefault(versao_do_arquivo(self.caminho_padrao), self.caminho_padrao)
+        return versoes
+
+    def _caminho(self, versao: str) -> str:
+        caminho = self.listar_versoes().get(versao)
+        if caminho is None:
+            raise ValueError(f"Versão de modelo desconhecida: {versao}")
+        return caminho
+
+    def _ler_pilha(self) -> list:
+        try:
+            with open(self.arquivo_ativo, encoding="utf-8") as f:
+                return [linha.strip() for linha in f if linha.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _gravar_pilha(self, pilha: list):
+        temporario = f"{self.arquivo_ativo}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write("\n".join(pilha[:20]) + "\n")
+        os.replace(temporario, self.arquivo_ativo)
+
+    def carregar(self, versao: str) -> ModeloCarregado:
+        """Carrega e aquece uma versão sem colocá-la em uso; falha se o modelo não responder."""
+        caminho = self._caminho(versao)
+        inicio = time.perf_counter()
+        modelo = fasttext.load_model(caminho)
+        rotulos, _ = modelo.predict(FRASES_AQUECIMENTO, k=1)
+        if len(rotulos) != len(FRASES_AQUECIMENTO) or not all(rotulos):
+            raise RuntimeError(f"Modelo {versao} não produziu previsões no aquecimento")
+        carregado = ModeloCarregado(versao, caminho, modelo, segundos_carga=time.perf_counter() - inicio)
+        logger.info("🧠 Modelo %s carregado de %s em %.2fs", versao, caminho, carregado.segundos_carga)
+        return carregado
+
+    def _trocar(self, novo: ModeloCarregado):
+        with self._lock:
+            self._anterior, self._atual = self._atual, novo
+            self._trocas += 1
+        # Previsões em cache vieram de outro modelo
+        cache_categorias.limpar()
+
+    def atual(self) -> ModeloCarregado:
+        atual = self._atual
+        if atual is None:
+            with self._carga_lock:
+                if self._atual is None:
+                    pilha = self._ler_pilha()
+                    versao = pilha[0] if pilha else versao_do_arquivo(self.caminho_padrao)
+                    self._trocar(self.carregar(versao))
+                atual = self._atual
+        return atual
+
+    def ativar(self, versao: str, persistir: bool = True) -> ModeloCarregado:
+        """Carrega, aquece e troca atomicamente para `versao`; com `persistir`, os outros workers seguem."""
+        with self._carga_lock:
+            if self._atual is not None and self._atual.versao == versao:
+                novo = self._atual
+            else:
+                novo = self.carregar(versao)
+                self._trocar(novo)
+            if persistir:
+                pilha = [v for v in self._ler_pilha() if v != versao]
+                self._gravar_pilha([versao] + pilha)
+        logger.info("🔁 Modelo ativo: %s", versao)
+        return novo
+
+    def ativar_em_segundo_plano(self, versao: str) -> threading.Thread:
+        thread = threading.Thread(target=self.ativar, args=(versao,), name=f"modelo-{versao}", daemon=True)
+        thread.start()
+        return thread
+
+    def reverter(self) -> ModeloCarregado:
+        """Volta para a versão anterior: a que ainda está em memória ou a próxima de ativo.txt."""
+        with self._carga_lock:
+            pilha = self._ler_pilha()
+            atual = self._atual.versao if self._atual else (pilha[0] if pilha else None)
+            restantes = [v for v in pilha if v != atual]
+            if self._anterior is not None and self._anterior.versao != atual:
+                destino = self._anterior
+            elif restantes:
+                destino = self.carregar(restantes[0])
+            else:
+                raise ValueError("Não há versão anterior para reverter")
+            self._trocar(destino)
+            self._gravar_pilha([destino.versao] + [v for v in restantes if v != destino.versao])
+        logger.info("↩️ Modelo revertido para %s", destino.versao)
+        return destino
+
+    def sincronizar(self):
+        """Ativa (sem regravar ativo.txt) a versão indicada no arquivo, se for outra."""
+        pilha = self._ler_pilha()
+        if pilha and self._atual is not None and pilha[0] != self._atual.versao:
+            try:
+                self.ativar(pilha[0], persistir=False)
+            except Exception as e:
+                logger.error("❌ Não foi possível ativar o modelo %s: %s", pilha[0], e)
+
+    def iniciar_monitoramento(self, intervalo: float = MODELO_VERIFICAR_SEGUNDOS):
+        if intervalo <= 0 or self._monitor is not None:
+            return
+
+        def monitorar():
+            while True:
+                time.sleep(intervalo)
+                self.sincronizar()
+
+        self._monitor = threading.Thread(target=monitorar, name="modelo-monitor", daemon=True)
+        self._monitor.start()
+
+    def status(self) -> dict:
+        atual, anterior = self._atual, self._anterior
+        return {
+            "versao": atual.versao if atual else None,
+            "caminho": atual.caminho if atual else None,
+            "carregado_em": atual.carregado_em if atual else None,
+            "segundos_carga": round(atual.segundos_carga, 2) if atual else None,
+            "anterior": anterior.versao if anterior else None,
+            "trocas": self._trocas,
+            "disponiveis": list(self.listar_versoes()),
+        }
+
+
+registro_modelos = RegistroModelos()
+
+
+class ClienteClassificador:
+    """
+    Cliente do sidecar: uma conexão persistente por thread, pedidos e respostas em
+    JSON, uma linha cada. Reconecta uma vez se a conexão tiver caído.
+    """
+
+    def __init__(self, caminho: str = CLASSIFICADOR_SOCKET, timeout: float = CLASSIFICADOR_TIMEOUT):
+        self.caminho = caminho
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _arquivo(self):
+        arquivo = getattr(self._local, "arquivo", None)
+        if arquivo is None:
+            conexao = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conexao.settimeout(self.timeout)
+            conexao.connect(self.caminho)
+            self._local.conexao = conexao
+            self._local.arquivo = arquivo = conexao.makefile("rwb")
+        return arquivo
+
+    def _fechar(self):
+        for nome in ("arquivo", "conexao"):
+            objeto = getattr(self._local, nome, None)
+            if objeto is not None:
+                try:
+                    objeto.close()
+                except OSError:
+                    pass
+            setattr(self._local, nome, None)
+
+    def chamar(self, pedido: dict) -> dict:
+        for tentativa in (1, 2):
+            try:
+                arquivo = self._arquivo()
+                arquivo.write(json.dumps(pedido).encode() + b"\n")
+                arquivo.flush()
+                linha = arquivo.readline()
+                if not linha:
+                    raise ConnectionError("sidecar encerrou a conexão")
+                resposta = json.loads(linha)
+                break
+            except OSError:
+                self._fechar()
+                if tentativa == 2:
+                    raise
+        if "erro" in resposta:
+            raise RuntimeError(resposta["erro"])
+        return resposta
+
+
+cliente_sidecar = ClienteClassificador() if MODELO_MODO == "sidecar" else None
+
+
+def carregar_modelo():
+    """Garante o modelo ativo carregado neste processo e o devolve."""
+    return registro_modelos.atual().modelo
+
+
+def preparar_classificador():
+    """Na subida do worker: carrega o modelo local ou confere se o sidecar responde."""
+    if cliente_sidecar is None:
+        carregar_modelo()
+        return
+    try:
+        logger.info("🧠 Classificação pelo sidecar em %s (modelo %s)",
+                    cliente_sidecar.caminho, cliente_sidecar.chamar({"op": "status"})["versao"])
+    except OSError as e:
+        logger.warning("⚠️ Sidecar de classificação indisponível em %s: %s", cliente_sidecar.caminho, e)
+
+
+def iniciar_monitoramento_modelo():
+    # No modo sidecar quem acompanha ativo.txt é o próprio sidecar
+    if cliente_sidecar is None:
+        registro_modelos.iniciar_monitoramento()
+
+
+def _resumo_ativo(ativo: ModeloCarregado) -> dict:
+    return {"versao": ativo.versao, "segundos_carga": round(ativo.segundos_carga, 2)}
+
+
+def ativar_modelo(versao: str) -> dict:
+    if cliente_sidecar is not None:
+        return cliente_sidecar.chamar({"op": "ativar", "versao": versao})
+    return _resumo_ativo(registro_modelos.ativar(versao))
+
+
+def reverter_modelo() -> dict:
+    if cliente_sidecar is not None:
+        return cliente_sidecar.chamar({"op": "reverter"})
+    return _resumo_ativo(registro_modelos.reverter())
+
+
+def status_modelo() -> dict:
+    if cliente_sidecar is not None:
+        try:
+            return {"modo": "sidecar", **cliente_sidecar.chamar({"op": "status"})}
+        except OSError as e:
+            return {"modo": "sidecar", "erro": str(e)}
+    return {"modo": "local", **registro_modelos.status()}
+
+
+def _prever(modelo, descricoes: list, k: int, limiar: float) -> list:
+    rotulos, probabilidades = modelo.predict([_limpar(d) for d in descricoes], k=k, threshold=limiar)
+    return [
+        [(rotulo.replace("__label__", ""), float(prob)) for rotulo, prob in zip(rotulos_desc, probs_desc)]
+        for rotulos_desc, probs_desc in zip(rotulos, probabilidades)
+    ]
+
+
+def classificar_lote_versionado(descricoes: list, k: int = 1, limiar: float = 0.0, usar_cache: bool = True) -> tuple:
+    """Como classificar_lote, devolvendo também a versão do modelo que fez as previsões."""
+    if cliente_sidecar is not None:
+        try:
+            resposta = cliente_sidecar.chamar({
+                "op": "classificar", "descricoes": [_limpar(d) for d in descricoes],
+                "k": k, "limiar": limiar, "usar_cache": usar_cache,
+            })
+            return resposta["versao"], [[tuple(par) for par in previsao] for previsao in resposta["previsoes"]]
+        except (OSError, ValueError) as e:
+            if not CLASSIFICADOR_FALLBACK_LOCAL:
+                raise
+            logger.error("❌ Sidecar de classificação falhou (%s); usando o modelo local", e)
+    return _classificar_local(descricoes, k, limiar, usar_cache)
+
+
+def _classificar_local(descricoes: list, k: int, limiar: float, usar_cache: bool) -> tuple:
+    # Uma única referência para o lote inteiro: uma troca no meio não mistura versões
+    ativo = registro_modelos.atual()
+    if not descricoes:
+        return ativo.versao, []
+    if not usar_cache:
+        return ativo.versao, _prever(ativo.modelo, descricoes, k, limiar)
+
+    chaves = [(ativo.versao, normalizar_descricao(d), k, limiar) for d in descricoes]
+    resultado = [cache_categorias.obter(chave) for chave in chaves]
+    faltantes = {}
+    for descricao, chave, previsao in zip(descricoes, chaves, resultado):
+        if previsao is None:
+            faltantes.setdefault(chave, descricao)
+    if faltantes:
+        novas = dict(zip(faltantes, _prever(ativo.modelo, list(faltantes.values()), k, limiar)))
+        for chave, previsao in novas.items():
+            cache_categorias.guardar(chave, previsao)
+        resultado = [previsao if previsao is not None else novas[chave] for chave, previsao in zip(chaves, resultado)]
+    return ativo.versao, resultado
+
+
+def classificar_lote(descricoes: list, k: int = 1, limiar: float = 0.0, usar_cache: bool = True) -> list:
+    """
+    Classifica várias descrições numa única chamada ao modelo. Para cada descrição
+    devolve até `k` pares (categoria, probabilidade), da mais provável para a menos.
+    Com `usar_cache`, descrições que normalizam para o mesmo texto compartilham a
+    previsão em cache e só as ausentes (sem repetição) vão ao modelo.
+    """
+    return classificar_lote_versionado(descricoes, k, limiar, usar_cache)[1]
+
+
+def classificar_lote_usuario(schema: str, descricoes: list, usar_cache: bool = True) -> list:
+    """
+    (categoria, probabilidade, versão) de cada descrição. As categorias que o usuário
+    ensinou (categorias_aprendidas do schema) vêm primeiro, com probabilidade 1.0 e
+    versão VERSAO_APRENDIDA; só as demais vão ao modelo, num único lote.
+    """
+    resultado = [None] * len(descricoes)
+    if schema:
+        try:
+            aprendidas = buscar_categorias_aprendidas(schema, [normalizar_descricao(d) for d in descricoes])
+            resultado = [(c, 1.0, VERSAO_APRENDIDA) if c is not None else None for c in aprendidas]
+        except Exception as e:
+            logger.error("❌ Erro ao consultar categorias aprendidas de %s: %s", schema, e)
+
+    faltantes = [i for i, item in enumerate(resultado) if item is None]
+    if faltantes:
+        versao, previsoes = classificar_lote_versionado([descricoes[i] for i in faltantes], usar_cache=usar_cache)
+        for i, previsao in zip(faltantes, previsoes):
+            categoria, probabilidade = previsao[0] if previsao else (None, 0.0)
+            resultado[i] = (categoria, probabilidade, versao)
+    return resultado
+
+
+def definir_categoria_versionada(descricao: str, schema: str = None) -> tuple:
+    """(categoria, probabilidade, versão do modelo) da descrição; com `schema`, consulta antes o que o usuário ensinou."""
+    return classificar_lote_usuario(schema, [descricao])[0]
+
+
+def definir_categoria(descricao: str, schema: str = None):
+    """
+    Usa o modelo FastText para prever a categoria a partir da descrição.
+    """
+    categoria, probabilidade, _ = definir_categoria_versionada(descricao, schema)
+    return categoria, probabilidade
+
+
+def quantizar_modelo(versao: str, cutoff: int = 0) -> str:
+    """Gera `<versao>_q.ftz` (quantizado, bem menor em memória) a partir de uma versão .bin."""
+    caminho = registro_modelos._caminho(versao)
+    modelo = fasttext.load_model(caminho)
+    modelo.quantize(cutoff=cutoff, retrain=False)
+    destino = os.path.join(registro_modelos.diretorio, f"{versao}_q.ftz")
+    modelo.save_model(destino)
+    logger.info("🗜️ %s (%.1f MB) quantizado em %s (%.1f MB)", caminho, os.path.getsize(caminho) / 2**20,
+                destino, os.path.getsize(destino) / 2**20)
+    return destino
+
+
+def reclassificar_tabela(schema: str, tabela: str, tamanho_lote: int = RECLASSIFICAR_LOTE) -> dict:
+    """
+    Percorre `tabela` em lotes por id, classifica cada lote numa chamada ao modelo
+    (respeitando as categorias ensinadas pelo usuário) e grava só as categorias que
+    mudaram com um UPDATE ... FROM (VALUES ...) por lote. Cada lote é uma transação curta.
+    """
+    lidas = alteradas = 0
+    ultimo_id = 0
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute(f"""
+                SELECT id, descricao, categoria FROM {schema}.{tabela}
+                WHERE id > %s ORDER BY id LIMIT %s
+            """, (ultimo_id, tamanho_lote))
+            linhas = cursor.fetchall()
+            if not linhas:
+                break
+            ultimo_id = linhas[-1][0]
+            lidas += len(linhas)
+
+            # Sem cache: o histórico expulsaria as descrições frequentes do LRU
+            previstas = classificar_lote_usuario(schema, [descricao for _, descricao, _ in linhas], usar_cache=False)
+            mudancas = [
+                (id_, prevista, versao)
+                for (id_, _, categoria), (prevista, _, versao) in zip(linhas, previstas)
+                if prevista is not None and prevista != categoria
+            ]
+            if mudancas:
+                execute_values(cursor, f"""
+                    UPDATE {schema}.{tabela} AS t SET categoria = v.categoria, modelo_versao = v.modelo_versao
+                    FROM (VALUES %s) AS v(id, categoria, modelo_versao)
+                    WHERE t.id = v.id
+                """, mudancas, page_size=len(mudancas))
+                alteradas += len(mudancas)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    return {"lidas": lidas, "alteradas": alteradas}
+
+
+def reclassificar_schema(schema: str, tamanho_lote: int = RECLASSIFICAR_LOTE) -> dict:
+    """Reclassifica gastos e fatura_cartao do usuário e reconstrói o resumo mensal, que é agregado por categoria."""
+    from backend.services.resumo_service import reconstruir_resumo_schema
+
+    inicio = time.perf_counter()
+    resultado = {tabela: reclassificar_tabela(schema, tabela, tamanho_lote) for tabela in TABELAS_CATEGORIZADAS}
+    if any(r["alteradas"] for r in resultado.values()):
+        reconstruir_resumo_schema(schema)
+    duracao = time.perf_counter() - inicio
+    lidas = sum(r["lidas"] for r in resultado.values())
+    logger.info("🏷️ %s reclassificado: %s em %.1fs (%.0f linhas/s)",
+                schema, resultado, duracao, lidas / duracao if duracao else 0)
+    return {**resultado, "segundos": round(duracao, 2)}
+
+
+def main():
+    from backend.services.migracoes_service import listar_schemas_tenant
+
+    parser = argparse.ArgumentParser(description="Versões do modelo de categorias e reclassificação do histórico.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    comandos.add_parser("versoes", help="lista as versões disponíveis e a ativa")
+    ativar = comandos.add_parser("ativar", help="ativa uma versão em todos os workers")
+    ativar.add_argument("versao")
+    comandos.add_parser("reverter", help="volta para a versão anterior")
+    quantizar = comandos.add_parser("quantizar", help="gera uma versão .ftz quantizada")
+    quantizar.add_argument("versao")
+    quantizar.add_argument("--cutoff", type=int, default=0, help="mantém só as N palavras mais relevantes")
+    reclassificar = comandos.add_parser("reclassificar", help="reclassifica o histórico com o modelo ativo")
+    reclassificar.add_argument("--schema", help="reclassifica apenas o schema informado")
+    reclassificar.add_argument("--lote", type=int, default=RECLASSIFICAR_LOTE, help="linhas por lote")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    if args.comando == "versoes":
+        pilha = registro_modelos._ler_pilha()
+        for versao, caminho in registro_modelos.listar_versoes().items():
+            marcador = "*" if pilha and pilha[0] == versao else " "
+            print(f"{marcador} {versao}  {caminho}")
+    elif args.comando == "ativar":
+        print(f"ativo: {registro_modelos.ativar(args.versao).versao}")
+    elif args.comando == "reverter":
+        print(f"ativo: {registro_modelos.reverter().versao}")
+    elif args.comando == "quantizar":
+        print(quantizar_modelo(args.versao, args.cutoff))
+    else:
+        for schema in [args.schema] if args.schema else listar_schemas_tenant():
+            print(f"{schema}: {reclassificar_schema(schema, args.lote)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Processo único que mantém o modelo de categorias em memória e atende os workers
+(MODELO_MODO=sidecar) por socket Unix. Cada linha recebida é um pedido JSON:
+
+    {"op": "classificar", "descricoes": [...], "k": 1, "limiar": 0.0, "usar_cache": true}
+    {"op": "status"} | {"op": "ativar", "versao": "..."} | {"op": "reverter"}
+
+Subir antes dos workers:
+    python -m backend.services.classificador_sidecar
+"""
+import json
+import logging
+import os
+import socketserver
+
+from backend.services import categorizacao_service as categorizacao
+from backend.services.memoria_service import uso_memoria
+
+logger = logging.getLogger(__name__)
+
+
+def atender(pedido: dict) -> dict:
+    operacao = pedido.get("op")
+    if operacao == "classificar":
+        versao, previsoes = categorizacao._classificar_local(
+            pedido["descricoes"], int(pedido.get("k", 1)), float(pedido.get("limiar", 0.0)),
+            bool(pedido.get("usar_cache", True)),
+        )
+        return {"versao": versao, "previsoes": previsoes}
+    if operacao == "status":
+        return {
+            **categorizacao.registro_modelos.status(),
+            "cache": categorizacao.cache_categorias.status(),
+            "memoria": uso_memoria(),
+        }
+    if operacao == "ativar":
+        return categorizacao._resumo_ativo(categorizacao.registro_modelos.ativar(pedido["versao"]))
+    if operacao == "reverter":
+        return categorizacao._resumo_ativo(categorizacao.registro_modelos.reverter())
+    raise ValueError(f"Operação desconhecida: {operacao}")
+
+
+class _Conexao(socketserver.StreamRequestHandler):
+    """Uma conexão por thread de worker; atende pedidos até o cliente fechar."""
+
+    def handle(self):
+        for linha in self.rfile:
+            try:
+                resposta = atender(json.loads(linha))
+            except Exception as e:
+                logger.exception("❌ Erro ao atender pedido do sidecar:")
+                resposta = {"erro": str(e)}
+            self.wfile.write(json.dumps(resposta).encode() + b"\n")
+            self.wfile.flush()
+
+
+class ServidorClassificador(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    # Este processo é o dono do modelo: nunca encaminha para si mesmo
+    categorizacao.cliente_sidecar = None
+    categorizacao.carregar_modelo()
+    categorizacao.registro_modelos.iniciar_monitoramento()
+
+    caminho = categorizacao.CLASSIFICADOR_SOCKET
+    if os.path.exists(caminho):
+        os.unlink(caminho)
+    with ServidorClassificador(caminho, _Conexao) as servidor:
+        os.chmod(caminho, 0o660)
+        logger.info("🧠 Sidecar de classificação em %s (modelo %s, %s)", caminho,
+                    categorizacao.registro_modelos.status()["versao"], uso_memoria())
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(caminho)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import logging
+import threading
+import time
+import pytz
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 import os
 
@@ -9,80 +15,302 @@ load_dotenv()
 # Configuração
 logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Tempo máximo esperando uma conexão livre antes de desistir
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Conexões paradas há mais tempo que isso passam por um SELECT 1 antes de serem entregues
+DB_POOL_VERIFICAR_APOS = float(os.getenv("DB_POOL_VERIFICAR_APOS", "30"))
+
+
+class PoolEsgotadoError(psycopg2.OperationalError):
+    """Nenhuma conexão ficou livre dentro de DB_POOL_TIMEOUT."""
+
+
+class PoolConexoes:
+    """
+    Pool de conexões compartilhado pelo processo inteiro. Diferente do
+    ThreadedConnectionPool puro, espera por uma vaga em vez de falhar na hora,
+    descarta conexões quebradas e mede tempo de espera e utilização.
+    """
+
+    def __init__(self, dsn, minimo=DB_POOL_MIN, maximo=DB_POOL_MAX,
+                 timeout=DB_POOL_TIMEOUT, verificar_apos=DB_POOL_VERIFICAR_APOS):
+        self.dsn = dsn
+        self.minimo = max(0, minimo)
+        self.maximo = max(1, maximo, self.minimo)
+        self.timeout = timeout
+        self.verificar_apos = verificar_apos
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._vagas = threading.BoundedSemaphore(self.maximo)
+        self._devolvida_em = {}
+        self._emprestimos = 0
+        self._em_uso = 0
+        self._pico_em_uso = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._descartadas = 0
+        self._timeouts = 0
+
+    def _obter_pool(self):
+        # Após um fork o pool herdado não pode ser reaproveitado: cada processo cria o seu
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(self.minimo, self.maximo, self.dsn)
+                    self._pid = os.getpid()
+                    self._vagas = threading.BoundedSemaphore(self.maximo)
+                    self._devolvida_em = {}
+                    self._em_uso = 0
+                    logger.info("🔌 Pool de conexões criado (min=%d, max=%d)", self.minimo, self.maximo)
+        return self._pool
+
+    def emprestar(self):
+        pool = self._obter_pool()
+        inicio = time.monotonic()
+        if not self._vagas.acquire(timeout=self.timeout):
+            self._timeouts += 1
+            raise PoolEsgotadoError(f"Nenhuma conexão livre após {self.timeout:.1f}s (máximo {self.maximo})")
+
+        try:
+            conn = self._obter_saudavel(pool)
+        except Exception:
+            self._vagas.release()
+            raise
+
+        espera = time.monotonic() - inicio
+        with self._lock:
+            self._emprestimos += 1
+            self._em_uso += 1
+            self._pico_em_uso = max(self._pico_em_uso, self._em_uso)
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        return conn
+
+    def _obter_saudavel(self, pool):
+        for _ in range(self.maximo + 1):
+            conn = pool.getconn()
+            if self._saudavel(conn):
+                return conn
+            self._devolvida_em.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            self._descartadas += 1
+            logger.warning("♻️ Conexão quebrada descartada do pool")
+        raise psycopg2.OperationalError("Não foi possível obter uma conexão saudável do pool")
+
+    def _saudavel(self, conn) -> bool:
+        if conn.closed:
+            return False
+        devolvida_em = self._devolvida_em.get(id(conn))
+        if devolvida_em is None or time.monotonic() - devolvida_em < self.verificar_apos:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def devolver(self, conn, descartar=False):
+        try:
+            if not conn.closed and not descartar:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+        except psycopg2.Error:
+            descartar = True
+
+        descartar = descartar or bool(conn.closed)
+        if descartar:
+            self._devolvida_em.pop(id(conn), None)
+            self._descartadas += 1
+        else:
+            self._devolvida_em[id(conn)] = time.monotonic()
+        try:
+            self._obter_pool().putconn(conn, close=descartar)
+        finally:
+            with self._lock:
+                self._em_uso -= 1
+            self._vagas.release()
+
+    def fechar(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    def status(self) -> dict:
+        return {
+            "minimo": self.minimo,
+            "maximo": self.maximo,
+            "em_uso": self._em_uso,
+            "pico_em_uso": self._pico_em_uso,
+            "utilizacao": round(self._em_uso / self.maximo, 2),
+            "emprestimos": self._emprestimos,
+            "espera_media_ms": round(1000 * self._espera_total / self._emprestimos, 2) if self._emprestimos else 0.0,
+            "espera_max_ms": round(1000 * self._espera_max, 2),
+            "descartadas": self._descartadas,
+            "timeouts": self._timeouts,
+        }
+
+
+class ConexaoEmprestada:
+    """
+    Conexão do pool com a mesma interface da conexão do psycopg2. `close()`
+    devolve a conexão ao pool em vez de fechá-la. Como context manager faz
+    commit (ou rollback, se houver exceção) e devolve ao sair do bloco.
+    """
+
+    def __init__(self, pool: PoolConexoes):
+        self._pool = pool
+        self._conn = pool.emprestar()
+
+    def __getattr__(self, nome):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise psycopg2.InterfaceError("Conexão já devolvida ao pool")
+        return getattr(conn, nome)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.devolver(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_exc, exc, tb):
+        try:
+            if self._conn is not None and not self._conn.closed:
+                if tipo_exc is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+
+    def __del__(self):
+        # Rede de segurança para caminhos de erro que não chamam close()
+        if self.__dict__.get("_conn") is not None:
+            logger.warning("⚠️ Conexão não devolvida explicitamente, devolvendo ao pool")
+            self.close()
+
+
+pool_conexoes = PoolConexoes(DATABASE_URL)
+
+# Partições diárias de mensagens_recebidas mais antigas que isso são removidas
+MENSAGENS_RETENCAO_DIAS = int(os.getenv("MENSAGENS_RETENCAO_DIAS", "30"))
+# Quantos dias à frente já ficam com partição criada
+MENSAGENS_PARTICOES_FUTURAS = int(os.getenv("MENSAGENS_PARTICOES_FUTURAS", "3"))
+# O dia das partições é o mesmo das mensagens (horário de Brasília), não o do servidor
+FUSO_MENSAGENS = pytz.timezone("America/Sao_Paulo")
+
+def hoje_mensagens() -> date:
+    return datetime.now(FUSO_MENSAGENS).date()
 
 # 🔌 Conexão reutilizável
 def conectar_bd():
-    return psycopg2.connect(DATABASE_URL)
+    """Empresta uma conexão do pool do processo; `close()` (ou sair do `with`) a devolve."""
+    return ConexaoEmprestada(pool_conexoes)
 
 def inicializar_bd(DATABASE_URL):
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS gastos (
-            id SERIAL PRIMARY KEY,
-            descricao TEXT,
-            valor REAL,
-            categoria TEXT,
-            meio_pagamento TEXT,
-            parcelas INT DEFAULT 1,
-            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS salario (
-            id SERIAL PRIMARY KEY,
-            valor REAL,
-            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS fatura_cartao (
-        id SERIAL PRIMARY KEY,
-        descricao TEXT,
-        valor REAL,
-        categoria TEXT,
-        meio_pagamento TEXT,
-        parcela TEXT,
-        data_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        data_fim DATE
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS lembretes (
-            id SERIAL PRIMARY KEY,
-            telefone TEXT,
-            mensagem TEXT,
-            cron TEXT,
-            data_inclusao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    """
+    Aplica as migrações pendentes do schema public (tabelas, índices, partições) e dos
+    schemas dos usuários. Roda na subida de cada worker: o lock por schema faz os demais
+    esperarem e encontrarem tudo em dia.
+    """
+    from backend.services.migracoes_service import migrar_publico, migrar_todos_tenants
+    migrar_publico()
+    migrar_todos_tenants()
+
+def nome_particao_mensagens(dia: date) -> str:
+    return f"mensagens_recebidas_p{dia:%Y%m%d}"
+
+def criar_tabela_mensagens(cursor):
+    """
+    Cria mensagens_recebidas particionada por dia. A chave de partição é a data do
+    timestamp da própria mensagem no WhatsApp, que se repete nos reenvios da Meta:
+    assim a deduplicação (PK mensagem_id + data_mensagem) consulta uma única partição.
+    Uma tabela antiga, não particionada, é renomeada para mensagens_recebidas_legado
+    e os registros do último dia são copiados para a nova.
+    """
+    cursor.execute("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relname = 'mensagens_recebidas'
+    """)
+    resultado = cursor.fetchone()
+    legado = resultado is not None and resultado[0] == 'r'
+    if legado:
+        cursor.execute("ALTER TABLE mensagens_recebidas RENAME TO mensagens_recebidas_legado")
+        logger.info("📦 mensagens_recebidas antiga renomeada para mensagens_recebidas_legado")
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS mensagens_recebidas (
-            id SERIAL PRIMARY KEY,
-            mensagem_id TEXT UNIQUE,
+            mensagem_id TEXT NOT NULL,
             telefone TEXT,
-            data_recebida TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id SERIAL PRIMARY KEY,
-            nome TEXT,
-            telefone TEXT UNIQUE,
-            autorizado BOOLEAN DEFAULT false,
-            data_inclusao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tokens_ativos (
-            id SERIAL PRIMARY KEY,
-            telefone TEXT NOT NULL,
-            token TEXT NOT NULL UNIQUE,
-            schema TEXT NOT NULL,
-            criado_em TIMESTAMP NOT NULL DEFAULT NOW(),
-            expira_em TIMESTAMP NOT NULL
-        )
+            tipo TEXT,
+            data_mensagem DATE NOT NULL,
+            data_processamento TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (mensagem_id, data_mensagem)
+        ) PARTITION BY RANGE (data_mensagem)
     ''')
+    hoje = hoje_mensagens()
+    garantir_particoes_mensagens(cursor, hoje - timedelta(days=1), hoje + timedelta(days=MENSAGENS_PARTICOES_FUTURAS))
+
+    if legado:
+        cursor.execute("""
+            INSERT INTO mensagens_recebidas (mensagem_id, telefone, data_mensagem)
+            SELECT mensagem_id, telefone, data_recebida::date
+            FROM mensagens_recebidas_legado
+            WHERE mensagem_id IS NOT NULL AND data_recebida >= CURRENT_DATE - 1
+            ON CONFLICT DO NOTHING
+        """)
+
+def garantir_particoes_mensagens(cursor, inicio: date, fim: date):
+    """Cria (se faltarem) as partições diárias de `inicio` até `fim`, inclusive."""
+    dia = inicio
+    while dia <= fim:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {nome_particao_mensagens(dia)}
+            PARTITION OF mensagens_recebidas
+            FOR VALUES FROM (%s) TO (%s)
+        """, (dia, dia + timedelta(days=1)))
+        dia += timedelta(days=1)
+
+def manter_particoes_mensagens(retencao_dias: int = MENSAGENS_RETENCAO_DIAS) -> list:
+    """
+    Job diário: cria as partições dos próximos dias e remove as mais antigas que a
+    janela de retenção. Retorna os nomes das partições removidas.
+    """
+    hoje = hoje_mensagens()
+    limite = hoje - timedelta(days=retencao_dias)
+    removidas = []
+
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    garantir_particoes_mensagens(cursor, hoje, hoje + timedelta(days=MENSAGENS_PARTICOES_FUTURAS))
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'mensagens_recebidas'
+    """)
+    for (nome,) in cursor.fetchall():
+        try:
+            dia = datetime.strptime(nome.rsplit("_p", 1)[1], "%Y%m%d").date()
+        except (IndexError, ValueError):
+            continue
+        if dia < limite:
+            cursor.execute(f"DROP TABLE IF EXISTS {nome}")
+            removidas.append(nome)
     conn.commit()
     cursor.close()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+    if removidas:
+        logger.info("🧹 Partições de mensagens removidas: %s", ", ".join(removidas))
+    return removidas
@@ -0,0 +1,484 @@
+"""
+Leitura de QR Codes e códigos de barras em fotos, com os decodificadores baratos primeiro.
+
+Antes das etapas, uma cópia reduzida da foto é varrida atrás de onde o código está (o
+QR Code que o OpenCV localiza e áreas de barras achadas pelo gradiente); as etapas 1 e 2
+rodam primeiro nesses recortes e só depois na foto inteira, reduzida para no máximo
+DECODIFICACAO_MAX_LADO pixels de lado.
+
+1. `rapida`: pyzbar e OpenCV na imagem em cinza e binarizada por Otsu;
+2. `variantes`: rotações × limiares × morfologias, geradas sob demanda, ainda só
+   com pyzbar e OpenCV;
+3. `zxing`: o ZXing (JVM, o passo mais caro) roda só no fim, sobre as melhores candidatas.
+   Com ZXING_MODO=processo (padrão) as candidatas vão em bytes para uma JVM que fica de
+   pé entre as leituras (zxing_service); ZXING_MODO=pyzxing volta ao BarCodeReader, que
+   sobe uma JVM por imagem.
+
+Cada etapa é cronometrada e o resultado informa qual delas decodificou o código.
+
+Com DECODIFICACAO_MODO=processos a grade de variantes é dividida entre processos: a
+imagem vai por memória compartilhada (sem cópia serializada) e, quando um processo lê
+o código, uma flag na mesma memória faz os outros pararem. Nesse modo `validar`
+precisa ser serializável (função de módulo ou `re.compile(...).search`).
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+from itertools import groupby
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from pyzbar.pyzbar import decode as pyzbar_decode
+from pyzxing import BarCodeReader
+
+from backend.services.zxing_service import decodificador_zxing
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+ANGULOS = (0, 90, 180, 270)
+LIMIARES = ("otsu", 50, 100, 150, 200)
+MORFOLOGIAS = (None, "erode", "dilate", "open", "close")
+# Quantas imagens, no máximo, vão para o ZXing quando pyzbar e OpenCV falham
+ZXING_CANDIDATAS = int(os.getenv("ZXING_CANDIDATAS", "3"))
+# "serial": variantes na thread que chamou; "processos": grade dividida entre processos
+DECODIFICACAO_MODO = os.getenv("DECODIFICACAO_MODO", "serial").lower()
+# "processo": JVM persistente do zxing_service; "pyzxing": uma JVM por chamada
+ZXING_MODO = os.getenv("ZXING_MODO", "processo").lower()
+DECODIFICACAO_PROCESSOS = int(os.getenv("DECODIFICACAO_PROCESSOS", str(os.cpu_count() or 1)))
+# Maior lado (px) das imagens que passam pelas variantes; 0 mantém a resolução da foto
+DECODIFICACAO_MAX_LADO = int(os.getenv("DECODIFICACAO_MAX_LADO", "1600"))
+# Maior lado da cópia em que as regiões com código são procuradas
+DECODIFICACAO_LOCALIZACAO_LADO = int(os.getenv("DECODIFICACAO_LOCALIZACAO_LADO", "800"))
+# Quantos recortes, no máximo, são tentados antes da foto inteira; 0 desliga a localização
+DECODIFICACAO_REGIOES = int(os.getenv("DECODIFICACAO_REGIOES", "3"))
+
+_ROTACOES = {90: cv2.ROTATE_90_COUNTERCLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_CLOCKWISE}
+
+
+@dataclass(frozen=True)
+class Variante:
+    angulo: int = 0
+    # None: cinza sem binarizar; "otsu" ou um valor fixo de limiar
+    limiar: object = None
+    morfologia: str = None
+
+
+# Já tentadas na etapa rápida
+VARIANTES_RAPIDAS = (Variante(), Variante(limiar="otsu"))
+
+
+@dataclass
+class Decodificacao:
+    dados: str
+    # Tipo informado pelo decodificador (ex.: QRCODE, PDF417); None quando ele não informa
+    tipo: str
+    decodificador: str
+    etapa: str
+    variante: Variante
+    tempos: dict = field(default_factory=dict)
+    tentativas: int = 0
+    # (x, y, largura, altura) do recorte, na resolução da foto; None quando foi a foto inteira
+    regiao: tuple = None
+
+    def relatorio(self) -> dict:
+        return {
+            "etapa": self.etapa,
+            "decodificador": self.decodificador,
+            "variante": asdict(self.variante),
+            "regiao": list(self.regiao) if self.regiao else None,
+            "tempos": {etapa: round(segundos, 3) for etapa, segundos in self.tempos.items()},
+            "tentativas": self.tentativas,
+        }
+
+
+def rotacionar(img, angulo: int):
+    """Rotação anti-horária; múltiplos de 90° sem interpolação e sem cortar a imagem."""
+    angulo %= 360
+    if angulo == 0:
+        return img
+    if angulo in _ROTACOES:
+        return cv2.rotate(img, _ROTACOES[angulo])
+    (h, w) = img.shape[:2]
+    matriz = cv2.getRotationMatrix2D((w // 2, h // 2), angulo, 1.0)
+    return cv2.warpAffine(img, matriz, (w, h))
+
+
+def binarizar(cinza, limiar):
+    if limiar is None:
+        return cinza
+    if limiar == "otsu":
+        return cv2.threshold(cinza, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return cv2.threshold(cinza, limiar, 255, cv2.THRESH_BINARY)[1]
+
+
+def aplicar_morfologia(img, operacao):
+    kernel = np.ones((2, 2), np.uint8)
+    if operacao == "erode":
+        return cv2.erode(img, kernel, iterations=1)
+    elif operacao == "dilate":
+        return cv2.dilate(img, kernel, iterations=1)
+    elif operacao == "open":
+        return cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel)
+    elif operacao == "close":
+        return cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)
+    return img
+
+
+def gerar_variantes(cinza, variantes):
+    """
+    Gera (variante, imagem) sob demanda. Guarda as rotações e a última binarização,
+    então a ordem padrão (ângulo → limiar → morfologia) rotaciona e binariza uma vez só.
+    """
+    rotacoes = {}
+    ultima_binarizacao = (None, None)
+    for variante in variantes:
+        if variante.angulo not in rotacoes:
+            rotacoes[variante.angulo] = rotacionar(cinza, variante.angulo)
+        chave = (variante.angulo, variante.limiar)
+        if ultima_binarizacao[0] != chave:
+            ultima_binarizacao = (chave, binarizar(rotacoes[variante.angulo], variante.limiar))
+        yield variante, aplicar_morfologia(ultima_binarizacao[1], variante.morfologia)
+
+
+def grade_variantes(sucessos: dict = None) -> list:
+    """
+    Todas as variantes, em ângulo → limiar → morfologia. Com `sucessos` ({Variante: n}),
+    os grupos (ângulo, limiar) que mais leram códigos vêm antes e, dentro de cada um, as
+    morfologias que mais leram; empates mantêm a ordem padrão. Reordenar por grupo mantém
+    uma binarização por grupo em gerar_variantes e as fatias de _buscar_paralelo.
+    """
+    grade = [
+        Variante(angulo, limiar, morfologia)
+        for angulo in ANGULOS for limiar in LIMIARES for morfologia in MORFOLOGIAS
+    ]
+    if not sucessos:
+        return grade
+    grupos = [list(grupo) for _, grupo in groupby(grade, key=lambda v: (v.angulo, v.limiar))]
+    grupos.sort(key=lambda grupo: -sum(sucessos.get(v, 0) for v in grupo))
+    return [v for grupo in grupos for v in sorted(grupo, key=lambda v: -sucessos.get(v, 0))]
+
+
+def reduzir(img, lado_max: int) -> tuple:
+    """(imagem, escala) com o maior lado cabendo em `lado_max`; nunca amplia."""
+    altura, largura = img.shape[:2]
+    escala = lado_max / max(altura, largura) if lado_max else 1.0
+    if escala >= 1:
+        return img, 1.0
+    tamanho = (max(1, round(largura * escala)), max(1, round(altura * escala)))
+    return cv2.resize(img, tamanho, interpolation=cv2.INTER_AREA), escala
+
+
+def _areas_de_barras(pequena) -> list:
+    """
+    Retângulos com muitas bordas paralelas (códigos de barras, PDF417), maiores primeiro:
+    onde o gradiente numa direção domina o da outra, fechado num bloco pela morfologia.
+    """
+    grad_x = cv2.convertScaleAbs(cv2.Sobel(pequena, cv2.CV_32F, 1, 0, ksize=-1))
+    grad_y = cv2.convertScaleAbs(cv2.Sobel(pequena, cv2.CV_32F, 0, 1, ksize=-1))
+    gradiente = cv2.blur(cv2.absdiff(grad_x, grad_y), (9, 9))
+    mascara = cv2.threshold(gradiente, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    mascara = cv2.morphologyEx(mascara, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 21)))
+    # Erosão seguida de dilatação some com letras e riscos isolados
+    mascara = cv2.dilate(cv2.erode(mascara, None, iterations=4), None, iterations=4)
+    contornos = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    area_minima = 0.005 * pequena.shape[0] * pequena.shape[1]
+    contornos = sorted((c for c in contornos if cv2.contourArea(c) >= area_minima), key=cv2.contourArea, reverse=True)
+    return [cv2.boundingRect(c) for c in contornos]
+
+
+def recortar(img, regiao: tuple):
+    x, y, largura, altura = regiao
+    # Cópia contígua: as variantes e a memória compartilhada do modo processos esperam uma
+    return np.ascontiguousarray(img[y:y + altura, x:x + largura])
+
+
+def _sobreposicao(a: tuple, b: tuple) -> float:
+    """Fração do menor retângulo coberta pela interseção dos dois."""
+    largura = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    altura = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if largura <= 0 or altura <= 0:
+        return 0.0
+    return largura * altura / min(a[2] * a[3], b[2] * b[3])
+
+
+def localizar_regioes(cinza, limite: int = DECODIFICACAO_REGIOES) -> list:
+    """
+    Até `limite` retângulos (x, y, largura, altura), na resolução da foto, onde deve haver
+    um código: o QR Code localizado pelo OpenCV primeiro, depois as áreas de barras. A busca
+    roda numa cópia com DECODIFICACAO_LOCALIZACAO_LADO de lado; recortes que cobrem quase
+    a foto toda são descartados (a foto inteira já é tentada depois).
+    """
+    if limite <= 0:
+        return []
+    pequena, escala = reduzir(cinza, DECODIFICACAO_LOCALIZACAO_LADO)
+    retangulos = []
+    achou, pontos = _detector_qr().detect(pequena)
+    if achou and pontos is not None:
+        retangulos.append(cv2.boundingRect(pontos.reshape(-1, 2).astype(np.float32)))
+    retangulos.extend(_areas_de_barras(pequena))
+
+    altura, largura = cinza.shape[:2]
+    regioes = []
+    for x, y, w, h in retangulos:
+        # Margem para a zona de silêncio do código
+        margem_x, margem_y = 0.15 * w + 4, 0.15 * h + 4
+        x0, y0 = max(0, int((x - margem_x) / escala)), max(0, int((y - margem_y) / escala))
+        x1 = min(largura, int((x + w + margem_x) / escala) + 1)
+        y1 = min(altura, int((y + h + margem_y) / escala) + 1)
+        if (x1 - x0) * (y1 - y0) > 0.6 * largura * altura:
+            continue
+        if any(_sobreposicao((x0, y0, x1 - x0, y1 - y0), outra) > 0.7 for outra in regioes):
+            continue
+        regioes.append((x0, y0, x1 - x0, y1 - y0))
+        if len(regioes) >= limite:
+            break
+    return regioes
+
+
+_local = threading.local()
+
+
+def _detector_qr():
+    # O QRCodeDetector não é seguro entre threads: um por thread
+    detector = getattr(_local, "detector", None)
+    if detector is None:
+        detector = _local.detector = cv2.QRCodeDetector()
+    return detector
+
+
+def decodificar_baratos(img, validar=None):
+    """
+    Tenta pyzbar e depois OpenCV. Retorna ((dados, tipo, decodificador) ou None,
+    localizado), em que `localizado` indica que o OpenCV achou um QR Code sem conseguir lê-lo.
+    """
+    for resultado in pyzbar_decode(img):
+        dados = resultado.data.decode("utf-8", errors="ignore")
+        if dados and (validar is None or validar(dados)):
+            return (dados, resultado.type, "pyzbar"), True
+
+    dados, pontos, _ = _detector_qr().detectAndDecode(img)
+    if dados and (validar is None or validar(dados)):
+        return (dados, "QRCODE", "opencv"), True
+    return None, pontos is not None
+
+
+_leitor_zxing = None
+
+
+def decode_pyzxing(img_path):
+    global _leitor_zxing
+    if _leitor_zxing is None:
+        _leitor_zxing = BarCodeReader()
+    results = _leitor_zxing.decode(img_path)
+    if not results:
+        return None
+    return results[0].get('parsed') or results[0].get('raw')
+
+
+def _zxing_pyzxing(pasta: str, n: int, img):
+    caminho = os.path.join(pasta, f"candidata_{n}.png")
+    cv2.imwrite(caminho, img)
+    dados = decode_pyzxing(caminho)
+    if isinstance(dados, bytes):
+        dados = dados.decode("utf-8", errors="ignore")
+    return dados, None
+
+
+def _zxing_processo(img):
+    ok, png = cv2.imencode(".png", img)
+    try:
+        lido = decodificador_zxing.decodificar(png.tobytes()) if ok else None
+    except (OSError, TimeoutError, ConnectionError, ValueError) as e:
+        logger.error("❌ Processo ZXing indisponível: %s", e)
+        return None, None
+    if not lido:
+        return None, None
+    dados, formato = lido
+    # QR_CODE -> QRCODE, CODE_128 -> CODE128: mesmos nomes que o pyzbar devolve
+    return dados, formato.replace("_", "")
+
+
+def decodificar_zxing(candidatas: list, validar=None):
+    """
+    Passa as candidatas (chave, imagem) pelo ZXing, na ordem, até uma ser lida.
+    Retorna (dados, tipo, chave) ou None; `tipo` é None no modo pyzxing.
+    """
+    temporaria = tempfile.TemporaryDirectory(prefix="zxing_") if ZXING_MODO == "pyzxing" else nullcontext()
+    with temporaria as pasta:
+        for n, (chave, img) in enumerate(candidatas):
+            if ZXING_MODO == "pyzxing":
+                dados, tipo = _zxing_pyzxing(pasta, n, img)
+            else:
+                dados, tipo = _zxing_processo(img)
+            if dados and (validar is None or validar(dados)):
+                return dados, tipo, chave
+    return None
+
+
+def _buscar_serial(cinza, variantes: list, validar=None, cancelar=None) -> tuple:
+    """
+    Percorre as variantes em ordem. Retorna (lido, variante, tentativas, localizadas), com
+    `lido` = (dados, tipo, decodificador) ou None e `localizadas` = variantes em que o OpenCV
+    achou um QR Code sem lê-lo. `cancelar()` verdadeiro interrompe a busca.
+    """
+    tentativas = 0
+    localizadas = []
+    for variante, img in gerar_variantes(cinza, variantes):
+        if cancelar is not None and cancelar():
+            break
+        tentativas += 1
+        lido, localizado = decodificar_baratos(img, validar)
+        if lido:
+            return lido, variante, tentativas, localizadas
+        if localizado:
+            localizadas.append(variante)
+    return None, None, tentativas, localizadas
+
+
+def _buscar_fatia(nome_memoria: str, forma: tuple, variantes: list, validar=None) -> tuple:
+    """Executada nos processos do pool: busca uma fatia da grade na imagem compartilhada."""
+    # Os processos do pool (spawn) usam o mesmo resource_tracker do pai: quem apaga o bloco é o pai
+    memoria = SharedMemory(name=nome_memoria)
+    try:
+        # O byte logo após a imagem é a flag de cancelamento
+        tamanho = int(np.prod(forma))
+        cinza = np.ndarray(forma, dtype=np.uint8, buffer=memoria.buf)
+        resultado = _buscar_serial(cinza, variantes, validar, cancelar=lambda: memoria.buf[tamanho] != 0)
+        if resultado[0]:
+            memoria.buf[tamanho] = 1
+        # Um array ainda apontando para o bloco impede fechá-lo
+        del cinza
+        return resultado
+    finally:
+        memoria.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: fork de um processo com threads (uvicorn, pool do banco) pode herdar locks presos
+            _pool = ProcessPoolExecutor(max_workers=max(1, DECODIFICACAO_PROCESSOS),
+                                        mp_context=multiprocessing.get_context("spawn"))
+            logger.info("🧵 Pool de decodificação com %d processos", DECODIFICACAO_PROCESSOS)
+        return _pool
+
+
+def encerrar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _buscar_paralelo(cinza, variantes: list, validar=None) -> tuple:
+    """
+    Como _buscar_serial, com uma tarefa por (ângulo, limiar) no pool. No primeiro
+    código lido a flag compartilhada para as tarefas em andamento e as que ainda não
+    começaram são canceladas.
+    """
+    memoria = SharedMemory(create=True, size=cinza.nbytes + 1)
+    try:
+        compartilhada = np.ndarray(cinza.shape, dtype=np.uint8, buffer=memoria.buf)
+        compartilhada[:] = cinza
+        memoria.buf[cinza.nbytes] = 0
+        del compartilhada
+
+        pool = _obter_pool()
+        fatias = [list(grupo) for _, grupo in groupby(variantes, key=lambda v: (v.angulo, v.limiar))]
+        pendentes = {pool.submit(_buscar_fatia, memoria.name, cinza.shape, fatia, validar) for fatia in fatias}
+        tentativas = 0
+        localizadas = []
+        try:
+            while pendentes:
+                prontas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futura in prontas:
+                    lido, variante, tentativas_fatia, localizadas_fatia = futura.result()
+                    tentativas += tentativas_fatia
+                    localizadas.extend(localizadas_fatia)
+                    if lido:
+                        return lido, variante, tentativas, localizadas
+        finally:
+            memoria.buf[cinza.nbytes] = 1
+            for futura in pendentes:
+                futura.cancel()
+            # O bloco só é liberado depois que as tarefas em andamento o soltarem
+            wait(pendentes)
+        return None, None, tentativas, localizadas
+    finally:
+        memoria.close()
+        memoria.unlink()
+
+
+def decodificar_imagem(caminho: str, validar=None, sucessos: dict = None) -> Decodificacao | None:
+    """
+    Lê o primeiro código da imagem cujo conteúdo passe em `validar(dados)` (qualquer
+    conteúdo, sem ela). `sucessos` ordena a etapa de variantes (ver grade_variantes).
+    Cada etapa passa pelos recortes localizados e depois pela foto inteira reduzida.
+    Retorna a Decodificacao, com etapa, região e tempos, ou None.
+    """
+    colorida = cv2.imread(caminho, cv2.IMREAD_COLOR)
+    if colorida is None:
+        logger.error("❌ Não foi possível carregar a imagem: %s", caminho)
+        return None
+    cinza = cv2.cvtColor(colorida, cv2.COLOR_BGR2GRAY)
+
+    inicio = time.perf_counter()
+    regioes = localizar_regioes(cinza)
+    # (região, imagem): os recortes saem da foto original, não da cópia reduzida
+    alvos = [(regiao, reduzir(recortar(cinza, regiao), DECODIFICACAO_MAX_LADO)[0]) for regiao in regioes]
+    alvos.append((None, reduzir(cinza, DECODIFICACAO_MAX_LADO)[0]))
+    tempos = {"localizacao": time.perf_counter() - inicio}
+    tentativas = 0
+    # (alvo, variante) em que o OpenCV localizou um QR Code sem lê-lo: as melhores para o ZXing
+    localizadas = []
+
+    def concluir(dados, tipo, decodificador, etapa, variante, regiao):
+        resultado = Decodificacao(dados, tipo, decodificador, etapa, variante, tempos, tentativas, regiao)
+        logger.info("🔎 Código lido na etapa %s: %s", etapa, resultado.relatorio())
+        return resultado
+
+    buscar_variantes = _buscar_paralelo if DECODIFICACAO_MODO == "processos" else _buscar_serial
+    etapas = (
+        ("rapida", _buscar_serial, VARIANTES_RAPIDAS),
+        ("variantes", buscar_variantes, [v for v in grade_variantes(sucessos) if v not in VARIANTES_RAPIDAS]),
+    )
+    for etapa, buscar, variantes in etapas:
+        inicio = time.perf_counter()
+        for n, (regiao, img) in enumerate(alvos):
+            lido, variante, tentativas_etapa, localizadas_etapa = buscar(img, variantes, validar)
+            tentativas += tentativas_etapa
+            localizadas.extend((n, v) for v in localizadas_etapa)
+            if lido:
+                tempos[etapa] = time.perf_counter() - inicio
+                return concluir(*lido, etapa, variante, regiao)
+        tempos[etapa] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    padrao = [(n, v) for v in VARIANTES_RAPIDAS for n in range(len(alvos))]
+    candidatas = list(dict.fromkeys(localizadas + padrao))[:ZXING_CANDIDATAS]
+    imagens = [((n, v), next(gerar_variantes(alvos[n][1], [v]))[1]) for n, v in candidatas]
+    lido = decodificar_zxing(imagens, validar)
+    tempos["zxing"] = time.perf_counter() - inicio
+    tentativas += len(candidatas)
+    if lido:
+        n, variante = lido[2]
+        return concluir(lido[0], lido[1], "zxing", "zxing", variante, alvos[n][0])
+
+    logger.warning("🚫 Nenhum código lido em %s: %s tentativas, tempos %s", caminho, tentativas,
+                   {etapa: round(segundos, 3) for etapa, segundos in tempos.items()})
+    return None
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Máximo de mensagens executando ao mesmo tempo, somando todos os telefones
+DESPACHO_MAX_CONCORRENTES = int(os.getenv("DESPACHO_MAX_CONCORRENTES", "8"))
+# Mensagens entregues e ainda não concluídas (executando ou na faixa); além disso, `entregar` espera
+DESPACHO_MAX_PENDENTES = int(os.getenv("DESPACHO_MAX_PENDENTES", str(4 * DESPACHO_MAX_CONCORRENTES)))
+# Tempo sem mensagens até a faixa de um telefone ser descartada
+DESPACHO_OCIOSO_SEGUNDOS = float(os.getenv("DESPACHO_OCIOSO_SEGUNDOS", "60"))
+
+
+class _Faixa:
+    """Fila FIFO de um único telefone, consumida por uma única tarefa."""
+
+    def __init__(self):
+        self.pendentes = deque()
+        self.sinal = asyncio.Event()
+        self.tarefa = None
+        self.ultimo_uso = time.monotonic()
+
+
+class DespachantePorTelefone:
+    """
+    Executa mensagens do mesmo telefone em ordem de chegada e mensagens de
+    telefones diferentes em paralelo, até `max_concorrentes` de uma vez.
+    """
+
+    def __init__(self, max_concorrentes: int = DESPACHO_MAX_CONCORRENTES,
+                 ocioso_segundos: float = DESPACHO_OCIOSO_SEGUNDOS,
+                 max_pendentes: int = DESPACHO_MAX_PENDENTES):
+        self.max_concorrentes = max(1, max_concorrentes)
+        self.max_pendentes = max(self.max_concorrentes, max_pendentes)
+        self.ocioso_segundos = ocioso_segundos
+        self._faixas = {}
+        self._semaforo = None
+        self._vagas = None
+        self._entregues = 0
+        self._em_execucao = 0
+        self._executadas = 0
+        self._descartadas = 0
+
+    def submeter(self, telefone: str, fabrica) -> asyncio.Future:
+        """
+        Enfileira `fabrica` (função sem argumentos que devolve uma coroutine) na
+        faixa do telefone e retorna um Future com o resultado. Não suspende, então
+        a ordem das chamadas é exatamente a ordem de execução por telefone.
+        """
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concorrentes)
+
+        futuro = asyncio.get_running_loop().create_future()
+        faixa = self._faixas.get(telefone)
+        if faixa is None:
+            faixa = _Faixa()
+            self._faixas[telefone] = faixa
+            faixa.tarefa = asyncio.create_task(self._consumir(telefone, faixa), name=f"faixa-{telefone}")
+
+        faixa.pendentes.append((fabrica, futuro))
+        faixa.sinal.set()
+        return futuro
+
+    async def executar(self, telefone: str, fabrica):
+        return await self.submeter(telefone, fabrica)
+
+    async def entregar(self, telefone: str, fabrica) -> asyncio.Future:
+        """
+        Como `submeter`, para quem só repassa mensagens (os workers da fila): não espera a
+        execução terminar, só uma vaga entre as `max_pendentes` mensagens entregues e não
+        concluídas. Uma faixa lenta ocupa vagas, não quem entrega; com tudo ocupado, quem
+        entrega espera e a fila de entrada enche (backpressure).
+        """
+        if self._vagas is None:
+            self._vagas = asyncio.Semaphore(self.max_pendentes)
+        await self._vagas.acquire()
+        try:
+            futuro = self.submeter(telefone, fabrica)
+        except BaseException:
+            self._vagas.release()
+            raise
+        self._entregues += 1
+        futuro.add_done_callback(self._liberar_vaga)
+        return futuro
+
+    def _liberar_vaga(self, futuro: asyncio.Future):
+        self._entregues -= 1
+        self._vagas.release()
+        # Ninguém aguarda esse Future: a falha é registrada aqui
+        if not futuro.cancelled() and futuro.exception() is not None:
+            logger.error("❌ Mensagem entregue ao despachante falhou: %r", futuro.exception())
+
+    async def _consumir(self, telefone: str, faixa: _Faixa):
+        try:
+            while True:
+                if not faixa.pendentes:
+                    faixa.sinal.clear()
+                    try:
+                        await asyncio.wait_for(faixa.sinal.wait(), timeout=self.ocioso_segundos)
+                    except asyncio.TimeoutError:
+                        if not faixa.pendentes:
+                            break
+                    continue
+
+                fabrica, futuro = faixa.pendentes.popleft()
+                if futuro.done():
+                    # Quem aguardava desistiu (ex.: requisição cancelada)
+                    continue
+
+                async with self._semaforo:
+                    self._em_execucao += 1
+                    try:
+                        resultado = await fabrica()
+                        if not futuro.done():
+                            futuro.set_result(resultado)
+                    except asyncio.CancelledError:
+                        if not futuro.done():
+                            futuro.cancel()
+                        raise
+                    except Exception as e:
+                        if not futuro.done():
+                            futuro.set_exception(e)
+                    finally:
+                        self._em_execucao -= 1
+                        self._executadas += 1
+                        faixa.ultimo_uso = time.monotonic()
+        finally:
+            if self._faixas.get(telefone) is faixa:
+                del self._faixas[telefone]
+                self._descartadas += 1
+            for _, futuro in faixa.pendentes:
+                if not futuro.done():
+                    futuro.cancel()
+
+    async def parar(self):
+        tarefas = [faixa.tarefa for faixa in self._faixas.values()]
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+    def status(self) -> dict:
+        return {
+            "faixas_ativas": len(self._faixas),
+            "pendentes": sum(len(f.pendentes) for f in self._faixas.values()),
+            "max_concorrentes": self.max_concorrentes,
+            "em_execucao": self._em_execucao,
+            "max_pendentes": self.max_pendentes,
+            "entregues_pendentes": self._entregues,
+            "executadas": self._executadas,
+            "faixas_descartadas": self._descartadas,
+            "ocioso_segundos": self.ocioso_segundos,
+        }
@@ -1,5 +1,6 @@
 import logging
-import psycopg2
+from backend.services.db_init import conectar_bd
+from backend.utils import obter_schema_por_telefone
 import os
 from dotenv import load_dotenv
 from email.utils import parsedate_to_datetime
@@ -12,9 +13,9 @@ logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 def salvar_credenciais_email(telefone, email_user, email_pass, descricao=None):
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
     schema = obter_schema_por_telefone(telefone)
+    conn = conectar_bd()
+    cur = conn.cursor()
 
     # Verificar se o email já existe
     cur.execute(
@@ -50,9 +51,9 @@ def salvar_credenciais_email(telefone, email_user, email_pass, descricao=None):
 
 def listar_emails_cadastrados(telefone):
     """Lista todos os emails cadastrados para o telefone específico"""
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
     schema = obter_schema_por_telefone(telefone)
+    conn = conectar_bd()
+    cur = conn.cursor()
 
     cur.execute(
         f"""SELECT email_user, descricao
@@ -74,9 +75,9 @@ def buscar_credenciais_email(telefone, email_especifico=None):
     Se email_especifico for fornecido, busca apenas esse email
     Caso contrário, retorna o email mais recente
     """
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
     schema = obter_schema_por_telefone(telefone)
+    conn = conectar_bd()
+    cur = conn.cursor()
 
     if email_especifico:
         # Busca pelo email específico
@@ -105,20 +106,6 @@ def buscar_credenciais_email(telefone, email_especifico=None):
         return resultado[0], resultado[1]
     return None, None
 
-def obter_schema_por_telefone(telefone):
-    """
-    Consulta a tabela 'usuarios' e retorna o nome do schema com base no telefone.
-    """
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    cursor.execute("SELECT schema_user FROM usuarios WHERE telefone = %s AND autorizado = true", (telefone,))
-    resultado = cursor.fetchone()
-    nome = resultado[0]
-    cursor.close()
-    conn.close()
-    
-    return nome
-
 def decode_header_value(value):
     """
     Decodifica cabeçalhos de email que podem conter diferentes codificações
@@ -0,0 +1,118 @@
+"""
+Quais combinações (decodificador, ângulo, limiar, morfologia) leram as notas até agora.
+Cada leitura bem-sucedida soma um em public.estatisticas_decodificacao; a contagem por
+variante, relida do banco a cada DECODIFICACAO_ESTATISTICAS_TTL segundos, ordena a
+etapa de variantes de decodificar_imagem para que as que mais acertam rodem primeiro.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dotenv import load_dotenv
+
+from backend.services.db_init import conectar_bd
+from backend.services.decodificacao_service import Decodificacao, Variante
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Por quanto tempo a contagem é reaproveitada (outros workers veem os sucessos após esse prazo)
+DECODIFICACAO_ESTATISTICAS_TTL = float(os.getenv("DECODIFICACAO_ESTATISTICAS_TTL", "600"))
+
+_sucessos = {"expira": 0.0, "contagem": Counter()}
+_lock = threading.Lock()
+
+
+def _texto(valor) -> str:
+    return "" if valor is None else str(valor)
+
+
+def _variante(angulo: int, limiar: str, morfologia: str) -> Variante:
+    if limiar == "":
+        limiar = None
+    elif limiar.isdigit():
+        limiar = int(limiar)
+    return Variante(angulo, limiar, morfologia or None)
+
+
+def _carregar() -> list:
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT decodificador, angulo, limiar, morfologia, sucessos, ultimo_sucesso
+        FROM estatisticas_decodificacao
+        ORDER BY sucessos DESC, decodificador, angulo, limiar, morfologia
+    """)
+    linhas = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return linhas
+
+
+def sucessos_por_variante() -> dict:
+    """{Variante: leituras}, somando os decodificadores. Vazio se o banco falhar."""
+    agora = time.monotonic()
+    with _lock:
+        if _sucessos["expira"] > agora:
+            return dict(_sucessos["contagem"])
+    contagem = Counter()
+    try:
+        for _, angulo, limiar, morfologia, sucessos, _ in _carregar():
+            contagem[_variante(angulo, limiar, morfologia)] += sucessos
+    except Exception as e:
+        logger.error("❌ Erro ao carregar estatísticas de decodificação: %s", e)
+    with _lock:
+        # Mesmo após uma falha: evita consultar o banco a cada imagem
+        _sucessos.update(expira=time.monotonic() + DECODIFICACAO_ESTATISTICAS_TTL, contagem=contagem)
+    return dict(contagem)
+
+
+def registrar_sucesso(resultado: Decodificacao):
+    """Soma a leitura à combinação que a fez, no banco e na contagem em memória."""
+    variante = resultado.variante
+    try:
+        conn = conectar_bd()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO estatisticas_decodificacao (decodificador, angulo, limiar, morfologia, sucessos)
+            VALUES (%s, %s, %s, %s, 1)
+            ON CONFLICT (decodificador, angulo, limiar, morfologia) DO UPDATE SET
+                sucessos = estatisticas_decodificacao.sucessos + 1,
+                ultimo_sucesso = NOW() AT TIME ZONE 'America/Sao_Paulo'
+        """, (resultado.decodificador, variante.angulo, _texto(variante.limiar), _texto(variante.morfologia)))
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        logger.error("❌ Erro ao registrar estatística de decodificação: %s", e)
+        return
+    with _lock:
+        _sucessos["contagem"][variante] += 1
+
+
+def estatisticas_decodificacao() -> dict:
+    """Distribuição dos sucessos por combinação e por dimensão, para o endpoint de estatísticas."""
+    linhas = _carregar()
+    total = sum(linha[4] for linha in linhas)
+    dimensoes = {"decodificador": Counter(), "angulo": Counter(), "limiar": Counter(), "morfologia": Counter()}
+    combinacoes = []
+    for decodificador, angulo, limiar, morfologia, sucessos, ultimo_sucesso in linhas:
+        dimensoes["decodificador"][decodificador] += sucessos
+        dimensoes["angulo"][str(angulo)] += sucessos
+        dimensoes["limiar"][limiar or "nenhum"] += sucessos
+        dimensoes["morfologia"][morfologia or "nenhuma"] += sucessos
+        combinacoes.append({
+            "decodificador": decodificador,
+            "angulo": angulo,
+            "limiar": limiar or None,
+            "morfologia": morfologia or None,
+            "sucessos": sucessos,
+            "percentual": round(100 * sucessos / total, 1) if total else 0.0,
+            "ultimo_sucesso": ultimo_sucesso.isoformat(),
+        })
+    return {
+        "total": total,
+        **{f"por_{nome}": dict(contagem.most_common()) for nome, contagem in dimensoes.items()},
+        "combinacoes": combinacoes,
+    }
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# "inline" processa a mensagem dentro da requisição (comportamento antigo);
+# "fila" responde 200 imediatamente e deixa o processamento para os workers.
+WEBHOOK_MODO = os.getenv("WEBHOOK_MODO", "inline").lower()
+FILA_WORKERS = int(os.getenv("FILA_WORKERS", "4"))
+FILA_TAMANHO_MAX = int(os.getenv("FILA_TAMANHO_MAX", "500"))
+# O que fazer com a fila cheia: "rejeitar" (503, a Meta reenvia depois),
+# "aguardar" (espera até FILA_TIMEOUT_AGUARDAR segundos por uma vaga) ou
+# "inline" (processa dentro da própria requisição).
+FILA_BACKPRESSURE = os.getenv("FILA_BACKPRESSURE", "rejeitar").lower()
+FILA_TIMEOUT_AGUARDAR = float(os.getenv("FILA_TIMEOUT_AGUARDAR", "2"))
+
+POLITICAS_BACKPRESSURE = ("rejeitar", "aguardar", "inline")
+
+
+class FilaCheiaError(Exception):
+    """Levantada quando a fila não aceita mais mensagens."""
+
+
+class FilaProcessamento:
+    """
+    Fila limitada em memória (asyncio.Queue) consumida por um número fixo de workers.
+    Cada item é repassado para `processador`, uma coroutine que recebe o job.
+    """
+
+    def __init__(self, processador, workers: int = FILA_WORKERS, tamanho_max: int = FILA_TAMANHO_MAX,
+                 backpressure: str = FILA_BACKPRESSURE, timeout_aguardar: float = FILA_TIMEOUT_AGUARDAR):
+        if backpressure not in POLITICAS_BACKPRESSURE:
+            raise ValueError(f"Política de backpressure inválida: {backpressure}")
+        self.processador = processador
+        self.workers = max(1, workers)
+        self.tamanho_max = max(1, tamanho_max)
+        self.backpressure = backpressure
+        self.timeout_aguardar = timeout_aguardar
+        self._fila = None
+        self._tarefas = []
+        self._processados = 0
+        self._falhas = 0
+        self._rejeitados = 0
+        self._espera_total = 0.0
+        self._iniciados = 0
+        self._em_execucao = 0
+
+    @property
+    def ativa(self) -> bool:
+        return bool(self._tarefas)
+
+    def profundidade(self) -> int:
+        return self._fila.qsize() if self._fila else 0
+
+    def cheia(self) -> bool:
+        return self._fila is not None and self._fila.full()
+
+    async def iniciar(self):
+        if self.ativa:
+            return
+        self._fila = asyncio.Queue(maxsize=self.tamanho_max)
+        self._tarefas = [
+            asyncio.create_task(self._worker(n), name=f"fila-worker-{n}")
+            for n in range(self.workers)
+        ]
+        logger.info("🚚 Fila iniciada com %d workers (capacidade %d, backpressure=%s)",
+                    self.workers, self.tamanho_max, self.backpressure)
+
+    async def parar(self):
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+        self._tarefas = []
+        logger.info("🛑 Fila encerrada com %d mensagens pendentes", self.profundidade())
+
+    async def enfileirar(self, job: dict):
+        """
+        Coloca o job na fila respeitando a política de backpressure.
+        Levanta FilaCheiaError quando a mensagem não pode ser aceita.
+        """
+        job["enfileirado_em"] = time.monotonic()
+        try:
+            self._fila.put_nowait(job)
+            return
+        except asyncio.QueueFull:
+            if self.backpressure != "aguardar":
+                if self.backpressure == "rejeitar":
+                    self._rejeitados += 1
+                raise FilaCheiaError("Fila de mensagens cheia")
+
+        try:
+            await asyncio.wait_for(self._fila.put(job), timeout=self.timeout_aguardar)
+        except asyncio.TimeoutError:
+            self._rejeitados += 1
+            raise FilaCheiaError(f"Fila de mensagens cheia após {self.timeout_aguardar:.1f}s")
+
+    async def _worker(self, numero: int):
+        while True:
+            job = await self._fila.get()
+            self._espera_total += time.monotonic() - job["enfileirado_em"]
+            self._iniciados += 1
+            self._em_execucao += 1
+            try:
+                await self.processador(job)
+                self._processados += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._falhas += 1
+                logger.exception("❌ Worker %d falhou ao processar job da fila:", numero)
+            finally:
+                self._em_execucao -= 1
+                self._fila.task_done()
+
+    def status(self) -> dict:
+        return {
+            "modo": WEBHOOK_MODO,
+            "ativa": self.ativa,
+            "profundidade": self.profundidade(),
+            "capacidade": self.tamanho_max,
+            "workers": self.workers,
+            "em_execucao": self._em_execucao,
+            "backpressure": self.backpressure,
+            "processados": self._processados,
+            "falhas": self._falhas,
+            "rejeitados": self._rejeitados,
+            "espera_media_ms": round(1000 * self._espera_total / self._iniciados, 2) if self._iniciados else 0.0,
+        }
@@ -1,92 +1,171 @@
 import logging
 import psycopg2
+from psycopg2.extras import execute_values
 import datetime
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from backend.services.db_init import conectar_bd, inicializar_bd
+from backend.services.resumo_service import somar_ao_resumo, total_gastos_mes
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-def salvar_fatura(descricao, valor, categoria, meio_pagamento, parcelas, schema):
+def _inserir_gastos(cursor, schema, linhas):
+    """
+    Insere todas as linhas (descricao, valor, categoria, meio_pagamento, parcelas, data,
+    modelo_versao) num único INSERT e atualiza o resumo mensal. Com data None vale o
+    horário atual do banco.
+    """
+    if linhas:
+        execute_values(cursor, f'''
+            INSERT INTO {schema}.gastos (descricao, valor, categoria, meio_pagamento, parcelas, data, modelo_versao)
+            VALUES %s
+        ''', linhas, template="(%s, %s, %s, %s, %s, COALESCE(%s::timestamp, CURRENT_TIMESTAMP), %s)",
+            page_size=len(linhas))
+        somar_ao_resumo(cursor, schema, gastos=[(l[1], l[2], l[3], l[5]) for l in linhas])
+
+def _inserir_parcelas(cursor, schema, linhas):
+    """
+    Insere todas as parcelas (descricao, valor, categoria, meio_pagamento, parcela, data_inicio,
+    data_fim, modelo_versao) num único INSERT e atualiza o resumo mensal.
+    """
+    if linhas:
+        execute_values(cursor, f'''
+            INSERT INTO {schema}.fatura_cartao
+                (descricao, valor, categoria, meio_pagamento, parcela, data_inicio, data_fim, modelo_versao)
+            VALUES %s
+        ''', linhas, page_size=len(linhas))
+        somar_ao_resumo(cursor, schema, parcelas=[(l[1], l[2], l[3], l[6]) for l in linhas])
+
+def parcelas_fatura(descricao, valor, categoria, meio_pagamento, parcelas, data_compra: str, modelo_versao=None):
+    """Linhas de fatura_cartao de uma compra, com vencimentos de calcular_datas_fatura."""
+    parcelas = max(1, int(parcelas))
+    return [
+        (descricao, valor / parcelas, categoria, meio_pagamento, f"{i+1}/{parcelas}", data_compra, data_fim, modelo_versao)
+        for i, data_fim in enumerate(calcular_datas_fatura(data_compra, parcelas))
+    ]
+
+def salvar_fatura(descricao, valor, categoria, meio_pagamento, parcelas, schema, modelo_versao=None):
     conn = conectar_bd()
     cursor = conn.cursor()
     data_compra = datetime.now().strftime("%Y-%m-%d")
-    datas_fatura = calcular_datas_fatura(data_compra, parcelas)
-
-    for i, data_fim in enumerate(datas_fatura):
-        parcela_numero = f"{i+1}/{parcelas}"
-        cursor.execute(f'''
-            INSERT INTO {schema}.fatura_cartao (descricao, valor, categoria, meio_pagamento, parcela, data_inicio, data_fim)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (descricao, valor/parcelas, categoria, meio_pagamento, parcela_numero, data_compra, data_fim))
+    _inserir_parcelas(cursor, schema, parcelas_fatura(descricao, valor, categoria, meio_pagamento, parcelas,
+                                                      data_compra, modelo_versao))
 
     conn.commit()
     cursor.close()
     conn.close()
     print("✅ Fatura registrada com datas corrigidas!")
 
-def salvar_gasto(descricao, valor, categoria, meio_pagamento, schema, parcelas=1):
+def salvar_gasto(descricao, valor, categoria, meio_pagamento, schema, parcelas=1, modelo_versao=None):
     conn = conectar_bd()
     cursor = conn.cursor()
 
     if meio_pagamento in ["pix", "débito"]:
-        cursor.execute(f'''
-            INSERT INTO {schema}.gastos (descricao, valor, categoria, meio_pagamento, parcelas)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (descricao, valor, categoria, meio_pagamento, parcelas))
+        _inserir_gastos(cursor, schema, [(descricao, valor, categoria, meio_pagamento, parcelas, None, modelo_versao)])
         logger.info(f"✅ Gasto registrado: {descricao} | R$ {valor:.2f} | {categoria} | {meio_pagamento}")
 
     elif meio_pagamento == "crédito":
         data_inicio = datetime.now()
-        for parcela in range(1, parcelas + 1):
-            data_fim = (data_inicio + timedelta(days=30 * parcela)).strftime("%Y-%m-%d")
-            cursor.execute(f'''
-                INSERT INTO {schema}.fatura_cartao (descricao, valor, categoria, meio_pagamento, parcela, data_inicio, data_fim)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (descricao, valor / parcelas, categoria, meio_pagamento, f"{parcela}/{parcelas}", data_inicio, data_fim))
+        _inserir_parcelas(cursor, schema, [
+            (descricao, valor / parcelas, categoria, meio_pagamento, f"{parcela}/{parcelas}", data_inicio,
+             (data_inicio + timedelta(days=30 * parcela)).strftime("%Y-%m-%d"), modelo_versao)
+            for parcela in range(1, parcelas + 1)
+        ])
         logger.info(f"✅ Compra parcelada registrada! {parcelas}x de R$ {valor/parcelas:.2f}")
 
     conn.commit()
     cursor.close()
     conn.close()
 
+def salvar_compras(compras: list, schema: str) -> dict:
+    """
+    Registra várias compras numa única transação, com um INSERT para gastos e outro
+    para todas as parcelas de cartão, independente de quantas compras e parcelas vierem.
+    Cada compra é um dict com descricao, valor, categoria, meio_pagamento e,
+    opcionalmente, parcelas (padrão 1), data (datetime/date da compra, padrão agora) e
+    modelo_versao (versão do modelo que definiu a categoria).
+    Pix e débito vão para gastos; o resto vira parcelas na fatura, como em salvar_fatura.
+    """
+    agora = datetime.now()
+    gastos = []
+    parcelas = []
+    for compra in compras:
+        data = compra.get("data")
+        num_parcelas = max(1, int(compra.get("parcelas") or 1))
+        if compra["meio_pagamento"] in ["pix", "débito"]:
+            gastos.append((compra["descricao"], compra["valor"], compra["categoria"],
+                           compra["meio_pagamento"], num_parcelas, data, compra.get("modelo_versao")))
+        else:
+            parcelas.extend(parcelas_fatura(compra["descricao"], compra["valor"], compra["categoria"],
+                                            compra["meio_pagamento"], num_parcelas,
+                                            (data or agora).strftime("%Y-%m-%d"), compra.get("modelo_versao")))
+
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    try:
+        _inserir_gastos(cursor, schema, gastos)
+        _inserir_parcelas(cursor, schema, parcelas)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    logger.info(f"✅ {len(compras)} compras registradas: {len(gastos)} gastos e {len(parcelas)} parcelas")
+    return {"compras": len(compras), "gastos": len(gastos), "parcelas": len(parcelas)}
+
 def calcular_total_gasto(schema):
     conn = conectar_bd()
     cursor = conn.cursor()
-    cursor.execute(f"""
-        SELECT SUM(valor) FROM {schema}.gastos 
-        WHERE data >= date_trunc('month', CURRENT_DATE)
-    """)
-    total = cursor.fetchone()[0] or 0.0
+    total = total_gastos_mes(cursor, schema)
     cursor.close()
     conn.close()
     return total
 
-def pagar_fatura(schema):
+def pagar_fatura(schema) -> dict:
+    """
+    Move as parcelas com vencimento no mês atual de fatura_cartao para gastos num único
+    comando (DELETE ... RETURNING alimentando o INSERT e o resumo mensal), atômico por natureza.
+    Retorna quantas parcelas e quanto valor foram movidos.
+    """
     conn = conectar_bd()
     cursor = conn.cursor()
     cursor.execute(f'''
-        SELECT descricao, valor, categoria, meio_pagamento FROM {schema}.fatura_cartao 
-        WHERE DATE_PART('month', data_fim) = DATE_PART('month', CURRENT_DATE)
-        AND DATE_PART('year', data_fim) = DATE_PART('year', CURRENT_DATE)
-    ''')
-    registros = cursor.fetchall()
-    for descricao, valor, categoria, meio_pagamento in registros:
-        cursor.execute(f'''
-            INSERT INTO {schema}.gastos (descricao, valor, categoria, meio_pagamento, parcelas)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (descricao, valor, categoria, meio_pagamento, 1))
-    cursor.execute(f'''
-        DELETE FROM {schema}.fatura_cartao 
-        WHERE DATE_PART('month', data_fim) = DATE_PART('month', CURRENT_DATE)
+        WITH movidas AS (
+            DELETE FROM {schema}.fatura_cartao
+            WHERE data_fim >= date_trunc('month', CURRENT_DATE)
+              AND data_fim < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+            RETURNING descricao, valor, categoria, meio_pagamento, modelo_versao
+        ), inseridas AS (
+            INSERT INTO {schema}.gastos (descricao, valor, categoria, meio_pagamento, parcelas, modelo_versao)
+            SELECT descricao, valor, categoria, meio_pagamento, 1, modelo_versao FROM movidas
+            RETURNING valor
+        ), resumo AS (
+            INSERT INTO {schema}.resumo_mensal
+                (mes, categoria, meio_pagamento, total_gastos, qtd_gastos, total_fatura, qtd_parcelas)
+            SELECT date_trunc('month', CURRENT_DATE)::date, COALESCE(categoria, ''), COALESCE(meio_pagamento, ''),
+                   SUM(valor), COUNT(*), -SUM(valor), -COUNT(*)
+            FROM movidas
+            GROUP BY 2, 3
+            ON CONFLICT (mes, categoria, meio_pagamento) DO UPDATE SET
+                total_gastos = resumo_mensal.total_gastos + EXCLUDED.total_gastos,
+                qtd_gastos = resumo_mensal.qtd_gastos + EXCLUDED.qtd_gastos,
+                total_fatura = resumo_mensal.total_fatura + EXCLUDED.total_fatura,
+                qtd_parcelas = resumo_mensal.qtd_parcelas + EXCLUDED.qtd_parcelas
+        )
+        SELECT COUNT(*), COALESCE(SUM(valor), 0) FROM inseridas
     ''')
+    quantidade, total = cursor.fetchone()
     conn.commit()
     cursor.close()
     conn.close()
-    logger.info(f"✅ Fatura paga! Total adicionado aos gastos.")
+    logger.info(f"✅ Fatura paga! {quantidade} parcelas (R$ {total:.2f}) adicionadas aos gastos.")
+    return {"parcelas": quantidade, "valor": float(total)}
 
 def registrar_salario(mensagem, schema):
     try:
@@ -0,0 +1,296 @@
+"""
+Importação de extratos bancários (CSV ou OFX) enviados como documento no WhatsApp.
+
+O arquivo é lido em fluxo e processado em lotes de IMPORTACAO_LOTE lançamentos:
+cada lote é classificado numa chamada ao modelo e gravado com COPY em gastos
+(extrato de conta) ou fatura_cartao (fatura de cartão), então a memória usada não
+depende do tamanho do arquivo. Tudo roda numa única transação, que também
+atualiza o resumo mensal; um arquivo já importado (mesmo hash) é recusado.
+
+    python -m backend.services.importacao_service extrato.ofx --schema joao_silva [--destino fatura]
+"""
+import argparse
+import codecs
+import csv
+import hashlib
+import io
+import itertools
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from dotenv import load_dotenv
+
+from backend.services.categorizacao_service import classificar_lote_usuario, normalizar_descricao
+from backend.services.db_init import conectar_bd
+from backend.services.gastos_service import parcelas_fatura
+from backend.services.resumo_service import somar_ao_resumo
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Lançamentos lidos, classificados e gravados por vez
+IMPORTACAO_LOTE = int(os.getenv("IMPORTACAO_LOTE", "2000"))
+EXTENSOES_EXTRATO = (".csv", ".ofx")
+MEIO_PAGAMENTO = {"gastos": "débito", "fatura": "crédito"}
+_BLOCO_LEITURA = 64 * 1024
+
+# Nomes de coluna aceitos nos CSVs (comparados já normalizados, pelo início)
+COLUNAS_CSV = {
+    "data": ("data", "date", "dt"),
+    "descricao": ("descricao", "historico", "lancamento", "estabelecimento", "title", "description", "memo"),
+    "valor": ("valor", "amount", "value", "quantia"),
+}
+FORMATOS_DATA = ("%d/%m/%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%Y", "%Y%m%d")
+
+
+@dataclass
+class Lancamento:
+    data: date
+    descricao: str
+    # Com o sinal do arquivo: débitos negativos no extrato, compras positivas em CSVs de cartão
+    valor: float
+
+
+def _codificacao(caminho: str) -> str:
+    """UTF-8 se o começo do arquivo decodificar como tal; senão latin-1 (comum em exportações de banco)."""
+    with open(caminho, "rb") as f:
+        amostra = f.read(_BLOCO_LEITURA)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(amostra, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def _hash_arquivo(caminho: str) -> str:
+    resumo = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(_BLOCO_LEITURA), b""):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def converter_valor(texto: str) -> float:
+    """ "R$ 1.234,56" → 1234.56; "-12.30" → -12.3. O último separador é o decimal."""
+    texto = texto.replace("R$", "").replace(" ", "").strip()
+    if "," in texto and "." in texto:
+        if texto.rfind(",") > texto.rfind("."):
+            texto = texto.replace(".", "").replace(",", ".")
+        else:
+            texto = texto.replace(",", "")
+    else:
+        texto = texto.replace(",", ".")
+    return float(texto)
+
+
+def converter_data(texto: str) -> date:
+    texto = texto.strip()[:10]
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data não reconhecida: {texto}")
+
+
+def ler_csv(caminho: str):
+    """Gera os lançamentos do CSV; o separador (`;`, `,` ou tab) e as colunas vêm do cabeçalho."""
+    with open(caminho, encoding=_codificacao(caminho), newline="") as f:
+        cabecalho = f.readline()
+        separador = max(";,\t", key=cabecalho.count)
+        nomes = [normalizar_descricao(nome) for nome in next(csv.reader([cabecalho], delimiter=separador))]
+        indices = {}
+        for campo, apelidos in COLUNAS_CSV.items():
+            for i, nome in enumerate(nomes):
+                if i not in indices.values() and nome.startswith(apelidos):
+                    indices[campo] = i
+                    break
+        if len(indices) < len(COLUNAS_CSV):
+            raise ValueError(f"Cabeçalho do CSV sem as colunas de data, descrição e valor: {cabecalho.strip()}")
+
+        for numero, linha in enumerate(csv.reader(f, delimiter=separador), start=2):
+            if not any(campo.strip() for campo in linha):
+                continue
+            try:
+                yield Lancamento(
+                    converter_data(linha[indices["data"]]),
+                    " ".join(linha[indices["descricao"]].split()),
+                    converter_valor(linha[indices["valor"]]),
+                )
+            except (IndexError, ValueError) as e:
+                logger.debug("Linha %d do CSV ignorada: %s", numero, e)
+                yield None
+
+
+def _tokens_ofx(caminho: str):
+    """(TAG, valor) de cada elemento do OFX, em SGML (sem fechamento) ou XML, lido em blocos."""
+    with open(caminho, encoding=_codificacao(caminho)) as f:
+        resto = ""
+        for bloco in iter(lambda: f.read(_BLOCO_LEITURA), ""):
+            partes = (resto + bloco).split("<")
+            resto = partes.pop()
+            for parte in partes:
+                tag, _, valor = parte.partition(">")
+                if tag:
+                    yield tag.strip().upper(), valor.strip()
+        tag, _, valor = resto.partition(">")
+        if tag:
+            yield tag.strip().upper(), valor.strip()
+
+
+class LeitorOFX:
+    """Gera os lançamentos de <STMTTRN>; `cartao` vira True ao encontrar <CCSTMTRS> (fatura de cartão)."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self.cartao = False
+
+    def __iter__(self):
+        transacao = None
+        for tag, valor in _tokens_ofx(self.caminho):
+            if tag == "CCSTMTRS":
+                self.cartao = True
+            elif tag == "STMTTRN":
+                transacao = {}
+            elif tag == "/STMTTRN" and transacao is not None:
+                try:
+                    yield Lancamento(
+                        converter_data(transacao["DTPOSTED"][:8]),
+                        " ".join((transacao.get("MEMO") or transacao.get("NAME") or "").split()),
+                        converter_valor(transacao["TRNAMT"]),
+                    )
+                except (KeyError, ValueError) as e:
+                    logger.debug("Transação do OFX ignorada: %s", e)
+                    yield None
+                transacao = None
+            elif transacao is not None and not tag.startswith("/"):
+                transacao[tag] = valor
+
+
+def _copiar(cursor, tabela: str, colunas: str, linhas: list):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(linhas)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {tabela} ({colunas}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _gravar_lote(cursor, schema: str, destino: str, lancamentos: list) -> int:
+    """Classifica as descrições distintas do lote numa chamada e grava com COPY; retorna as linhas gravadas."""
+    descricoes = list({l.descricao: None for l in lancamentos})
+    # Sem cache: o extrato expulsaria as descrições frequentes do LRU
+    categorias = dict(zip(descricoes, classificar_lote_usuario(schema, descricoes, usar_cache=False)))
+    meio = MEIO_PAGAMENTO[destino]
+
+    if destino == "gastos":
+        linhas = []
+        for l in lancamentos:
+            categoria, _, versao = categorias[l.descricao]
+            linhas.append((l.descricao, abs(l.valor), categoria, meio, 1, l.data.isoformat(), versao))
+        _copiar(cursor, f"{schema}.gastos",
+                "descricao, valor, categoria, meio_pagamento, parcelas, data, modelo_versao", linhas)
+        somar_ao_resumo(cursor, schema, gastos=[(l[1], l[2], l[3], l[5]) for l in linhas])
+    else:
+        linhas = []
+        for l in lancamentos:
+            categoria, _, versao = categorias[l.descricao]
+            linhas.extend(parcelas_fatura(l.descricao, abs(l.valor), categoria, meio, 1, l.data.isoformat(), versao))
+        _copiar(cursor, f"{schema}.fatura_cartao",
+                "descricao, valor, categoria, meio_pagamento, parcela, data_inicio, data_fim, modelo_versao", linhas)
+        somar_ao_resumo(cursor, schema, parcelas=[(l[1], l[2], l[3], l[6]) for l in linhas])
+    return len(linhas)
+
+
+def importar_extrato(caminho: str, schema: str, nome_arquivo: str = None, destino: str = None,
+                     tamanho_lote: int = IMPORTACAO_LOTE) -> dict:
+    """
+    Importa o extrato para o schema. `destino` ("gastos" ou "fatura") força a tabela;
+    sem ele, OFX de cartão vai para a fatura e, no CSV, decide o sinal predominante do
+    primeiro lote: maioria negativa é extrato de conta (débitos negativos), maioria
+    positiva é fatura de cartão (compras positivas). Lançamentos do sinal oposto
+    (créditos, estornos, pagamentos da fatura) são ignorados.
+    """
+    nome_arquivo = nome_arquivo or os.path.basename(caminho)
+    formato = os.path.splitext(nome_arquivo)[1].lower().lstrip(".")
+    if f".{formato}" not in EXTENSOES_EXTRATO:
+        raise ValueError(f"Formato não suportado: {nome_arquivo}")
+
+    inicio = time.perf_counter()
+    leitor = LeitorOFX(caminho) if formato == "ofx" else ler_csv(caminho)
+    # Um único iterador: o LeitorOFX recomeça do início a cada iter(), e aqui só vale por `cartao`
+    linhas = iter(leitor)
+    lotes = iter(lambda: list(itertools.islice(linhas, tamanho_lote)), [])
+    resultado = {"arquivo": nome_arquivo, "formato": formato, "destino": destino, "duplicado": False,
+                 "lidas": 0, "importadas": 0, "ignoradas": 0, "invalidas": 0}
+
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            INSERT INTO {schema}.importacoes (hash, arquivo, formato) VALUES (%s, %s, %s)
+            ON CONFLICT (hash) DO NOTHING RETURNING id
+        """, (_hash_arquivo(caminho), nome_arquivo, formato))
+        registro = cursor.fetchone()
+        if registro is None:
+            conn.rollback()
+            return {**resultado, "duplicado": True}
+
+        despesa_negativa = None
+        for lote in lotes:
+            validos = [l for l in lote if l is not None]
+            resultado["lidas"] += len(lote)
+            resultado["invalidas"] += len(lote) - len(validos)
+            if despesa_negativa is None:
+                if resultado["destino"] is None:
+                    if formato == "ofx":
+                        resultado["destino"] = "fatura" if leitor.cartao else "gastos"
+                    else:
+                        negativos = sum(l.valor < 0 for l in validos)
+                        resultado["destino"] = "gastos" if negativos * 2 > len(validos) else "fatura"
+                # OFX sempre usa débito negativo, inclusive no cartão
+                despesa_negativa = formato == "ofx" or resultado["destino"] == "gastos"
+
+            despesas = [l for l in validos if (l.valor < 0 if despesa_negativa else l.valor > 0)]
+            resultado["ignoradas"] += len(validos) - len(despesas)
+            if despesas:
+                resultado["importadas"] += len(despesas)
+                _gravar_lote(cursor, schema, resultado["destino"], despesas)
+
+        duracao = time.perf_counter() - inicio
+        resultado["segundos"] = round(duracao, 2)
+        resultado["linhas_por_segundo"] = round(resultado["lidas"] / duracao) if duracao else 0
+        cursor.execute(f"""
+            UPDATE {schema}.importacoes
+            SET destino = %s, lidas = %s, importadas = %s, segundos = %s
+            WHERE id = %s
+        """, (resultado["destino"], resultado["lidas"], resultado["importadas"], resultado["segundos"], registro[0]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    logger.info("📥 Extrato %s importado em %s: %s", nome_arquivo, schema, resultado)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa um extrato CSV ou OFX para o schema de um usuário.")
+    parser.add_argument("arquivo")
+    parser.add_argument("--schema", required=True)
+    parser.add_argument("--destino", choices=sorted(MEIO_PAGAMENTO), help="força gastos ou fatura")
+    parser.add_argument("--lote", type=int, default=IMPORTACAO_LOTE, help="lançamentos por lote")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    if not re.match(r"^[a-z_][a-z0-9_]*$", args.schema):
+        parser.error("schema inválido")
+    print(importar_extrato(args.arquivo, args.schema, destino=args.destino, tamanho_lote=args.lote))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,15 @@
 import os
-import cv2
-import numpy as np
 import re
 import pytesseract
 import pdfplumber
-from pyzbar.pyzbar import decode as pyzbar_decode
-from pyzxing import BarCodeReader
 from PIL import Image, ImageDraw, ImageFont
 import io
 from pdf2image import convert_from_path
 import contextlib
 from time import sleep
 import logging
+from backend.services.decodificacao_service import decodificar_imagem
+from backend.services.estatisticas_decodificacao_service import registrar_sucesso, sucessos_por_variante
 
 logger = logging.getLogger(__name__)
 
@@ -209,101 +207,27 @@ def extrair_produtos(texto):
 
     return produtos
 
-def rotate_image(image, angle):
-    (h, w) = image.shape[:2]
-    center = (w // 2, h // 2)
-    matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-    return cv2.warpAffine(image, matrix, (w, h))
-
-def decode_opencv(img_bgr):
-    detector = cv2.QRCodeDetector()
-    data, _, _ = detector.detectAndDecode(img_bgr)
-    return data
-
-def decode_pyzxing(img_path):
-    reader = BarCodeReader()
-    results = reader.decode(img_path)
-    if not results:
-        return None
-    return results[0].get('parsed') or results[0].get('raw')
-
-def apply_morphology(img, operation):
-    kernel = np.ones((2, 2), np.uint8)
-    if operation == "erode":
-        return cv2.erode(img, kernel, iterations=1)
-    elif operation == "dilate":
-        return cv2.dilate(img, kernel, iterations=1)
-    elif operation == "open":
-        return cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel)
-    elif operation == "close":
-        return cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)
-    return img
+# Método de regex (e não lambda) para poder seguir até os processos de decodificação
+RE_CHAVE_ACESSO = re.compile(r'\d{44}')
 
 def try_all_techniques(img_path, i):
-    original_color = cv2.imread(img_path, cv2.IMREAD_COLOR)
-    if original_color is None:
-        print(f"❌ Não foi possível carregar a imagem: {img_path}")
+    """
+    Lê o QR Code ou código de barras da NFC-e na foto (ver decodificacao_service) e
+    devolve tipo, conteúdo, chave de acesso e URL de consulta, mais o relatório da
+    decodificação (etapa, decodificador e tempos). As variantes que mais leram notas
+    até agora são tentadas primeiro.
+    """
+    resultado = decodificar_imagem(img_path, validar=RE_CHAVE_ACESSO.search, sucessos=sucessos_por_variante())
+    if resultado is None:
+        print(f"🚫 Não foi possível decodificar o QR Code da imagem {i} com nenhuma das heurísticas.")
         return None
+    registrar_sucesso(resultado)
 
-    original_gray = cv2.cvtColor(original_color, cv2.COLOR_BGR2GRAY)
-
-    angles = [0, 90, 180, 270]
-    thresholds = ["otsu", 50, 100, 150, 200]
-    morphological_ops = [None, "erode", "dilate", "open", "close"]
-
-    for angle in angles:
-        rotated_color = rotate_image(original_color, angle)
-        rotated_gray = rotate_image(original_gray, angle)
-
-        for thresh_val in thresholds:
-            gray_for_thresh = rotated_gray.copy()
-            if thresh_val == "otsu":
-                _, binarizada = cv2.threshold(gray_for_thresh, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            else:
-                _, binarizada = cv2.threshold(gray_for_thresh, thresh_val, 255, cv2.THRESH_BINARY)
-
-            for morph_op in morphological_ops:
-                morphed = apply_morphology(binarizada, morph_op)
-                final_bgr = cv2.cvtColor(morphed, cv2.COLOR_GRAY2BGR)
-
-                # 1️⃣ Tenta primeiro com Pyzbar
-                results_pyzbar = pyzbar_decode(Image.fromarray(morphed))
-                if results_pyzbar:
-                    print(f"[pyzbar] ✅ angle={angle}, thresh={thresh_val}, morph={morph_op}")
-                    data = results_pyzbar[0].data.decode("utf-8")
-                    tipo = results_pyzbar[0].type
-                    return extrair_info_qrcode(data, tipo)
-
-                # 2️⃣ Depois tenta OpenCV
-                data_opencv = decode_opencv(final_bgr)
-                if data_opencv:
-                    print(f"[OpenCV] ✅ angle={angle}, thresh={thresh_val}, morph={morph_op}")
-                    tipo = detectar_tipo_codigo(data_opencv)
-                    return extrair_info_qrcode(data_opencv, tipo)
-
-                # 3️⃣ Por fim tenta Pyzxing
-                temp_path = f"temp{i}.png"
-                cv2.imwrite(temp_path, morphed)
-                data_pyzxing = decode_pyzxing(temp_path)
-                if data_pyzxing:
-                    print(f"[pyzxing] ✅ angle={angle}, thresh={thresh_val}, morph={morph_op}")
-                    if isinstance(data_pyzxing, bytes):
-                        data_pyzxing = data_pyzxing.decode('utf-8', errors='ignore')
-
-                    tipo = detectar_tipo_codigo(data_pyzxing)
-                    chave_match = re.search(r'(\d{44})', data_pyzxing)
-                    if chave_match:
-                        chave = chave_match.group(1)
-                        consulta_url = f"https://ww1.receita.fazenda.df.gov.br/DecVisualizador/Nfce/Captcha?Chave={chave}"
-                        return {
-                            "tipo": tipo,
-                            "url_qrcode": data_pyzxing,
-                            "chave": chave,
-                            "consulta_url": consulta_url
-                        }
-
-    print("🚫 Não foi possível decodificar o QR Code com nenhuma das heurísticas.")
-    return None
+    print(f"[{resultado.decodificador}] ✅ etapa={resultado.etapa}, {resultado.variante}")
+    info = extrair_info_qrcode(resultado.dados, resultado.tipo or detectar_tipo_codigo(resultado.dados))
+    if info:
+        info["decodificacao"] = resultado.relatorio()
+    return info
 
 def detectar_tipo_codigo(data):
     data = data.lower()
@@ -0,0 +1,69 @@
+"""
+Medição de memória dos processos da aplicação (Linux, via /proc).
+
+RSS conta por inteiro as páginas compartilhadas com outros processos; PSS divide
+cada página compartilhada entre quem a usa, então a soma dos PSS é o custo real.
+
+    python -m backend.services.memoria_service
+"""
+import os
+
+# Trechos de linha de comando que identificam os processos da aplicação
+PROCESSOS_APLICACAO = ("backend.main", "classificador_sidecar", "uvicorn")
+
+
+def _ler_kb(caminho: str, campos: tuple) -> dict:
+    valores = {}
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                nome, _, resto = linha.partition(":")
+                if nome in campos:
+                    valores[nome] = int(resto.split()[0])
+    except (FileNotFoundError, PermissionError, ProcessLookupError):
+        pass
+    return valores
+
+
+def uso_memoria(pid="self") -> dict:
+    """RSS, PSS e a parte compartilhada do processo, em MB."""
+    rollup = _ler_kb(f"/proc/{pid}/smaps_rollup", ("Rss", "Pss", "Shared_Clean", "Shared_Dirty"))
+    if not rollup:
+        status = _ler_kb(f"/proc/{pid}/status", ("VmRSS",))
+        return {"rss_mb": round(status.get("VmRSS", 0) / 1024, 1), "pss_mb": None, "compartilhada_mb": None}
+    return {
+        "rss_mb": round(rollup.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(rollup.get("Pss", 0) / 1024, 1),
+        "compartilhada_mb": round((rollup.get("Shared_Clean", 0) + rollup.get("Shared_Dirty", 0)) / 1024, 1),
+    }
+
+
+def processos_aplicacao() -> list:
+    """(pid, linha de comando) dos processos da aplicação rodando nesta máquina."""
+    encontrados = []
+    for nome in os.listdir("/proc"):
+        if not nome.isdigit() or int(nome) == os.getpid():
+            continue
+        try:
+            with open(f"/proc/{nome}/cmdline", "rb") as f:
+                comando = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+        except (FileNotFoundError, PermissionError, ProcessLookupError):
+            continue
+        if any(trecho in comando for trecho in PROCESSOS_APLICACAO):
+            encontrados.append((int(nome), comando))
+    return sorted(encontrados)
+
+
+def main():
+    total_rss = total_pss = 0.0
+    print(f"{'pid':>7} {'rss_mb':>8} {'pss_mb':>8} {'compart.':>8}  comando")
+    for pid, comando in processos_aplicacao():
+        uso = uso_memoria(pid)
+        total_rss += uso["rss_mb"]
+        total_pss += uso["pss_mb"] or 0
+        print(f"{pid:>7} {uso['rss_mb']:>8} {uso['pss_mb'] or '-':>8} {uso['compartilhada_mb'] or '-':>8}  {comando[:80]}")
+    print(f"{'total':>7} {total_rss:>8.1f} {total_pss:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
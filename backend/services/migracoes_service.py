@@ -0,0 +1,349 @@
+"""
+Migrações versionadas do banco. Cada schema (o public e o de cada usuário) tem sua
+própria tabela schema_migracoes com as versões já aplicadas; só as pendentes rodam.
+
+Uso no deploy, para atualizar o public e todos os schemas de usuários de uma vez:
+    python -m backend.services.migracoes_service
+"""
+import argparse
+import logging
+from dataclasses import dataclass
+
+from backend.services.db_init import conectar_bd, criar_tabela_mensagens
+from backend.services.resumo_service import reconstruir_resumo
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Migracao:
+    versao: int
+    descricao: str
+    # Comandos SQL (com `{schema}` onde entra o nome do schema) ou funções `(cursor, schema)`
+    passos: list
+
+
+MIGRACOES_PUBLICAS = [
+    Migracao(1, "tabelas base", [
+        """
+        CREATE TABLE IF NOT EXISTS gastos (
+            id SERIAL PRIMARY KEY,
+            descricao TEXT,
+            valor REAL,
+            categoria TEXT,
+            meio_pagamento TEXT,
+            parcelas INT DEFAULT 1,
+            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS salario (
+            id SERIAL PRIMARY KEY,
+            valor REAL,
+            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS fatura_cartao (
+            id SERIAL PRIMARY KEY,
+            descricao TEXT,
+            valor REAL,
+            categoria TEXT,
+            meio_pagamento TEXT,
+            parcela TEXT,
+            data_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_fim DATE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lembretes (
+            id SERIAL PRIMARY KEY,
+            telefone TEXT,
+            mensagem TEXT,
+            cron TEXT,
+            data_inclusao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id SERIAL PRIMARY KEY,
+            nome TEXT,
+            telefone TEXT UNIQUE,
+            autorizado BOOLEAN DEFAULT false,
+            data_inclusao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tokens_ativos (
+            id SERIAL PRIMARY KEY,
+            telefone TEXT NOT NULL,
+            token TEXT NOT NULL UNIQUE,
+            schema TEXT NOT NULL,
+            criado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+            expira_em TIMESTAMP NOT NULL
+        )
+        """,
+        lambda cursor, schema: criar_tabela_mensagens(cursor),
+    ]),
+    Migracao(2, "usuarios.schema_user", [
+        "ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS schema_user TEXT",
+    ]),
+    Migracao(3, "índices das consultas por data, telefone e expiração", [
+        "CREATE INDEX IF NOT EXISTS idx_gastos_data ON gastos (data)",
+        "CREATE INDEX IF NOT EXISTS idx_fatura_cartao_data_fim ON fatura_cartao (data_fim)",
+        "CREATE INDEX IF NOT EXISTS idx_lembretes_telefone ON lembretes (telefone)",
+        # A busca por token já usa o índice do UNIQUE; este atende validar_token por
+        # telefone e a limpeza de tokens expirados
+        "CREATE INDEX IF NOT EXISTS idx_tokens_ativos_telefone_expira ON tokens_ativos (telefone, expira_em)",
+        "CREATE INDEX IF NOT EXISTS idx_tokens_ativos_expira ON tokens_ativos (expira_em)",
+    ]),
+    Migracao(4, "lista de revogação de tokens assinados", [
+        """
+        CREATE TABLE IF NOT EXISTS tokens_revogados (
+            id SERIAL PRIMARY KEY,
+            token_id TEXT,
+            telefone TEXT NOT NULL,
+            revogado_em TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'America/Sao_Paulo'),
+            expira_em TIMESTAMP NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_tokens_revogados_expira ON tokens_revogados (expira_em)",
+    ]),
+    Migracao(5, "variantes que mais decodificam QR Codes e códigos de barras", [
+        """
+        CREATE TABLE IF NOT EXISTS estatisticas_decodificacao (
+            decodificador TEXT NOT NULL,
+            angulo INTEGER NOT NULL,
+            -- '' quando a variante não tem limiar ou morfologia
+            limiar TEXT NOT NULL,
+            morfologia TEXT NOT NULL,
+            sucessos INTEGER NOT NULL DEFAULT 0,
+            ultimo_sucesso TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'America/Sao_Paulo'),
+            PRIMARY KEY (decodificador, angulo, limiar, morfologia)
+        )
+        """,
+    ]),
+]
+
+MIGRACOES_TENANT = [
+    Migracao(1, "tabelas do usuário", [
+        """
+        CREATE TABLE IF NOT EXISTS {schema}.gastos (
+            id SERIAL PRIMARY KEY,
+            descricao TEXT,
+            valor REAL,
+            categoria TEXT,
+            meio_pagamento TEXT,
+            parcelas INT DEFAULT 1,
+            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS {schema}.fatura_cartao (
+            id SERIAL PRIMARY KEY,
+            descricao TEXT,
+            valor REAL,
+            categoria TEXT,
+            meio_pagamento TEXT,
+            parcela TEXT,
+            data_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_fim DATE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS {schema}.lembretes (
+            id SERIAL PRIMARY KEY,
+            telefone TEXT,
+            mensagem TEXT,
+            cron TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS {schema}.salario (
+            id SERIAL PRIMARY KEY,
+            valor REAL,
+            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS {schema}.email (
+            id SERIAL PRIMARY KEY,
+            telefone TEXT NOT NULL,
+            email_user TEXT NOT NULL,
+            email_pass TEXT NOT NULL,
+            descricao TEXT,
+            data_inclusao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS {schema}.localizacoes_usuario (
+            id SERIAL PRIMARY KEY,
+            telefone TEXT,
+            latitude FLOAT,
+            longitude FLOAT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    Migracao(2, "índices das consultas por data e telefone", [
+        "CREATE INDEX IF NOT EXISTS idx_gastos_data ON {schema}.gastos (data)",
+        "CREATE INDEX IF NOT EXISTS idx_fatura_cartao_data_fim ON {schema}.fatura_cartao (data_fim)",
+        "CREATE INDEX IF NOT EXISTS idx_lembretes_telefone ON {schema}.lembretes (telefone)",
+        "CREATE INDEX IF NOT EXISTS idx_email_telefone ON {schema}.email (telefone)",
+        "CREATE INDEX IF NOT EXISTS idx_localizacoes_telefone_timestamp "
+        "ON {schema}.localizacoes_usuario (telefone, timestamp DESC)",
+    ]),
+    Migracao(3, "resumo mensal por categoria e meio de pagamento", [
+        reconstruir_resumo,
+    ]),
+    Migracao(4, "versão do modelo que definiu a categoria", [
+        "ALTER TABLE {schema}.gastos ADD COLUMN IF NOT EXISTS modelo_versao TEXT",
+        "ALTER TABLE {schema}.fatura_cartao ADD COLUMN IF NOT EXISTS modelo_versao TEXT",
+    ]),
+    Migracao(5, "categorias ensinadas pelo usuário", [
+        """
+        CREATE TABLE IF NOT EXISTS {schema}.categorias_aprendidas (
+            id SERIAL PRIMARY KEY,
+            padrao TEXT NOT NULL,
+            tipo TEXT NOT NULL DEFAULT 'exata' CHECK (tipo IN ('exata', 'prefixo')),
+            categoria TEXT NOT NULL,
+            criado_em TIMESTAMPTZ DEFAULT NOW(),
+            UNIQUE (padrao, tipo)
+        )
+        """,
+    ]),
+    Migracao(6, "extratos importados", [
+        """
+        CREATE TABLE IF NOT EXISTS {schema}.importacoes (
+            id SERIAL PRIMARY KEY,
+            hash TEXT NOT NULL UNIQUE,
+            arquivo TEXT,
+            formato TEXT,
+            destino TEXT,
+            lidas INT,
+            importadas INT,
+            segundos REAL,
+            importado_em TIMESTAMPTZ DEFAULT NOW()
+        )
+        """,
+    ]),
+]
+
+
+def aplicar_migracoes(cursor, schema: str, migracoes: list) -> list:
+    """
+    Aplica no `schema` as migrações ainda não registradas, em ordem de versão, e
+    retorna as versões aplicadas. Roda na transação do cursor: quem chama faz o commit.
+    Um advisory lock por schema impede que dois processos migrem o mesmo schema juntos.
+    """
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"migracoes:{schema}",))
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.schema_migracoes (
+            versao INT PRIMARY KEY,
+            descricao TEXT,
+            aplicada_em TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    cursor.execute(f"SELECT versao FROM {schema}.schema_migracoes")
+    aplicadas = {linha[0] for linha in cursor.fetchall()}
+
+    novas = []
+    for migracao in sorted(migracoes, key=lambda m: m.versao):
+        if migracao.versao in aplicadas:
+            continue
+        for passo in migracao.passos:
+            if callable(passo):
+                passo(cursor, schema)
+            else:
+                cursor.execute(passo.format(schema=schema))
+        cursor.execute(
+            f"INSERT INTO {schema}.schema_migracoes (versao, descricao) VALUES (%s, %s)",
+            (migracao.versao, migracao.descricao)
+        )
+        novas.append(migracao.versao)
+
+    if novas:
+        logger.info("🧱 Schema %s migrado para as versões %s", schema, novas)
+    return novas
+
+
+def migrar_publico() -> list:
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    novas = aplicar_migracoes(cursor, "public", MIGRACOES_PUBLICAS)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return novas
+
+
+def migrar_tenant(schema: str, cursor=None) -> list:
+    """
+    Cria o schema do usuário (se preciso) e aplica as migrações pendentes. Com `cursor`,
+    roda dentro da transação de quem chamou (ex.: liberar_usuario).
+    """
+    if cursor is not None:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        return aplicar_migracoes(cursor, schema, MIGRACOES_TENANT)
+
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        novas = aplicar_migracoes(cursor, schema, MIGRACOES_TENANT)
+        conn.commit()
+        return novas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def listar_schemas_tenant() -> list:
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT schema_user FROM usuarios WHERE schema_user IS NOT NULL ORDER BY schema_user")
+    schemas = [linha[0] for linha in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    return schemas
+
+
+def migrar_todos_tenants() -> dict:
+    """
+    Atualiza todos os schemas de usuários, cada um na sua transação: uma falha num
+    schema é registrada e não impede os demais. Retorna {schema: versões aplicadas | erro}.
+    """
+    resultado = {}
+    for schema in listar_schemas_tenant():
+        try:
+            resultado[schema] = migrar_tenant(schema)
+        except Exception as e:
+            logger.error("❌ Falha ao migrar o schema %s: %s", schema, e)
+            resultado[schema] = f"erro: {e}"
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aplica as migrações pendentes do banco.")
+    parser.add_argument("--somente-publico", action="store_true", help="não migra os schemas dos usuários")
+    parser.add_argument("--schema", help="migra apenas o schema de usuário informado")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    print(f"public: {migrar_publico() or 'em dia'}")
+    if args.schema:
+        print(f"{args.schema}: {migrar_tenant(args.schema) or 'em dia'}")
+    elif not args.somente_publico:
+        falhas = 0
+        for schema, novas in migrar_todos_tenants().items():
+            falhas += isinstance(novas, str)
+            print(f"{schema}: {novas or 'em dia'}")
+        if falhas:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
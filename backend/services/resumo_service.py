@@ -0,0 +1,147 @@
+"""
+Resumo mensal por usuário: {schema}.resumo_mensal guarda, por (mes, categoria,
+meio_pagamento), o total e a quantidade de gastos (pelo mês de gastos.data) e de
+parcelas de cartão (pelo mês de vencimento, fatura_cartao.data_fim).
+
+É mantido na mesma transação das escritas em gastos_service. Para recalcular do zero:
+    python -m backend.services.resumo_service [--schema nome]
+"""
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date
+
+from psycopg2.extras import execute_values
+
+from backend.services.db_init import conectar_bd
+
+logger = logging.getLogger(__name__)
+
+SQL_CRIAR_RESUMO = """
+    CREATE TABLE IF NOT EXISTS {schema}.resumo_mensal (
+        mes DATE NOT NULL,
+        categoria TEXT NOT NULL DEFAULT '',
+        meio_pagamento TEXT NOT NULL DEFAULT '',
+        total_gastos NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        qtd_gastos INT NOT NULL DEFAULT 0,
+        total_fatura NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        qtd_parcelas INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (mes, categoria, meio_pagamento)
+    )
+"""
+
+# Soma os deltas às linhas existentes; a chave é (mes, categoria, meio_pagamento)
+SQL_SOMAR_RESUMO = """
+    INSERT INTO {schema}.resumo_mensal
+        (mes, categoria, meio_pagamento, total_gastos, qtd_gastos, total_fatura, qtd_parcelas)
+    VALUES %s
+    ON CONFLICT (mes, categoria, meio_pagamento) DO UPDATE SET
+        total_gastos = resumo_mensal.total_gastos + EXCLUDED.total_gastos,
+        qtd_gastos = resumo_mensal.qtd_gastos + EXCLUDED.qtd_gastos,
+        total_fatura = resumo_mensal.total_fatura + EXCLUDED.total_fatura,
+        qtd_parcelas = resumo_mensal.qtd_parcelas + EXCLUDED.qtd_parcelas
+"""
+
+
+def mes_de(data) -> date | None:
+    """Primeiro dia do mês de uma data (str YYYY-MM-DD, date ou datetime); None = mês atual do banco."""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        data = date.fromisoformat(data[:10])
+    return date(data.year, data.month, 1)
+
+
+def somar_ao_resumo(cursor, schema: str, gastos=(), parcelas=()):
+    """
+    Atualiza o resumo na transação do cursor com as linhas recém-inseridas.
+    `gastos`: (valor, categoria, meio_pagamento, data) e `parcelas`:
+    (valor, categoria, meio_pagamento, data_fim). Data None conta no mês atual.
+    """
+    deltas = defaultdict(lambda: [0.0, 0, 0.0, 0])
+    for valor, categoria, meio_pagamento, data in gastos:
+        delta = deltas[(mes_de(data), categoria or "", meio_pagamento or "")]
+        delta[0] += valor or 0
+        delta[1] += 1
+    for valor, categoria, meio_pagamento, data_fim in parcelas:
+        delta = deltas[(mes_de(data_fim), categoria or "", meio_pagamento or "")]
+        delta[2] += valor or 0
+        delta[3] += 1
+    if not deltas:
+        return
+
+    linhas = [(*chave, *delta) for chave, delta in deltas.items()]
+    execute_values(
+        cursor, SQL_SOMAR_RESUMO.format(schema=schema), linhas,
+        template="(COALESCE(%s::date, date_trunc('month', CURRENT_DATE)::date), %s, %s, %s, %s, %s, %s)",
+        page_size=len(linhas),
+    )
+
+
+def reconstruir_resumo(cursor, schema: str):
+    """Recalcula o resumo a partir de gastos e fatura_cartao, na transação do cursor."""
+    cursor.execute(SQL_CRIAR_RESUMO.format(schema=schema))
+    # Impede escritas concorrentes entre o recálculo e o fim da transação
+    cursor.execute(f"LOCK TABLE {schema}.gastos, {schema}.fatura_cartao, {schema}.resumo_mensal IN SHARE ROW EXCLUSIVE MODE")
+    cursor.execute(f"DELETE FROM {schema}.resumo_mensal")
+    cursor.execute(f"""
+        INSERT INTO {schema}.resumo_mensal
+            (mes, categoria, meio_pagamento, total_gastos, qtd_gastos, total_fatura, qtd_parcelas)
+        SELECT mes, categoria, meio_pagamento,
+               SUM(total_gastos), SUM(qtd_gastos), SUM(total_fatura), SUM(qtd_parcelas)
+        FROM (
+            SELECT date_trunc('month', data)::date AS mes,
+                   COALESCE(categoria, '') AS categoria, COALESCE(meio_pagamento, '') AS meio_pagamento,
+                   SUM(valor) AS total_gastos, COUNT(*) AS qtd_gastos, 0 AS total_fatura, 0 AS qtd_parcelas
+            FROM {schema}.gastos WHERE data IS NOT NULL
+            GROUP BY 1, 2, 3
+            UNION ALL
+            SELECT date_trunc('month', data_fim)::date,
+                   COALESCE(categoria, ''), COALESCE(meio_pagamento, ''),
+                   0, 0, SUM(valor), COUNT(*)
+            FROM {schema}.fatura_cartao WHERE data_fim IS NOT NULL
+            GROUP BY 1, 2, 3
+        ) agregados
+        GROUP BY mes, categoria, meio_pagamento
+    """)
+    return cursor.rowcount
+
+
+def reconstruir_resumo_schema(schema: str) -> int:
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    try:
+        linhas = reconstruir_resumo(cursor, schema)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    logger.info("📊 Resumo mensal de %s reconstruído: %d linhas", schema, linhas)
+    return linhas
+
+
+def total_gastos_mes(cursor, schema: str) -> float:
+    cursor.execute(f"""
+        SELECT COALESCE(SUM(total_gastos), 0) FROM {schema}.resumo_mensal
+        WHERE mes = date_trunc('month', CURRENT_DATE)::date
+    """)
+    return float(cursor.fetchone()[0])
+
+
+def main():
+    from backend.services.migracoes_service import listar_schemas_tenant
+
+    parser = argparse.ArgumentParser(description="Reconstrói o resumo mensal de gastos.")
+    parser.add_argument("--schema", help="reconstrói apenas o schema informado")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    for schema in [args.schema] if args.schema else listar_schemas_tenant():
+        print(f"{schema}: {reconstruir_resumo_schema(schema)} linhas")
+
+
+if __name__ == "__main__":
+    main()
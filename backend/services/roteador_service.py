@@ -0,0 +1,139 @@
+import logging
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ContextoMensagem:
+    """Dados de uma mensagem de texto já autorizada, repassados a cada handler."""
+    telefone: str
+    mensagem: str
+    schema: str
+    inicio: float
+    timestamp_whatsapp: int
+    mensagem_lower: str = field(init=False)
+    partes: list = field(init=False)
+
+    def __post_init__(self):
+        self.mensagem_lower = self.mensagem.lower()
+        self.partes = self.mensagem.split()
+
+
+@dataclass
+class Regra:
+    nome: str
+    handler: object
+    condicao: object = None
+    # Revalida a autorização no banco em vez de confiar no cache de usuários
+    sensivel: bool = False
+
+    def aceita(self, ctx: ContextoMensagem) -> bool:
+        return self.condicao is None or self.condicao(ctx)
+
+
+class TriePrefixos:
+    """Trie de caracteres: devolve os valores de todos os prefixos registrados que casam com o texto."""
+
+    _VALORES = None  # chave reservada do nó para guardar os valores
+
+    def __init__(self):
+        self._raiz = {}
+
+    def inserir(self, prefixo: str, valor):
+        no = self._raiz
+        for caractere in prefixo:
+            no = no.setdefault(caractere, {})
+        no.setdefault(self._VALORES, []).append(valor)
+
+    def buscar(self, texto: str) -> list:
+        """Valores dos prefixos de `texto`, do prefixo mais longo para o mais curto."""
+        encontrados = []
+        no = self._raiz
+        for caractere in texto:
+            no = no.get(caractere)
+            if no is None:
+                break
+            if self._VALORES in no:
+                encontrados.append(no[self._VALORES])
+        return [valor for valores in reversed(encontrados) for valor in valores]
+
+
+class RoteadorComandos:
+    """
+    Despacha mensagens de texto a partir da lista de comandos. Ordem de resolução:
+    1. comandos fixos (`exatos`) via dicionário, na ordem da lista;
+    2. comandos com parâmetro (`prefixos`) via trie, do prefixo mais longo ao mais curto;
+    3. expressões regulares (`regex`), pré-compiladas, na ordem da lista;
+    4. `fallback` (registro de gasto em texto livre);
+    5. `desconhecido`.
+    Regras com `condicao` só são usadas quando a condição é satisfeita.
+    """
+
+    def __init__(self, comandos: list, fallback: Regra = None, desconhecido: Regra = None):
+        self._exatos = {}
+        self._prefixos = TriePrefixos()
+        self._regex = []
+        self.fallback = fallback
+        self.desconhecido = desconhecido
+        self._metricas = {}
+
+        for cmd in comandos:
+            handler = cmd.get("handler")
+            if handler is None:
+                continue
+            regra = Regra(cmd["comando"], handler, cmd.get("condicao"),
+                          cmd.get("sensivel", cmd.get("admin_only", False)))
+            for exato in cmd.get("exatos", []):
+                self._exatos.setdefault(exato, []).append(regra)
+            for prefixo in cmd.get("prefixos", []):
+                self._prefixos.inserir(prefixo, regra)
+            for padrao in cmd.get("regex", []):
+                self._regex.append((padrao, regra))
+
+    def resolver(self, ctx: ContextoMensagem):
+        for regra in self._exatos.get(ctx.mensagem_lower, []):
+            if regra.aceita(ctx):
+                return regra
+
+        for regra in self._prefixos.buscar(ctx.mensagem_lower):
+            if regra.aceita(ctx):
+                return regra
+
+        for padrao, regra in self._regex:
+            if padrao.search(ctx.mensagem_lower) and regra.aceita(ctx):
+                return regra
+
+        if self.fallback is not None and self.fallback.aceita(ctx):
+            return self.fallback
+        return self.desconhecido
+
+    async def despachar(self, ctx: ContextoMensagem, regra: Regra = None):
+        """Executa a regra já resolvida (ou resolve agora) e registra o tempo do handler."""
+        regra = regra or self.resolver(ctx)
+        if regra is None:
+            return None
+
+        inicio = time.perf_counter()
+        try:
+            return await regra.handler(ctx)
+        finally:
+            self._registrar_tempo(regra.nome, time.perf_counter() - inicio)
+
+    def _registrar_tempo(self, nome: str, duracao: float):
+        metrica = self._metricas.setdefault(nome, {"chamadas": 0, "tempo_total_ms": 0.0, "tempo_max_ms": 0.0})
+        metrica["chamadas"] += 1
+        metrica["tempo_total_ms"] += duracao * 1000
+        metrica["tempo_max_ms"] = max(metrica["tempo_max_ms"], duracao * 1000)
+
+    def status(self) -> dict:
+        return {
+            nome: {
+                **metrica,
+                "tempo_total_ms": round(metrica["tempo_total_ms"], 2),
+                "tempo_max_ms": round(metrica["tempo_max_ms"], 2),
+                "tempo_medio_ms": round(metrica["tempo_total_ms"] / metrica["chamadas"], 2),
+            }
+            for nome, metrica in self._metricas.items()
+        }
@@ -1,11 +1,12 @@
 # scheduler.py
-import psycopg2
+from backend.services.db_init import conectar_bd, manter_particoes_mensagens
 import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from dotenv import load_dotenv
 import os
 from backend.services.whatsapp_service import enviar_mensagem_whatsapp
+from backend.services.token_service import limpar_tokens_expirados
 
 # Carregar variáveis do .env
 load_dotenv()
@@ -18,7 +19,7 @@ def alerta_fatura():
     hoje = datetime.date.today()
     primeiro_dia_mes = hoje.replace(day=1)
 
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = conectar_bd()
     cursor = conn.cursor()
     cursor.execute("SELECT SUM(valor) FROM fatura_cartao WHERE data_fim BETWEEN %s AND %s",
                    (primeiro_dia_mes, primeiro_dia_mes + datetime.timedelta(days=30)))
@@ -31,6 +32,10 @@ def alerta_fatura():
         enviar_mensagem_whatsapp(os.getenv("WHATSAPP_NUMBER"), mensagem)
 
 scheduler.add_job(alerta_fatura, "cron", day=1, hour=9)
+# Cria as partições dos próximos dias e aplica a retenção de mensagens_recebidas
+scheduler.add_job(manter_particoes_mensagens, "cron", hour=0, minute=5, id="manter_particoes_mensagens", replace_existing=True)
+# Remove tokens do dashboard e revogações já vencidos
+scheduler.add_job(limpar_tokens_expirados, "interval", minutes=15, id="limpar_tokens_expirados", replace_existing=True)
 
 def normalizar_cron(expr):
     partes = expr.strip().split()
@@ -64,7 +69,7 @@ def agendar_lembrete_cron(telefone: str, mensagem: str, cron_expr: str):
         print(f"✅ Lembrete agendado para {telefone}: '{mensagem}' → {cron_expr}")
 
         # Salvar no banco
-        conn = psycopg2.connect(DATABASE_URL)
+        conn = conectar_bd()
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO lembretes (telefone, mensagem, cron)
@@ -78,7 +83,7 @@ def agendar_lembrete_cron(telefone: str, mensagem: str, cron_expr: str):
         print(f"Erro ao agendar lembrete: {e}")
 
 def carregar_lembretes_salvos():
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = conectar_bd()
     cursor = conn.cursor()
     cursor.execute("SELECT telefone, mensagem, cron FROM lembretes")
     lembretes = cursor.fetchall()
@@ -1,41 +1,151 @@
 from datetime import datetime, timedelta
+import base64
+import hashlib
+import hmac
+import logging
+import os
 import secrets
+import threading
+import time
+from dotenv import load_dotenv
 from backend.services.db_init import conectar_bd
+from backend.services.autorizacao_service import obter_usuario
 import pytz  # <- você pode adicionar ao requirements.txt
 
-def gerar_token_acesso(telefone: str) -> dict:
-    fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-    agora = datetime.now(fuso_brasilia)
-    expira_em = agora + timedelta(minutes=30)
-    token = secrets.token_urlsafe(16)
+load_dotenv()
+logger = logging.getLogger(__name__)
+fuso_brasilia = pytz.timezone("America/Sao_Paulo")
 
-    conn = conectar_bd()
-    cursor = conn.cursor()
+# Com TOKEN_SECRETO definido, os links do dashboard levam um token assinado (HMAC)
+# com telefone, schema e validade, conferido sem consultar o banco. Sem ele, ou com
+# TOKEN_MODO=banco, os tokens continuam sendo gravados em tokens_ativos.
+TOKEN_SECRETO = os.getenv("TOKEN_SECRETO", "")
+TOKEN_MODO = (os.getenv("TOKEN_MODO") or ("assinado" if TOKEN_SECRETO else "banco")).lower()
+TOKEN_VALIDADE_MINUTOS = int(os.getenv("TOKEN_VALIDADE_MINUTOS", "30"))
+# Lista de revogação de tokens assinados (opcional), relida do banco a cada N segundos
+TOKEN_REVOGACAO = os.getenv("TOKEN_REVOGACAO", "false").lower() in ("1", "true", "sim")
+TOKEN_REVOGACAO_RECARGA = float(os.getenv("TOKEN_REVOGACAO_RECARGA", "60"))
 
-    # 🔍 Buscar schema
-    cursor.execute("SELECT schema_user FROM usuarios WHERE telefone = %s", (telefone,))
-    resultado = cursor.fetchone()
+if TOKEN_MODO == "assinado" and not TOKEN_SECRETO:
+    raise RuntimeError("TOKEN_MODO=assinado exige TOKEN_SECRETO")
+
+
+def _b64(dados: bytes) -> str:
+    return base64.urlsafe_b64encode(dados).rstrip(b"=").decode()
+
+
+def _b64_decode(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _assinar(carga: str) -> str:
+    return _b64(hmac.new(TOKEN_SECRETO.encode(), carga.encode(), hashlib.sha256).digest())
+
+
+def gerar_token_assinado(telefone: str, schema: str, emitido_em: datetime, expira_em: datetime) -> str:
+    """Token `carga.assinatura`, com carga = telefone|schema|emissão|expiração|id em base64."""
+    carga = "|".join([
+        telefone, schema, str(int(emitido_em.timestamp())), str(int(expira_em.timestamp())), secrets.token_hex(6)
+    ])
+    carga_b64 = _b64(carga.encode())
+    return f"{carga_b64}.{_assinar(carga_b64)}"
+
+
+def ler_token_assinado(token: str) -> dict | None:
+    """Confere assinatura e formato; retorna os campos da carga ou None. Não olha a validade."""
+    if not TOKEN_SECRETO or token.count(".") != 1:
+        return None
+    carga_b64, assinatura = token.split(".")
+    if not hmac.compare_digest(assinatura, _assinar(carga_b64)):
+        return None
+    try:
+        telefone, schema, emitido, expira, token_id = _b64_decode(carga_b64).decode().split("|")
+        return {
+            "telefone": telefone,
+            "schema": schema,
+            "emitido_em": int(emitido),
+            "expira_em": int(expira),
+            "id": token_id,
+        }
+    except ValueError:
+        return None
 
-    if not resultado or not resultado[0]:
+
+class ListaRevogacao:
+    """
+    Cópia em memória de tokens_revogados, recarregada no máximo a cada `recarga`
+    segundos. Revoga um token pelo id ou todos os tokens de um telefone emitidos até
+    um instante (linha com token_id NULL).
+    """
+
+    def __init__(self, recarga: float = TOKEN_REVOGACAO_RECARGA):
+        self.recarga = recarga
+        self._ids = set()
+        self._telefones = {}
+        self._carregado_em = 0.0
+        self._lock = threading.Lock()
+
+    def _recarregar(self):
+        conn = conectar_bd()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT token_id, telefone, revogado_em FROM tokens_revogados
+            WHERE expira_em > (NOW() AT TIME ZONE 'America/Sao_Paulo')
+        """)
+        ids, telefones = set(), {}
+        for token_id, telefone, revogado_em in cursor.fetchall():
+            if token_id:
+                ids.add(token_id)
+            else:
+                instante = fuso_brasilia.localize(revogado_em).timestamp()
+                telefones[telefone] = max(telefones.get(telefone, 0), instante)
         cursor.close()
         conn.close()
-        raise ValueError("❌ Schema do usuário não encontrado.")
+        self._ids, self._telefones = ids, telefones
+        self._carregado_em = time.monotonic()
 
-    schema = resultado[0]
+    def revogado(self, dados: dict) -> bool:
+        with self._lock:
+            if time.monotonic() - self._carregado_em > self.recarga:
+                try:
+                    self._recarregar()
+                except Exception as e:
+                    # Sem conseguir recarregar, segue com a última lista conhecida
+                    logger.error("❌ Erro ao recarregar tokens revogados: %s", e)
+                    self._carregado_em = time.monotonic()
+            return dados["id"] in self._ids or dados["emitido_em"] <= self._telefones.get(dados["telefone"], 0)
 
-    # 🧹 Limpar tokens expirados
-    cursor.execute("DELETE FROM tokens_ativos WHERE expira_em < (NOW() AT TIME ZONE 'America/Sao_Paulo')")
-    print("🧹 Tokens expirados removidos:", cursor.rowcount)
+    def invalidar(self):
+        with self._lock:
+            self._carregado_em = 0.0
 
-    # 🆕 Inserir token
-    cursor.execute("""
-        INSERT INTO tokens_ativos (telefone, token, schema, criado_em, expira_em)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (telefone, token, schema, agora, expira_em))
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+lista_revogacao = ListaRevogacao()
+
+
+def gerar_token_acesso(telefone: str) -> dict:
+    agora = datetime.now(fuso_brasilia)
+    expira_em = agora + timedelta(minutes=TOKEN_VALIDADE_MINUTOS)
+
+    # 🔍 Buscar schema (via cache de usuários)
+    schema = obter_usuario(telefone)[1]
+    if not schema:
+        raise ValueError("❌ Schema do usuário não encontrado.")
+
+    if TOKEN_MODO == "assinado":
+        token = gerar_token_assinado(telefone, schema, agora, expira_em)
+    else:
+        token = secrets.token_urlsafe(16)
+        conn = conectar_bd()
+        cursor = conn.cursor()
+        # 🆕 Inserir token (expirados são removidos por limpar_tokens_expirados)
+        cursor.execute("""
+            INSERT INTO tokens_ativos (telefone, token, schema, criado_em, expira_em)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (telefone, token, schema, agora, expira_em))
+        conn.commit()
+        cursor.close()
+        conn.close()
 
     return {
         "token": token,
@@ -43,14 +153,22 @@ def gerar_token_acesso(telefone: str) -> dict:
         "schema": schema
     }
 
+
 def validar_token(telefone: str, token: str) -> tuple[str, datetime] | None:
-    conn = conectar_bd()
-    cursor = conn.cursor()
+    if not telefone or not token:
+        return None
 
-    print("🔍 Validando token...")
-    print("📲 Telefone:", telefone)
-    print("🔐 Token:", token)
+    dados = ler_token_assinado(token)
+    if dados is not None:
+        if dados["telefone"] != telefone or dados["expira_em"] <= time.time():
+            return None
+        if TOKEN_REVOGACAO and lista_revogacao.revogado(dados):
+            return None
+        return dados["schema"], datetime.fromtimestamp(dados["expira_em"], fuso_brasilia)
 
+    # Tokens gravados no banco (TOKEN_MODO=banco ou links emitidos antes da troca de modo)
+    conn = conectar_bd()
+    cursor = conn.cursor()
     cursor.execute(
         """
         SELECT schema, expira_em FROM tokens_ativos
@@ -60,13 +178,65 @@ def validar_token(telefone: str, token: str) -> tuple[str, datetime] | None:
         """,
         (telefone, token)
     )
-
     resultado = cursor.fetchone()
-    print("📤 Resultado da query:", resultado)
-
     cursor.close()
     conn.close()
 
     if resultado:
-        return resultado[0], resultado[1]
-    return None
\ No newline at end of file
+        return resultado[0], fuso_brasilia.localize(resultado[1])
+    return None
+
+
+def revogar_token(token: str) -> bool:
+    """Invalida um token antes do prazo: remove de tokens_ativos ou registra o assinado como revogado."""
+    dados = ler_token_assinado(token)
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    if dados is None:
+        cursor.execute("DELETE FROM tokens_ativos WHERE token = %s", (token,))
+        sucesso = cursor.rowcount > 0
+    else:
+        cursor.execute("""
+            INSERT INTO tokens_revogados (token_id, telefone, expira_em)
+            VALUES (%s, %s, %s)
+        """, (dados["id"], dados["telefone"], datetime.fromtimestamp(dados["expira_em"], fuso_brasilia).replace(tzinfo=None)))
+        sucesso = True
+    conn.commit()
+    cursor.close()
+    conn.close()
+    lista_revogacao.invalidar()
+    return sucesso
+
+
+def revogar_tokens_telefone(telefone: str, cursor=None):
+    """Invalida todos os tokens já emitidos para o telefone (ex.: ao revogar o usuário)."""
+    proprio = cursor is None
+    if proprio:
+        conn = conectar_bd()
+        cursor = conn.cursor()
+    cursor.execute("DELETE FROM tokens_ativos WHERE telefone = %s", (telefone,))
+    cursor.execute("""
+        INSERT INTO tokens_revogados (token_id, telefone, expira_em)
+        VALUES (NULL, %s, (NOW() AT TIME ZONE 'America/Sao_Paulo') + %s * INTERVAL '1 minute')
+    """, (telefone, TOKEN_VALIDADE_MINUTOS))
+    if proprio:
+        conn.commit()
+        cursor.close()
+        conn.close()
+    lista_revogacao.invalidar()
+
+
+def limpar_tokens_expirados() -> int:
+    """Job periódico: apaga tokens e revogações cuja validade já passou."""
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tokens_ativos WHERE expira_em < (NOW() AT TIME ZONE 'America/Sao_Paulo')")
+    removidos = cursor.rowcount
+    cursor.execute("DELETE FROM tokens_revogados WHERE expira_em < (NOW() AT TIME ZONE 'America/Sao_Paulo')")
+    removidos += cursor.rowcount
+    conn.commit()
+    cursor.close()
+    conn.close()
+    if removidos:
+        logger.info("🧹 Tokens expirados removidos: %d", removidos)
+    return removidos
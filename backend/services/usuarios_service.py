@@ -1,5 +1,7 @@
 import logging
-import psycopg2
+from backend.services.db_init import conectar_bd
+from backend.services.autorizacao_service import invalidar_cache_usuario
+from backend.services.token_service import revogar_tokens_telefone
 import os
 from dotenv import load_dotenv
 
@@ -8,7 +10,7 @@ logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 def listar_usuarios_autorizados():
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = conectar_bd()
     cursor = conn.cursor()
     cursor.execute("SELECT nome, telefone, data_inclusao FROM usuarios WHERE autorizado = TRUE ORDER BY data_inclusao DESC")
     resultados = cursor.fetchall()
@@ -18,13 +20,17 @@ def listar_usuarios_autorizados():
     return resultados
 
 def revogar_autorizacao(telefone: str) -> bool:
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = conectar_bd()
     cursor = conn.cursor()
     cursor.execute("UPDATE usuarios SET autorizado = FALSE WHERE telefone = %s", (telefone,))
     sucesso = cursor.rowcount > 0
+    if sucesso:
+        # Links do dashboard já enviados deixam de valer
+        revogar_tokens_telefone(telefone, cursor)
     conn.commit()
     cursor.close()
     conn.close()
+    invalidar_cache_usuario(telefone)
     return sucesso
 
 # async def exibir_menu_ajuda(telefone: str):
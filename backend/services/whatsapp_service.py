@@ -55,11 +55,13 @@ async def baixar_midia(url: str, caminho_destino: str):
     }
 
     try:
+        # Em fluxo: extratos grandes não passam inteiros pela memória
         async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            with open(caminho_destino, "wb") as f:
-                f.write(response.content)
+            async with client.stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                with open(caminho_destino, "wb") as f:
+                    async for bloco in response.aiter_bytes():
+                        f.write(bloco)
         logger.info(f"✅ Mídia salva em {caminho_destino}")
     except Exception as e:
         logger.exception(f"❌ Erro ao baixar a mídia da URL {url}:")
@@ -0,0 +1,78 @@
+import com.google.zxing.BinaryBitmap;
+import com.google.zxing.DecodeHintType;
+import com.google.zxing.MultiFormatReader;
+import com.google.zxing.NotFoundException;
+import com.google.zxing.Result;
+import com.google.zxing.client.j2se.BufferedImageLuminanceSource;
+import com.google.zxing.common.HybridBinarizer;
+
+import javax.imageio.ImageIO;
+import java.awt.image.BufferedImage;
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.DataInputStream;
+import java.io.EOFException;
+import java.io.IOException;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.Base64;
+import java.util.EnumMap;
+import java.util.Map;
+
+/**
+ * Decodificador ZXing de vida longa usado por backend/services/zxing_service.py.
+ *
+ * Entrada (stdin): tamanho da imagem em 4 bytes big-endian seguido dos bytes da imagem
+ * (PNG, JPEG...); tamanho 0 é um ping. Saída (stdout): uma linha por pedido:
+ *   OK<TAB>formato<TAB>texto em base64 | NADA | ERRO<TAB>motivo | PONG
+ *
+ *   java -cp javase-...-jar-with-dependencies.jar ServidorZXing.java
+ */
+public class ServidorZXing {
+
+    public static void main(String[] args) throws IOException {
+        DataInputStream entrada = new DataInputStream(new BufferedInputStream(System.in));
+        PrintStream saida = new PrintStream(new BufferedOutputStream(System.out), false, "UTF-8");
+        Map<DecodeHintType, Object> dicas = new EnumMap<>(DecodeHintType.class);
+        dicas.put(DecodeHintType.TRY_HARDER, Boolean.TRUE);
+        MultiFormatReader leitor = new MultiFormatReader();
+        leitor.setHints(dicas);
+
+        while (true) {
+            int tamanho;
+            try {
+                tamanho = entrada.readInt();
+            } catch (EOFException e) {
+                return;
+            }
+            if (tamanho == 0) {
+                saida.println("PONG");
+            } else {
+                byte[] imagem = new byte[tamanho];
+                entrada.readFully(imagem);
+                saida.println(decodificar(leitor, imagem));
+            }
+            saida.flush();
+        }
+    }
+
+    static String decodificar(MultiFormatReader leitor, byte[] bytes) {
+        try {
+            BufferedImage imagem = ImageIO.read(new ByteArrayInputStream(bytes));
+            if (imagem == null) {
+                return "ERRO\timagem inválida";
+            }
+            BinaryBitmap bitmap = new BinaryBitmap(new HybridBinarizer(new BufferedImageLuminanceSource(imagem)));
+            Result resultado = leitor.decodeWithState(bitmap);
+            String texto = Base64.getEncoder().encodeToString(resultado.getText().getBytes(StandardCharsets.UTF_8));
+            return "OK\t" + resultado.getBarcodeFormat() + "\t" + texto;
+        } catch (NotFoundException e) {
+            return "NADA";
+        } catch (Exception e) {
+            return "ERRO\t" + e.getClass().getSimpleName();
+        } finally {
+            leitor.reset();
+        }
+    }
+}
@@ -0,0 +1,172 @@
+"""
+Processos ZXing de vida longa. Cada um é uma JVM rodando zxing/ServidorZXing.java
+com o jar do pyzxing no classpath; as imagens vão em bytes pelo stdin e a resposta
+volta numa linha, então a partida da JVM acontece uma vez por processo e não a cada
+imagem. Um processo que morre, demora além do timeout ou responde fora do protocolo
+é descartado e substituído no próximo uso.
+"""
+import base64
+import logging
+import os
+import queue
+import select
+import struct
+import subprocess
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+FONTE_SERVIDOR = os.path.join(os.path.dirname(__file__), "zxing", "ServidorZXing.java")
+# Jar do ZXing (javase com dependências); vazio usa o que o pyzxing baixou
+ZXING_JAR = os.getenv("ZXING_JAR", "")
+ZXING_PROCESSOS = int(os.getenv("ZXING_PROCESSOS", "1"))
+ZXING_TIMEOUT = float(os.getenv("ZXING_TIMEOUT", "10"))
+# A primeira chamada espera a JVM subir e compilar o servidor
+ZXING_TIMEOUT_PARTIDA = float(os.getenv("ZXING_TIMEOUT_PARTIDA", "30"))
+
+
+def caminho_jar() -> str:
+    if ZXING_JAR:
+        return ZXING_JAR
+    from pyzxing import BarCodeReader
+    return BarCodeReader().lib_path
+
+
+class ProcessoZXing:
+    """Uma JVM atendendo um pedido por vez pelo stdin/stdout."""
+
+    def __init__(self, jar: str):
+        self.jar = jar
+        self._processo = None
+        self._buffer = b""
+        self._respondeu = False
+
+    def _iniciar(self):
+        self._processo = subprocess.Popen(
+            ["java", "-cp", self.jar, FONTE_SERVIDOR],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self._buffer = b""
+        self._respondeu = False
+        logger.info("☕ Processo ZXing iniciado (pid %s)", self._processo.pid)
+
+    def vivo(self) -> bool:
+        return self._processo is not None and self._processo.poll() is None
+
+    def encerrar(self):
+        if self._processo is None:
+            return
+        processo, self._processo = self._processo, None
+        try:
+            processo.stdin.close()
+            processo.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            processo.kill()
+            processo.wait()
+
+    def _ler_linha(self, timeout: float) -> str:
+        limite = time.monotonic() + timeout
+        descritor = self._processo.stdout.fileno()
+        while b"\n" not in self._buffer:
+            restante = limite - time.monotonic()
+            if restante <= 0 or not select.select([descritor], [], [], restante)[0]:
+                raise TimeoutError(f"ZXing não respondeu em {timeout:.0f}s")
+            bloco = os.read(descritor, 65536)
+            if not bloco:
+                raise ConnectionError("processo ZXing encerrou")
+            self._buffer += bloco
+        linha, self._buffer = self._buffer.split(b"\n", 1)
+        return linha.decode("utf-8").rstrip("\r")
+
+    def chamar(self, imagem: bytes) -> str:
+        """Envia a imagem (b"" = ping) e devolve a linha de resposta; sobe a JVM se preciso."""
+        if not self.vivo():
+            self._iniciar()
+        self._processo.stdin.write(struct.pack(">i", len(imagem)) + imagem)
+        self._processo.stdin.flush()
+        linha = self._ler_linha(ZXING_TIMEOUT if self._respondeu else ZXING_TIMEOUT_PARTIDA)
+        self._respondeu = True
+        return linha
+
+
+class DecodificadorZXing:
+    """
+    Fila de ProcessoZXing compartilhada entre threads: cada chamada pega um processo
+    livre (ou espera por um) e o devolve ao terminar. Falhas descartam o processo e a
+    chamada é repetida uma vez num processo novo.
+    """
+
+    def __init__(self, processos: int = ZXING_PROCESSOS):
+        self.processos = max(1, processos)
+        self._livres = None
+        self._lock = threading.Lock()
+        self._metricas = {"chamadas": 0, "lidas": 0, "falhas": 0, "reinicios": 0}
+
+    def _fila(self) -> queue.Queue:
+        with self._lock:
+            if self._livres is None:
+                jar = caminho_jar()
+                self._livres = queue.Queue()
+                for _ in range(self.processos):
+                    self._livres.put(ProcessoZXing(jar))
+            return self._livres
+
+    def _chamar(self, imagem: bytes) -> str:
+        """Linha de resposta de um processo; qualquer falha de protocolo sai como ConnectionError."""
+        fila = self._fila()
+        processo = fila.get()
+        try:
+            for tentativa in (1, 2):
+                try:
+                    return processo.chamar(imagem)
+                except (OSError, TimeoutError, ConnectionError, UnicodeDecodeError) as e:
+                    logger.warning("⚠️ Processo ZXing com problema (%s); reiniciando", e)
+                    processo.encerrar()
+                    self._metricas["reinicios"] += 1
+                    if tentativa == 2:
+                        self._metricas["falhas"] += 1
+                        if isinstance(e, UnicodeDecodeError):
+                            raise ConnectionError(f"Resposta ilegível do ZXing: {e}") from e
+                        raise
+        finally:
+            fila.put(processo)
+
+    def decodificar(self, imagem: bytes):
+        """(texto, formato) do código na imagem codificada (PNG, JPEG...), ou None."""
+        self._metricas["chamadas"] += 1
+        resposta = self._chamar(imagem)
+        if resposta.startswith("OK\t"):
+            try:
+                _, formato, texto = resposta.split("\t", 2)
+                dados = base64.b64decode(texto, validate=True).decode("utf-8", errors="ignore")
+            except ValueError as e:
+                raise ConnectionError(f"Resposta inesperada do ZXing: {resposta[:80]}") from e
+            self._metricas["lidas"] += 1
+            return dados, formato
+        if resposta.startswith("ERRO"):
+            logger.warning("⚠️ ZXing recusou a imagem: %s", resposta)
+        elif resposta != "NADA":
+            raise ConnectionError(f"Resposta inesperada do ZXing: {resposta[:80]}")
+        return None
+
+    def verificar(self) -> bool:
+        """Ping em um processo (sobe a JVM se ainda não estiver de pé)."""
+        try:
+            return self._chamar(b"") == "PONG"
+        except (OSError, TimeoutError, ConnectionError, ValueError):
+            return False
+
+    def encerrar(self):
+        with self._lock:
+            livres, self._livres = self._livres, None
+        while livres is not None and not livres.empty():
+            livres.get_nowait().encerrar()
+
+    def status(self) -> dict:
+        return {"processos": self.processos, "iniciado": self._livres is not None, **self._metricas}
+
+
+decodificador_zxing = DecodificadorZXing()
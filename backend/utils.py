@@ -1,64 +1,149 @@
 import os
-import psycopg2
-from backend.services.db_init import conectar_bd
+import logging
+import threading
+from collections import OrderedDict
+from psycopg2.extras import execute_values
+from backend.services.db_init import conectar_bd, garantir_particoes_mensagens, hoje_mensagens, MENSAGENS_RETENCAO_DIAS
+from backend.services.autorizacao_service import obter_usuario
 import pytz
-from datetime import datetime
+from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Quantos mensagem_id recentes ficam em memória para barrar reenvios da Meta sem ir ao banco
+DEDUPE_CACHE_MAX = int(os.getenv("DEDUPE_CACHE_MAX", "5000"))
 fuso_brasilia = pytz.timezone("America/Sao_Paulo")
 
 def obter_schema_por_telefone(telefone):
     """
-    Consulta a tabela 'usuarios' e retorna o nome do schema com base no telefone.
+    Retorna o nome do schema do telefone autorizado (None se não autorizado).
+    Usa o cache de usuários, então não consulta o banco a cada mensagem. Num cache miss
+    pega uma conexão do pool: chame antes de conectar_bd(), nunca com outra aberta.
     """
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    cursor.execute("SELECT schema_user FROM usuarios WHERE telefone = %s AND autorizado = true", (telefone,))
-    resultado = cursor.fetchone()
-    nome = resultado[0]
-    cursor.close()
-    conn.close()
-    
-    return nome
+    return obter_usuario(telefone)[1]
+
+class IdsRecentes:
+    """LRU limitado dos mensagem_id vistos recentemente neste processo."""
+
+    def __init__(self, tamanho_max: int):
+        self.tamanho_max = max(1, tamanho_max)
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+
+    def contem(self, mensagem_id: str) -> bool:
+        with self._lock:
+            if mensagem_id in self._ids:
+                self._ids.move_to_end(mensagem_id)
+                self.acertos += 1
+                return True
+            return False
+
+    def adicionar(self, *mensagem_ids: str):
+        with self._lock:
+            for mensagem_id in mensagem_ids:
+                self._ids[mensagem_id] = None
+                self._ids.move_to_end(mensagem_id)
+            while len(self._ids) > self.tamanho_max:
+                self._ids.popitem(last=False)
+
+    def remover(self, *mensagem_ids: str):
+        with self._lock:
+            for mensagem_id in mensagem_ids:
+                self._ids.pop(mensagem_id, None)
+
+    def status(self) -> dict:
+        return {"entradas": len(self._ids), "tamanho_max": self.tamanho_max, "acertos": self.acertos}
+
+ids_recentes = IdsRecentes(DEDUPE_CACHE_MAX)
+
+_particoes_garantidas = set()
+
+def data_da_mensagem(mensagem_obj: dict):
+    """Dia (horário de Brasília) do timestamp da mensagem no WhatsApp: chave de partição da deduplicação."""
+    timestamp = mensagem_obj.get("timestamp")
+    if timestamp is None:
+        return datetime.now(fuso_brasilia).date()
+    return datetime.fromtimestamp(int(timestamp), fuso_brasilia).date()
 
-def mensagem_ja_processada(mensagem_id: str) -> bool:
+def registrar_mensagens_novas(mensagens: list) -> list:
+    """
+    Deduplica um lote de mensagens do webhook e devolve apenas as novas, na ordem original.
+    Repetidas dentro do lote e ids vistos recentemente por este processo são descartados
+    sem ir ao banco; o resto vai num único INSERT ... ON CONFLICT DO NOTHING RETURNING,
+    que registra e informa quais ids eram novos de forma atômica.
+    """
+    hoje = hoje_mensagens()
+    limite_retencao = hoje - timedelta(days=MENSAGENS_RETENCAO_DIAS)
+    vistas = set()
+    candidatas = []
+    for mensagem_obj in mensagens:
+        mensagem_id = mensagem_obj["id"]
+        if mensagem_id in vistas or ids_recentes.contem(mensagem_id):
+            continue
+        vistas.add(mensagem_id)
+        dia = data_da_mensagem(mensagem_obj)
+        if dia < limite_retencao:
+            # A partição desse dia já foi descartada; um reenvio tão antigo é tratado como duplicado
+            logger.warning("⚠️ Mensagem %s de %s está fora da janela de retenção, ignorada", mensagem_id, dia)
+            continue
+        candidatas.append((mensagem_obj, dia))
+    if not candidatas:
+        return []
+
+    agora = datetime.now(fuso_brasilia)
     conn = conectar_bd()
     cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM mensagens_recebidas WHERE mensagem_id = %s", (mensagem_id,))
-    existe = cursor.fetchone() is not None
+    # Partições de hoje em diante são criadas pelo job diário; outras datas (ex.: mensagem de
+    # ontem chegando depois da meia-noite) são garantidas uma vez por processo
+    garantidas = {dia for _, dia in candidatas if dia not in _particoes_garantidas}
+    for dia in garantidas:
+        if dia < hoje or dia > hoje + timedelta(days=1):
+            garantir_particoes_mensagens(cursor, dia, dia)
+    inseridas = execute_values(cursor, """
+        INSERT INTO mensagens_recebidas (mensagem_id, telefone, tipo, data_mensagem, data_processamento)
+        VALUES %s
+        ON CONFLICT (mensagem_id, data_mensagem) DO NOTHING
+        RETURNING mensagem_id
+    """, [(m["id"], m["from"], m.get("type"), dia, agora) for m, dia in candidatas], fetch=True)
+    conn.commit()
     cursor.close()
     conn.close()
-    return existe
+    # Só depois do commit: num rollback a partição não existiria
+    _particoes_garantidas.update(garantidas)
 
-def registrar_mensagem_recebida(mensagem_id: str, telefone: str = "", tipo: str = "texto"):
-    agora = datetime.now(fuso_brasilia)
+    ids_recentes.adicionar(*vistas)
+    ids_novos = {linha[0] for linha in inseridas}
+    return [m for m, _ in candidatas if m["id"] in ids_novos]
+
+def registrar_mensagem_se_nova(mensagem_id: str, telefone: str = "", tipo: str = "texto", timestamp: int = None) -> bool:
+    """Registra a mensagem e retorna True se ela ainda não tinha sido recebida."""
+    mensagem_obj = {"id": mensagem_id, "from": telefone, "type": tipo}
+    if timestamp is not None:
+        mensagem_obj["timestamp"] = timestamp
+    return bool(registrar_mensagens_novas([mensagem_obj]))
+
+def esquecer_mensagem_recebida(*mensagens: dict):
+    """Remove o registro de mensagens (objetos do webhook) que não chegaram a ser processadas."""
+    mensagem_ids = [m["id"] for m in mensagens]
+    dias = sorted({data_da_mensagem(m) for m in mensagens})
+    ids_recentes.remover(*mensagem_ids)
     conn = conectar_bd()
     cursor = conn.cursor()
+    # O filtro por data deixa o planner olhar só as partições desses dias
     cursor.execute("""
-        INSERT INTO mensagens_recebidas (mensagem_id, telefone, tipo, data_processamento)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT DO NOTHING
-    """, (mensagem_id, telefone, tipo, agora))
+        DELETE FROM mensagens_recebidas
+        WHERE mensagem_id = ANY(%s) AND data_mensagem = ANY(%s::date[])
+    """, (mensagem_ids, dias))
     conn.commit()
     cursor.close()
     conn.close()
 
 def salvar_localizacao_usuario(telefone, latitude, longitude):
     """Salva a localização atual do usuário para uso posterior"""
+    schema = obter_schema_por_telefone(telefone)
     conn = conectar_bd()
     cursor = conn.cursor()
-    schema = obter_schema_por_telefone(telefone)
-    
-    # Cria tabela se não existir
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {schema}.localizacoes_usuario (
-            id SERIAL PRIMARY KEY,
-            telefone TEXT,
-            latitude FLOAT,
-            longitude FLOAT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
     
     # Insere nova localização
     cursor.execute(f"""
@@ -72,9 +157,9 @@ def salvar_localizacao_usuario(telefone, latitude, longitude):
     
 def obter_ultima_localizacao(telefone):
     """Obtém a localização mais recente do usuário"""
+    schema = obter_schema_por_telefone(telefone)
     conn = conectar_bd()
     cursor = conn.cursor()
-    schema = obter_schema_por_telefone(telefone)
     
     cursor.execute(f"""
         SELECT latitude, longitude, timestamp FROM {schema}.localizacoes_usuario
@@ -0,0 +1,54 @@
+from backend.services import importacao_service
+
+OFX = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+{transacoes}
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+TRANSACAO = "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>202401{dia:02d}<TRNAMT>-{valor}.50<MEMO>COMPRA {dia}</STMTTRN>"
+
+
+class CursorFalso:
+    def execute(self, sql, parametros=None):
+        pass
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class ConexaoFalsa:
+    def cursor(self):
+        return CursorFalso()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_ofx_maior_que_o_lote_importa_cada_transacao_uma_vez(tmp_path, monkeypatch):
+    arquivo = tmp_path / "extrato.ofx"
+    arquivo.write_text(OFX.format(transacoes="\n".join(TRANSACAO.format(dia=dia, valor=dia) for dia in range(1, 8))))
+    gravados = []
+
+    def gravar_lote(cursor, schema, destino, lancamentos):
+        gravados.extend(lancamentos)
+        # Com o leitor recomeçando a cada lote, o mesmo lote voltaria para sempre
+        assert len(gravados) <= 7
+
+    monkeypatch.setattr(importacao_service, "conectar_bd", ConexaoFalsa)
+    monkeypatch.setattr(importacao_service, "_gravar_lote", gravar_lote)
+
+    resultado = importacao_service.importar_extrato(str(arquivo), "teste", tamanho_lote=3)
+
+    assert resultado["destino"] == "gastos"
+    assert resultado["lidas"] == 7
+    assert resultado["importadas"] == 7
+    assert [l.descricao for l in gravados] == [f"COMPRA {dia}" for dia in range(1, 8)]
@@ -0,0 +1,26 @@
+from backend.services.roteador_service import ContextoMensagem, Regra, RoteadorComandos
+
+
+async def _handler(ctx):
+    return None
+
+
+def _contexto(mensagem: str) -> ContextoMensagem:
+    return ContextoMensagem(telefone="5511999999999", mensagem=mensagem, schema="teste", inicio=0.0, timestamp_whatsapp=0)
+
+
+def _roteador(condicao) -> RoteadorComandos:
+    comandos = [{"comando": "modelo", "handler": _handler, "exatos": ["modelo"], "condicao": condicao}]
+    return RoteadorComandos(
+        comandos,
+        fallback=Regra("registrar gasto", _handler, lambda ctx: True),
+        desconhecido=Regra("desconhecido", _handler),
+    )
+
+
+def test_exato_com_condicao_verdadeira_usa_o_comando():
+    assert _roteador(lambda ctx: True).resolver(_contexto("modelo")).nome == "modelo"
+
+
+def test_exato_com_condicao_falsa_segue_para_as_proximas_regras():
+    assert _roteador(lambda ctx: False).resolver(_contexto("Modelo")).nome == "registrar gasto"